@@ -1,4 +1,4 @@
-#!/usr/bin/env python2
+#!/usr/bin/env python3
 DESCRIPTION = """
 	
 	Performs GO term annotation from BLAST output file (-outfmt 6) using only first hit which has GO terms associated with it.
@@ -20,15 +20,17 @@ DESCRIPTION = """
 import sys
 import os
 import argparse
-import gzip
 import sqlite3
 import logging
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'Python'))
+from src.files import File
+from src.blast import blast_iter, blast_to_dict, BlastFormatError
 
 # Main
 def main():
 	parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter, description=DESCRIPTION)
-	parser.add_argument('-b', '--blast', type=lambda x: __parse_file_check_compression(x, 'r'), required=True, help='Blast [gzip] output file (outfmt 6)')
-	parser.add_argument('-o', '--out', type=lambda x: __parse_file_check_compression(x, 'w'), required=True, help='Output [gzip] annotation file (topGO format)')
+	parser.add_argument('-b', '--blast', type=lambda x: File(x, 'r'), required=True, help='Blast [gzip/bgzip/zstd] output file (outfmt 6)')
+	parser.add_argument('-o', '--out', type=lambda x: File(x, 'w'), required=True, help='Output [gzip/bgzip/zstd] annotation file (topGO format)')
 	parser.add_argument('-d', '--db', type=str, required=True, help='SQLite3 GOterm database')
 	parser.add_argument('-m', '--mmseq2', action='store_true', required=False, help='Input is from MMSEQ2 (default: %(default)s)')
 	parser.add_argument('--debug', action='store_true', required=False, help='Print DEBUG info (default: %(default)s)')
@@ -44,99 +46,48 @@ def main():
 	
 	goa_db = SQLite3_Database(args.db)
 	
-	# Import just the 2n column from the blast file (subject). 
+	# Import just the subject id of each hit from the blast file. 
 	# All that is needed since the dict key gives us the query name.
-	blast_dict = BLAST_to_dict(args.blast, key_col=1, ret_cols=[2])
-	args.blast.close()
-	#print blast_dict
+	with args.blast as blast_fh:
+		try:
+			blast_dict = blast_to_dict(blast_iter(blast_fh), 'qseqid', value='sseqid')
+		except BlastFormatError as e:
+			logging.error('%s', e)
+			sys.exit(1)
 	
-	for key, hits in blast_dict.items():
-		logging.debug('%s', '') ## DEBUG
-		logging.debug('%s - Finding GO terms from:', key) ## DEBUG
-		logging.debug('%s', hits) ## DEBUG
-		
-		# For each hit in list of hits
-		for hit in hits:
-			logging.debug('%s - Searching for GO terms with %s', key, hit) ## DEBUG
-			hit = hit[0] # Get subject id from hit list
+	with args.out as out_fh:
+		for key, hits in blast_dict.items():
+			logging.debug('%s', '') ## DEBUG
+			logging.debug('%s - Finding GO terms from:', key) ## DEBUG
+			logging.debug('%s', hits) ## DEBUG
 			
-			if args.mmseq2:
-				hit_id = hit
-			else:
-				id_split = hit.split('|')
-				# Check line split correctly.
-				if len(id_split) != 3:
-					print "UniProt id split incorrectly: %s" % hit
-					continue
-				hit_id = id_split[1]
-			
-			# Try and get GO terms
-			goa_out = goa_db.submit_command('SELECT go_id FROM GOterm_mappings WHERE id=?', (hit_id, ))
-			goa_out_set = set([x[0] for x in goa_out]) # Remove duplicate GO terms (Happens in a very small number of cases [because of the goa file])
-			
-			# If we actually got some GO terms
-			if len(goa_out_set) > 0:
-				logging.debug('GO terms found: %s', ', '.join(goa_out_set)) ## DEBUG
-				 
-				# If output to be in WEGO format (single line)
-				args.out.write(key + '\t' + ', '.join(goa_out_set) + '\n')
+			# For each hit in list of hits
+			for hit in hits:
+				logging.debug('%s - Searching for GO terms with %s', key, hit) ## DEBUG
 				
-				# Break loop if hits
-				break
-	
-	args.out.close()
-
-
-
-def BLAST_to_dict(blast_fh, key_col=1, ret_cols=range(1, 12)):
-        """
-        Takes BLAST filehandle and imports it into a dict with the key as whatever the user wishes.
-        
-        Version: 0.2
-        Last Modified: 28/05/2019
-        
-        Arguments:
-                blast_fh:       File handle with BLAST output "-outfmt 6".
-                key_col:        Column to make DICT key. 1-based. Must be >0.
-                ret_cols:       Columns to retain in output. As LIST, 1-based. Must be >0.
-        
-        Returns:
-                blast_dict:     Dict of BLAST hits imported in appropriate format. 
-        
-        Note:   - Ignores blank lines.
-                - Does not transform columns (will not convert str to int e.g. for start/stop/etc.)
-
-        """
-
-        # Check that ret_cols is within bounds.
-        if not (min(ret_cols) > 0):
-                print "ret_cols out of bounds!"
-                sys.exit()
-
-        # Check that key_col is within bounds.
-        if not (key_col > 0):
-                print "key_col out of bounds!"
-                sys.exit()
-
-        # Import BLAST file.
-        blast_dict = {}
-        for line in blast_fh:
-		line = line.strip()
-                # Ignore blank lines.
-                if not line:
-                        continue
-		
-                blast_hit_split = line.split("\t")
-		
-                # Get key value and add key to dict if not present. 
-                key_col_value = blast_hit_split[key_col-1] # Get key value (convert to 0-based)
-                if key_col_value not in blast_dict.keys():
-                        blast_dict[key_col_value] = []
-
-                # Converts ret_cols into 0-base
-                blast_dict[key_col_value].append([blast_hit_split[i-1] for i in ret_cols])
-
-        return blast_dict
+				if args.mmseq2:
+					hit_id = hit
+				else:
+					id_split = hit.split('|')
+					# Check line split correctly.
+					if len(id_split) != 3:
+						logging.warning("UniProt id split incorrectly: %s", hit) ## WARNING
+						continue
+					hit_id = id_split[1]
+				
+				# Try and get GO terms
+				goa_out = goa_db.submit_command('SELECT go_id FROM GOterm_mappings WHERE id=?', (hit_id, ))
+				goa_out_set = set([x[0] for x in goa_out]) # Remove duplicate GO terms (Happens in a very small number of cases [because of the goa file])
+				
+				# If we actually got some GO terms
+				if len(goa_out_set) > 0:
+					logging.debug('GO terms found: %s', ', '.join(goa_out_set)) ## DEBUG
+					 
+					# If output to be in WEGO format (single line)
+					out_fh.write(key + '\t' + ', '.join(goa_out_set) + '\n')
+					
+					# Break loop if hits
+					break
 
 
 
@@ -159,24 +110,5 @@ class SQLite3_Database():
 
 
 
-def __parse_file_check_compression(fh, mode='r'):
-	'''
-	Open stdin/normal/gzip files - check file exists (if mode='r') and open using appropriate function.
-	'''
-	# Check file exists if mode='r'
-	if not os.path.exists(fh) and mode == 'r':
-		raise argparse.ArgumentTypeError("The file %s does not exist!" % fh)
-	
-	## open with gzip if it has the *.gz extension, else open normally (including stdin)
-	try:
-		if fh.endswith(".gz"):
-			return gzip.open(fh, mode+'b')
-		else:
-			return open(fh, mode)
-	except IOError as e:
-		raise argparse.ArgumentTypeError('%s' % e)
-
-
-
 if __name__ == '__main__':
 	main()
@@ -1,4 +1,4 @@
-#!/usr/bin/env python2
+#!/usr/bin/env python3
 DESCRIPTION = """
 	
 	Performs GO term annotation from BLAST output file (-outfmt 6) using only first hit which has GO terms associated with it.
@@ -20,15 +20,17 @@ DESCRIPTION = """
 import sys
 import os
 import argparse
-import gzip
 import sqlite3
 import logging
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'Python'))
+from src.files import File
+from src.blast import blast_iter, BlastFormatError
 
 # Main
 def main():
 	parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter, description=DESCRIPTION)
-	parser.add_argument('-b', '--blast', type=lambda x: __parse_file_check_compression(x, 'r'), required=True, help='Blast [gzip] output file (outfmt 6)')
-	parser.add_argument('-o', '--out', type=lambda x: __parse_file_check_compression(x, 'w'), required=True, help='Output [gzip] annotation file (topGO format)')
+	parser.add_argument('-b', '--blast', type=lambda x: File(x, 'r'), required=True, help='Blast [gzip/bgzip/zstd] output file (outfmt 6)')
+	parser.add_argument('-o', '--out', type=lambda x: File(x, 'w'), required=True, help='Output [gzip/bgzip/zstd] annotation file (topGO format)')
 	parser.add_argument('-d', '--db', type=str, required=True, help='SQLite3 GOterm database')
 	parser.add_argument('-m', '--mmseq2', action='store_true', required=False, help='Input is from MMSEQ2 (default: %(default)s)')
 	parser.add_argument('--debug', action='store_true', required=False, help='Print DEBUG info (default: %(default)s)')
@@ -44,51 +46,48 @@ def main():
 	
 	goa_db = SQLite3_Database(args.db)
 	
-	qseqid_with_hits = []
+	qseqid_with_hits = set()
 	
 	# Read BLAST file 
-	for line in args.blast:
-		line = line.strip()
-		if not line or line.startswith('#'):
-			continue
-		
-		line_split = line.split()
-		qseqid = line_split[0]
-		sseqid = line_split[1]
-		
-		# Test if we already have GO term annotations for this qseqid
-		if qseqid in qseqid_with_hits:
-			continue
-		
-		logging.debug('%s', '') ## DEBUG
-		logging.debug('%s - Searching for GO terms using: %s - %s', qseqid, sseqid) ## DEBUG
-		
-		if args.mmseq2:
-			hit_id = sseqid
-		else:
-			sseqid_split = sseqid.split('|')
-			# Check line split correctly.
-			if len(sseqid_split) != 3:
-				print "UniProt id split incorrectly: %s" % sseqid
-				continue
-			hit_id = sseqid_split[1]
-		
-		# Try and get GO terms
-		goa_out = goa_db.submit_command('SELECT go_id FROM GOterm_mappings WHERE id=?', (hit_id, ))
-		goa_out_set = set([x[0] for x in goa_out]) # Remove duplicate GO terms (Happens in a very small number of cases [because of the goa file])
-		
-		# If we actually got some GO terms
-		if len(goa_out_set) > 0:
-			logging.debug('GO terms found: %s', ', '.join(goa_out_set)) ## DEBUG
-			
-			# If output to be in WEGO format (single line)
-			args.out.write(qseqid + '\t' + ', '.join(goa_out_set) + '\n')
-			
-			# GO term annotations found for qseqid. Add to list of annotated IDs.
-			qseqid_with_hits.append(qseqid)
-	
-	args.blast.close()
-	args.out.close()
+	with args.blast as blast_fh, args.out as out_fh:
+		try:
+			for hit in blast_iter(blast_fh):
+				qseqid = hit.qseqid
+				sseqid = hit.sseqid
+				
+				# Test if we already have GO term annotations for this qseqid
+				if qseqid in qseqid_with_hits:
+					continue
+				
+				logging.debug('%s', '') ## DEBUG
+				logging.debug('%s - Searching for GO terms using: %s', qseqid, sseqid) ## DEBUG
+				
+				if args.mmseq2:
+					hit_id = sseqid
+				else:
+					sseqid_split = sseqid.split('|')
+					# Check line split correctly.
+					if len(sseqid_split) != 3:
+						logging.warning("UniProt id split incorrectly: %s", sseqid) ## WARNING
+						continue
+					hit_id = sseqid_split[1]
+				
+				# Try and get GO terms
+				goa_out = goa_db.submit_command('SELECT go_id FROM GOterm_mappings WHERE id=?', (hit_id, ))
+				goa_out_set = set([x[0] for x in goa_out]) # Remove duplicate GO terms (Happens in a very small number of cases [because of the goa file])
+				
+				# If we actually got some GO terms
+				if len(goa_out_set) > 0:
+					logging.debug('GO terms found: %s', ', '.join(goa_out_set)) ## DEBUG
+					
+					# If output to be in WEGO format (single line)
+					out_fh.write(qseqid + '\t' + ', '.join(goa_out_set) + '\n')
+					
+					# GO term annotations found for qseqid. Add to set of annotated IDs.
+					qseqid_with_hits.add(qseqid)
+		except BlastFormatError as e:
+			logging.error('%s', e)
+			sys.exit(1)
 	
 
 
@@ -112,24 +111,5 @@ class SQLite3_Database():
 
 
 
-def __parse_file_check_compression(fh, mode='r'):
-	'''
-	Open stdin/normal/gzip files - check file exists (if mode='r') and open using appropriate function.
-	'''
-	# Check file exists if mode='r'
-	if not os.path.exists(fh) and mode == 'r':
-		raise argparse.ArgumentTypeError("The file %s does not exist!" % fh)
-	
-	## open with gzip if it has the *.gz extension, else open normally (including stdin)
-	try:
-		if fh.endswith(".gz"):
-			return gzip.open(fh, mode+'b')
-		else:
-			return open(fh, mode)
-	except IOError as e:
-		raise argparse.ArgumentTypeError('%s' % e)
-
-
-
 if __name__ == '__main__':
 	main()
@@ -4,6 +4,9 @@
 	
 	These functions are designed to be cut and pasted into other scripts and used for whatever purpose. 
 	
+	The scripts in this repo use the shared (python3) parser in Python/src/blast.py instead
+	(blast_iter(), blast_groups(), blast_to_dict(); typed columns and custom -outfmt columns).
+	
 """
 import sys
 
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+DESCRIPTION = '''
+benchmark_blast_hit_coverage - Benchmark the engines of blast_hit_coverage.py on synthetic blast output.
+
+Generates a synthetic blast file (-outfmt "6 std qlen slen"; grouped by query) for each -r/--rows
+size and runs each engine on it, recording the wall time, throughput (rows/sec) and peak RSS
+of each run (one JSON object per line; src.benchmark records, as Table/benchmark/benchmark_tables.py).
+
+Synthetic data (per --rows size):
+	- --subjects subjects per query and --hsps HSPs per subject (~half on the reverse strand
+	   of the subject); HSPs are random intervals of the query/subject so they can overlap.
+
+e.g. benchmark_blast_hit_coverage.py -r 100000 1000000 -o results.jsonl
+
+NOTE:
+	- Scripts are run with the python running this script.
+	- The numpy engines need numpy (they fail and are reported with a non-zero returncode otherwise).
+	- Peak RSS is the max resident set size of the script process (os.wait4).
+'''
+import os
+import sys
+import random
+import shutil
+import argparse
+import logging
+import tempfile
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'Python'))
+from src.benchmark import run_command, benchmark_result, write_result
+
+BLAST_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..')
+
+## engine: extra arguments for blast_hit_coverage.py
+ENGINES = {
+	'python': [],
+	'python_merged': ['--merged'],
+	'numpy': ['--numpy'],
+	'numpy_merged': ['--numpy', '--merged'],
+}
+
+
+## Pass arguments.
+def main():
+	# Pass command line arguments.
+	parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter, description=DESCRIPTION)
+	parser.add_argument('-o', '--output', metavar='results.jsonl', default=sys.stdout, type=argparse.FileType('w'), required=False, help='Output file of results (JSON lines) (default: stdout)')
+	parser.add_argument('-r', '--rows', default=[100000, 1000000], nargs='+', type=int, required=False, help='Number of rows of each file size (default: %(default)s)')
+	parser.add_argument('--subjects', default=5, type=int, required=False, help='Number of subjects per query (default: %(default)s)')
+	parser.add_argument('--hsps', default=3, type=int, required=False, help='Number of HSPs per subject (default: %(default)s)')
+	parser.add_argument('-q', '--query_cov', default=50.0, type=float, required=False, help='-q/--query_cov given to blast_hit_coverage.py (default: %(default)s)')
+	parser.add_argument('-s', '--subject_cov', default=50.0, type=float, required=False, help='-s/--subject_cov given to blast_hit_coverage.py (default: %(default)s)')
+	parser.add_argument('-e', '--engines', default=sorted(ENGINES.keys()), nargs='+', choices=sorted(ENGINES.keys()), required=False, help='Engines to benchmark (default: all)')
+	parser.add_argument('--repeats', default=1, type=int, required=False, help='Number of times to run each engine (fastest run is kept) (default: %(default)s)')
+	parser.add_argument('--seed', default=42, type=int, required=False, help='Random seed (default: %(default)s)')
+	parser.add_argument('--tmp_dir', default=None, type=str, required=False, help='Directory for synthetic files (default: system temp dir)')
+	parser.add_argument('--debug', action='store_true', required=False, help='Print DEBUG info (default: %(default)s)')
+	args = parser.parse_args()
+	
+	# Set up basic debugger
+	logFormat = "[%(levelname)s]: %(message)s"
+	logging.basicConfig(format=logFormat, stream=sys.stderr, level=logging.INFO)
+	if args.debug:
+		logging.getLogger().setLevel(logging.DEBUG)
+	
+	logging.debug('%s', args) ## DEBUG
+	
+	if min(args.rows) < 1 or args.subjects < 1 or args.hsps < 1 or args.repeats < 1:
+		parser.error('-r/--rows, --subjects, --hsps and --repeats must be > 0')
+	
+	for num_rows in sorted(args.rows):
+		data_dir = tempfile.mkdtemp(prefix='benchmark_blast_hit_coverage.', dir=args.tmp_dir)
+		try:
+			blast_file = os.path.join(data_dir, 'blast.outfmt6')
+			write_test_data(blast_file, num_rows, args.subjects, args.hsps, args.seed)
+			file_mb = os.path.getsize(blast_file) / 1024.0 / 1024.0
+			logging.info('Generated %s rows (%.1f MB)', num_rows, file_mb) ## INFO
+			for engine in args.engines:
+				cmd = [sys.executable, os.path.join(BLAST_DIR, 'blast_hit_coverage', 'blast_hit_coverage.py'),
+					'-i', blast_file, '-q', str(args.query_cov), '-s', str(args.subject_cov)] + ENGINES[engine]
+				runs = [run_command(cmd) for _ in range(args.repeats)]
+				result = benchmark_result('blast_hit_coverage', num_rows, file_mb, runs, engine=engine)
+				write_result(args.output, result)
+				logging.info('%-14s %8.2f s  %10.0f rows/sec  %8.1f MB peak RSS', engine, result['seconds'], result['rows_per_sec'], result['peak_rss_mb']) ## INFO
+		finally:
+			shutil.rmtree(data_dir)
+
+
+
+def write_test_data(blast_file, num_rows, num_subjects, num_hsps, seed=42):
+	'''
+	Write num_rows of synthetic blast output (-outfmt "6 std qlen slen") to blast_file.
+	'''
+	random.seed(seed)
+	rows = 0
+	query = 0
+	with open(blast_file, 'w') as out:
+		while rows < num_rows:
+			qlen = random.randint(100, 2000)
+			for subject in range(num_subjects):
+				slen = random.randint(100, 3000)
+				for hsp in range(num_hsps):
+					if rows == num_rows:
+						break
+					qstart, qend = sorted([random.randint(1, qlen), random.randint(1, qlen)])
+					sstart, send = sorted([random.randint(1, slen), random.randint(1, slen)])
+					if random.random() < 0.5:
+						sstart, send = send, sstart
+					length = qend - qstart + 1
+					out.write('query%s\tsubject%s\t%.2f\t%s\t%s\t0\t%s\t%s\t%s\t%s\t%.2e\t%.1f\t%s\t%s\n' % (query, subject,
+						random.uniform(30, 100), length, random.randrange(length), qstart, qend, sstart, send,
+						random.random() * 1e-5, random.uniform(20, 1000), qlen, slen))
+					rows += 1
+			query += 1
+
+
+
+if __name__ == '__main__':
+	main()
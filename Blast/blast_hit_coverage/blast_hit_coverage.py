@@ -1,4 +1,4 @@
-#!/usr/bin/env python2
+#!/usr/bin/env python3
 DESCRIPTION = '''
 blast_hit_coverage - Filters blast output, taking hits which cover > X% of the query and > Y% of the subject sequence.
 
@@ -7,56 +7,110 @@ NOTE:
 	- Expects tab delimted file.
 	- Expects custom blast outfmt:
 		-outfmt "6 qseqid sseqid pident length mismatch gapopen qstart qend sstart send evalue bitscore qlen slen"
+	   OR give the columns of the file with --outfmt (must include qstart qend sstart send qlen slen).
+
+Engines:
+	default - Each line is parsed and filtered in turn (pure python).
+	--numpy - Lines are read in blocks of ~--chunk_size characters (only whole query groups)
+	           which are parsed into NumPy columns; coverage is calculated and filtered for the
+	           whole block at once and the lines kept are written together. Needs numpy.
+	           Output is the same as the default engine.
+
+Merged coverage (--merged):
+	- Coverage is calculated from the union of the HSPs of each query-subject pair (overlapping
+	   HSPs are only counted once) instead of from each HSP; e.g. a subject hit by three
+	   non-overlapping HSPs that together cover 90% of the query passes -q 80. All HSPs of the
+	   pairs that pass are written (in input order).
+	- Expects hits of each query to be together (e.g. normal blast output). Each query group is
+	   read, its HSPs are sorted and merged per subject, and it is written before the next group
+	   is read (memory == largest query group; or largest --chunk_size block with --numpy).
 
 '''
 import sys
 import os
 import argparse
 import logging
-import gzip
-from itertools import groupby
+from operator import methodcaller
+try:
+	import numpy
+except ImportError:
+	numpy = None
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'Python'))
+from src.files import File
+from src.blast import blast_iter, blast_groups, blast_chunks, parse_outfmt, BlastFormatError, CHUNK_SIZE
+
+## Default columns of --blast_in.
+OUTFMT = '6 qseqid sseqid pident length mismatch gapopen qstart qend sstart send evalue bitscore qlen slen'
+
+## Columns needed to calculate coverage.
+REQUIRED_COLUMNS = ('qstart', 'qend', 'sstart', 'send', 'qlen', 'slen')
+
+## Columns that identify a query-subject pair (--merged).
+ID_COLUMNS = ('qseqid', 'sseqid')
 
 ## Pass arguments.
 def main():
 	# Pass command line arguments. 
 	parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter, description=DESCRIPTION)
-	parser.add_argument('-i', '--blast_in', metavar='blast.outfmt6', default=sys.stdin, type=lambda x: __parse_file_check_compression(x, 'r'), required=False, help='Input [gzip] blast file (default: stdin)')
-	parser.add_argument('-o', '--blast_out', metavar='blast_filtered.outmft6', default=sys.stdout, type=lambda x: __parse_file_check_compression(x, 'w'), required=False, help='Output [gzip] blast file (default: stdout)')
+	parser.add_argument('-i', '--blast_in', metavar='blast.outfmt6', default='-', type=lambda x: File(x, 'r'), required=False, help='Input [gzip/bgzip/zstd] blast file (default: stdin)')
+	parser.add_argument('-o', '--blast_out', metavar='blast_filtered.outmft6', default='-', type=lambda x: File(x, 'w'), required=False, help='Output [gzip/bgzip/zstd] blast file (default: stdout)')
 	parser.add_argument('-q', '--query_cov', default=0.0, type=float, required=False, help='Return hits that cover > X%% of the query sequence (default: %(default)s)')
 	parser.add_argument('-s', '--subject_cov', default=0.0, type=float, required=False, help='Return hits that cover > Y%% of the subject sequence (default: %(default)s)')
+	parser.add_argument('--outfmt', default=OUTFMT, type=str, required=False, help='Columns of --blast_in (blast -outfmt spec) (default: %(default)s)')
+	parser.add_argument('--numpy', action='store_true', required=False, help='Filter blocks of lines using NumPy (default: %(default)s)')
+	parser.add_argument('--merged', action='store_true', required=False, help='Coverage of the merged HSPs of each query-subject pair (default: %(default)s)')
+	parser.add_argument('--chunk_size', default=CHUNK_SIZE, type=int, required=False, help='Size (characters) of the blocks of --blast_in used by --numpy (default: %(default)s)')
 	parser.add_argument('--debug', action='store_true', required=False, help='Print DEBUG info (default: %(default)s)')
 	args = parser.parse_args()
 	
-        # Set up basic debugger
+	# Set up basic debugger
 	logFormat = "[%(levelname)s]: %(message)s"
 	logging.basicConfig(format=logFormat, stream=sys.stderr, level=logging.INFO)
 	if args.debug:
 		logging.getLogger().setLevel(logging.DEBUG)
 	
 	logging.debug('%s', args) ## DEBUG
-
-	query_subject_hit_cov_filter(args.blast_in, args.blast_out, args.query_cov, args.subject_cov)
+	
+	try:
+		columns = parse_outfmt(args.outfmt)
+	except BlastFormatError as e:
+		parser.error('--outfmt %s: %s' % (args.outfmt, e))
+	missing = [x for x in REQUIRED_COLUMNS if x not in columns]
+	if missing:
+		parser.error('--outfmt is missing columns: %s' % ' '.join(missing))
+	if args.numpy and numpy is None:
+		parser.error('--numpy needs the numpy package (pip install numpy)')
+	if args.numpy or args.merged:
+		missing = [x for x in ID_COLUMNS if x not in columns]
+		if missing:
+			parser.error('--outfmt is missing columns (needed for --numpy/--merged): %s' % ' '.join(missing))
+	if args.chunk_size < 1:
+		parser.error('--chunk_size must be >= 1')
+	
+	with args.blast_in as blast_fh, args.blast_out as blast_out_fh:
+		try:
+			if args.numpy:
+				query_subject_hit_cov_filter_numpy(blast_fh, blast_out_fh, args.query_cov, args.subject_cov, columns, args.merged, args.chunk_size)
+			elif args.merged:
+				query_subject_merged_cov_filter(blast_fh, blast_out_fh, args.query_cov, args.subject_cov, columns)
+			else:
+				query_subject_hit_cov_filter(blast_fh, blast_out_fh, args.query_cov, args.subject_cov, columns)
+		except BlastFormatError as e:
+			logging.error('%s', e)
+			sys.exit(1)
 
 
 
-def query_subject_hit_cov_filter(blast_fh, blast_out_fh, query_cov, subject_cov):
+def query_subject_hit_cov_filter(blast_fh, blast_out_fh, query_cov, subject_cov, columns=OUTFMT):
 	# Percent to proportion
 	query_cov = query_cov/100
 	subject_cov = subject_cov/100
 	
-	for line in blast_fh:
-		line = line.strip()
-		if not line or line.startswith('#'):
-			continue
-		
-		qseqid, sseqid, pident, length, mismatch, gapopen, qstart, qend, sstart, send, evalue, bitscore, qlen, slen = line.split('\t')
-		
-		qstart = int(qstart)
-		qend = int(qend)
-		qlen = int(qlen)
-		sstart = int(sstart)
-		send = int(send)
-		slen = int(slen)
+	for hit in blast_iter(blast_fh, parse_outfmt(columns)):
+		qstart = hit.qstart
+		qend = hit.qend
+		sstart = hit.sstart
+		send = hit.send
 		
 		# Invert start and end if the are reversed (happen for blast using nucl sequences)
 		qlen_hit = 0
@@ -73,29 +127,164 @@ def query_subject_hit_cov_filter(blast_fh, blast_out_fh, query_cov, subject_cov)
 			slen_hit = (sstart - send)+1
 		
 		# Filter
-		if qlen_hit > (qlen * query_cov) and slen_hit > (slen * subject_cov):
-			blast_out_fh.write(line+'\n')
-		#else:
-		#	print line
+		if qlen_hit > (hit.qlen * query_cov) and slen_hit > (hit.slen * subject_cov):
+			blast_out_fh.write(hit.line())
 
 
 
-def __parse_file_check_compression(fh, mode='r'):
+def query_subject_merged_cov_filter(blast_fh, blast_out_fh, query_cov, subject_cov, columns=OUTFMT):
 	'''
-	Open stdin/normal/gzip files - check file exists (if mode='r') and open using appropriate function.
+	Filter query-subject pairs on the coverage of their merged HSPs (see merged_length());
+	writes all HSPs of the pairs that pass. Streams one query group at a time.
 	'''
-	# Check file exists if mode='r'
-	if not os.path.exists(fh) and mode == 'r':
-		raise argparse.ArgumentTypeError("The file %s does not exist!" % fh)
+	debug = logging.getLogger().isEnabledFor(logging.DEBUG)
 	
-	## open with gzip if it has the *.gz extension, else open normally (including stdin)
-	try:
-		if fh.endswith(".gz"):
-			return gzip.open(fh, mode+'b')
+	# Percent to proportion
+	query_cov = query_cov/100
+	subject_cov = subject_cov/100
+	
+	for query_id, hits in blast_groups(blast_iter(blast_fh, parse_outfmt(columns))):
+		hits = list(hits)
+		
+		# Query and subject intervals of each pair
+		pairs = {}
+		for hit in hits:
+			qstart = hit.qstart
+			qend = hit.qend
+			sstart = hit.sstart
+			send = hit.send
+			pair = pairs.get(hit.sseqid)
+			if pair is None:
+				pair = pairs[hit.sseqid] = ([], [], hit.qlen, hit.slen)
+			pair[0].append((qstart, qend) if qstart < qend else (qend, qstart))
+			pair[1].append((sstart, send) if sstart < send else (send, sstart))
+		
+		# Filter
+		keep = set()
+		for subject_id, (query_intervals, subject_intervals, qlen, slen) in pairs.items():
+			qlen_merged = merged_length(query_intervals)
+			slen_merged = merged_length(subject_intervals)
+			if debug:
+				logging.debug('%s %s: %s HSPs; merged query %s/%s; merged subject %s/%s', query_id, subject_id, len(query_intervals), qlen_merged, qlen, slen_merged, slen) ## DEBUG
+			if qlen_merged > (qlen * query_cov) and slen_merged > (slen * subject_cov):
+				keep.add(subject_id)
+		for hit in hits:
+			if hit.sseqid in keep:
+				blast_out_fh.write(hit.line())
+
+
+
+def merged_length(intervals):
+	'''
+	Length covered by the union of (start, end) intervals (inclusive; start <= end).
+	Intervals are sorted by start and merged in one sweep; overlapping (or adjacent)
+	intervals are only counted once.
+	'''
+	covered = 0
+	merged_start = None
+	merged_end = None
+	for start, end in sorted(intervals):
+		if merged_end is not None and start <= merged_end + 1:
+			if end > merged_end:
+				merged_end = end
 		else:
-			return open(fh, mode)
-	except IOError as e:
-		raise argparse.ArgumentTypeError('%s' % e)
+			if merged_end is not None:
+				covered += merged_end - merged_start + 1
+			merged_start = start
+			merged_end = end
+	if merged_end is not None:
+		covered += merged_end - merged_start + 1
+	return covered
+
+
+
+def query_subject_hit_cov_filter_numpy(blast_fh, blast_out_fh, query_cov, subject_cov, columns=OUTFMT, merged=False, chunk_size=CHUNK_SIZE):
+	'''
+	Same as query_subject_hit_cov_filter() but each block of lines (blast_chunks()) is
+	filtered at once using NumPy arrays. If merged, coverage is of the union of the HSPs
+	of each query-subject pair (see merged_lengths(); same as query_subject_merged_cov_filter()).
+	'''
+	columns = parse_outfmt(columns)
+	query_cov = query_cov/100
+	subject_cov = subject_cov/100
+	
+	key_col = columns.index('qseqid')
+	num_rows = 0
+	num_kept = 0
+	for chunk in blast_chunks(blast_fh, chunk_size, key_col):
+		lines, cols = parse_block(chunk, columns, REQUIRED_COLUMNS + (ID_COLUMNS if merged else ()))
+		if not lines:
+			continue
+		qstart, qend, sstart, send, qlen, slen = [cols[x] for x in REQUIRED_COLUMNS]
+		
+		if merged:
+			first, pairs = numpy.unique(numpy.char.add(numpy.char.add(cols['qseqid'], '\t'), cols['sseqid']), return_index=True, return_inverse=True)[1:]
+			pairs = pairs.ravel()
+			qlen_hit = merged_lengths(pairs, numpy.minimum(qstart, qend), numpy.maximum(qstart, qend))[pairs]
+			slen_hit = merged_lengths(pairs, numpy.minimum(sstart, send), numpy.maximum(sstart, send))[pairs]
+			## Lengths of the first HSP of each pair (as in query_subject_merged_cov_filter())
+			qlen = qlen[first][pairs]
+			slen = slen[first][pairs]
+		else:
+			qlen_hit = numpy.abs(qend - qstart) + 1
+			slen_hit = numpy.abs(send - sstart) + 1
+		
+		# Filter
+		keep = numpy.flatnonzero((qlen_hit > qlen * query_cov) & (slen_hit > slen * subject_cov))
+		blast_out_fh.write(''.join([lines[i] + '\n' for i in keep.tolist()]))
+		num_rows += len(lines)
+		num_kept += len(keep)
+	logging.debug('Kept %s of %s hits', num_kept, num_rows) ## DEBUG
+
+
+
+def parse_block(chunk, columns, names, delim='\t'):
+	'''
+	Returns (lines, dict of column name: NumPy array) for the blast lines in chunk (blank/comment
+	lines are skipped; same checks as blast_iter()). Columns are parsed by numpy.loadtxt (the lines
+	are never split in python); qseqid/sseqid are str arrays, all other names int64.
+	'''
+	lines = [x.rstrip('\r') for x in chunk.split('\n') if x and not x.startswith('#')]
+	if not lines:
+		return lines, {}
+	num_cols = len(columns)
+	if min(map(methodcaller('count', delim), lines)) < num_cols - 1:
+		line = [x for x in lines if x.count(delim) < num_cols - 1][0]
+		raise BlastFormatError('Line has %s columns (expected >= %s: %s): %s' % (line.count(delim) + 1, num_cols, ' '.join(columns), line))
+	
+	cols = {}
+	for dtype, block_names in [(numpy.int64, [x for x in names if x not in ID_COLUMNS]), (str, [x for x in names if x in ID_COLUMNS])]:
+		if not block_names:
+			continue
+		try:
+			values = numpy.loadtxt(lines, dtype=dtype, delimiter=delim, usecols=[columns.index(x) for x in block_names], comments=None, ndmin=2)
+		except ValueError as e:
+			raise BlastFormatError('Can not parse %s: %s' % (' '.join(block_names), e))
+		for i, name in enumerate(block_names):
+			cols[name] = values[:, i]
+	return lines, cols
+
+
+
+def merged_lengths(groups, starts, ends):
+	'''
+	Length covered by the union of the (inclusive) intervals starts:ends of each group
+	(0..max(groups)); overlapping intervals are only counted once.
+	
+	Intervals are sorted by group then start; each one adds the part past the furthest end of
+	the intervals before it in the same group (running max; groups are kept apart by offsetting
+	the ends of each group by group*(max(ends)+1)).
+	'''
+	order = numpy.lexsort((starts, groups))
+	groups = groups[order]
+	starts = starts[order]
+	ends = ends[order]
+	offset = groups * (int(ends.max()) + 1)
+	furthest = numpy.maximum.accumulate(ends + offset)
+	prev_end = numpy.zeros(len(ends), dtype=numpy.int64)
+	prev_end[1:] = numpy.maximum(furthest[:-1] - offset[1:], 0)
+	covered = numpy.maximum(ends - numpy.maximum(starts - 1, prev_end), 0)
+	return numpy.bincount(groups, weights=covered).astype(numpy.int64)
 
 
 
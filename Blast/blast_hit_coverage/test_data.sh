@@ -22,7 +22,27 @@ awk -F'\t' '( (($8-$7)+1) > ($13*0.5) || (($7-$8)+1) > ($13*0.5) ) && ( (($10-$9
 ./blast_hit_coverage.py -q 50 -s 50 -i test_data/test_small1.outfmt6 | md5sum
 9dac58c13705fe9c19c83cd545d3a225  -
 
-
-
-
+./blast_hit_coverage.py -q 50 -s 50 -i test_data/test_small1.outfmt6 --numpy --chunk_size 1000 | md5sum
+9dac58c13705fe9c19c83cd545d3a225  -
+./blast_hit_coverage.py -q 10 -s 10 -i test_data/test_small1.outfmt6 | md5sum
+7f5be444248e302b8c7cb078161db4f0  -
+./blast_hit_coverage.py -q 10 -s 10 -i test_data/test_small1.outfmt6 --numpy --merged --chunk_size 1000 | md5sum
+f12bd94f4d3bffc926f1914e61fe32ee  -
+./blast_hit_coverage.py -q 10 -s 10 -i test_data/test_small1.outfmt6 --merged | md5sum
+f12bd94f4d3bffc926f1914e61fe32ee  -
+
+## q1-s1: 3 HSPs (overlapping on the query; 2 on the reverse strand of the subject) == 86/100 query, 98/200 subject merged
+## q1-s2: HSP contained in another HSP == 30/100 query, 30/100 subject merged
+./blast_hit_coverage.py -q 80 -s 40 -i test_data/test_merged.outfmt6 | md5sum
+2e9664c1434aee593ab745b545fce83b  -
+./blast_hit_coverage.py -q 80 -s 40 -i test_data/test_merged.outfmt6 --merged | md5sum
+5ede3d368fc8f5930f3cfd5797bdc0c7  -
+./blast_hit_coverage.py -q 80 -s 40 -i test_data/test_merged.outfmt6 --numpy --merged | md5sum
+5ede3d368fc8f5930f3cfd5797bdc0c7  -
+./blast_hit_coverage.py -q 85 -s 48 -i test_data/test_merged.outfmt6 --merged | md5sum
+5ede3d368fc8f5930f3cfd5797bdc0c7  -
+./blast_hit_coverage.py -q 86 -s 48 -i test_data/test_merged.outfmt6 --merged | md5sum
+2e9664c1434aee593ab745b545fce83b  -
+./blast_hit_coverage.py -q 85 -s 49 -i test_data/test_merged.outfmt6 --merged | md5sum
+2e9664c1434aee593ab745b545fce83b  -
 
@@ -1,28 +1,64 @@
-#!/usr/bin/env python2
+#!/usr/bin/env python3
 DESCRIPTION = '''
 blast_top_hits - Filters blast output, taking top X subjects and top X hits per subject.
 
 NOTE:
 	- Expects file is sorted, with all subject hits ordered from most to least significant
+	   (unless -r/--rank is used)
 	- Expects query to be in column 1
 	- Expects tab delimted file (-outfmt 6)
+	- Use --outfmt if the file has custom columns (same as blast -outfmt; e.g. "6 std qlen slen")
+	- Use -t/--threads N to filter the file in N processes. The input is split into parts of
+	   ~--chunk_size bytes that only contain whole query groups; output order is the same as
+	   with 1 process. Plain text files are split into byte ranges which each process reads
+	   itself; compressed files and stdin are read (and split) by the main process.
+
+Unsorted input (-r/--rank bitscore|evalue):
+	- Hits are ranked by bitscore (highest first) or evalue (lowest first; ties broken by
+	   bitscore) in one pass over the file; the input does not need to be sorted or grouped.
+	- The top -n/--num_hits HSPs of each subject are kept in a bounded heap (per query);
+	   the top -s/--num_subjects subjects of each query (ranked by their best HSP) are
+	   written once the input has been read. Queries are written in the order they first
+	   appear; ties keep the input order.
+	- Memory == queries * subjects per query * --num_hits. If there are more than
+	   --max_queries queries the hits kept so far (and all following hits) are spilled to
+	   --partitions files in --tmp_dir (by query); each partition is then ranked in memory
+	   and the results merged back into query order.
 
 '''
+import io
 import sys
 import os
+import heapq
 import argparse
 import logging
-import gzip
-from itertools import groupby
+import tempfile
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'Python'))
+from src.files import File, get_codec
+from src.parallel import ordered_map
+from src.blast import blast_iter, blast_groups, hit_class, parse_outfmt, blast_ranges, blast_chunks, read_range, BlastFormatError, CHUNK_SIZE
+
+## Rank of a hit for -r/--rank (larger == better).
+RANKS = {
+	'bitscore': lambda hit: (hit.bitscore,),
+	'evalue': lambda hit: (-hit.evalue, hit.bitscore),
+}
 
 ## Pass arguments.
 def main():
 	# Pass command line arguments. 
 	parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter, description=DESCRIPTION)
-	parser.add_argument('-i', '--blast_in', default=sys.stdin, metavar='blast.outfmt6', type=lambda x: __parse_file_check_compression(x, 'r'), required=False, help='Input [gzip] blast file (default: stdin)')
-	parser.add_argument('-o', '--blast_out', default=sys.stdout, metavar='blast_filtered.outmft6', type=lambda x: __parse_file_check_compression(x, 'w'), required=False, help='Output [gzip] blast file (default: stdout)')
+	parser.add_argument('-i', '--blast_in', default='-', metavar='blast.outfmt6', type=lambda x: File(x, 'r'), required=False, help='Input [gzip/bgzip/zstd] blast file (default: stdin)')
+	parser.add_argument('-o', '--blast_out', default='-', metavar='blast_filtered.outmft6', type=lambda x: File(x, 'w'), required=False, help='Output [gzip/bgzip/zstd] blast file (default: stdout)')
 	parser.add_argument('-s', '--num_subjects', default=1, type=int, required=False, help='Number of subjects per query to retain (default: %(default)s)')
 	parser.add_argument('-n', '--num_hits', default=1, type=int, required=False, help='Number hits to retain per subject (default: %(default)s)')
+	parser.add_argument('--outfmt', default='6', type=str, required=False, help='Columns of --blast_in (blast -outfmt spec) (default: %(default)s)')
+	parser.add_argument('-r', '--rank', default=None, choices=sorted(RANKS.keys()), required=False, help='Rank hits by this column; input does not need to be sorted (default: use input order)')
+	parser.add_argument('--max_queries', default=1000000, type=int, required=False, help='Max queries held in memory with -r/--rank before spilling to --tmp_dir (default: %(default)s)')
+	parser.add_argument('--partitions', default=64, type=int, required=False, help='Number of partition files used when spilling with -r/--rank (default: %(default)s)')
+	parser.add_argument('--tmp_dir', default=None, type=str, required=False, help='Directory for -r/--rank partition files (default: system temp dir)')
+	parser.add_argument('-t', '--threads', default=1, type=int, required=False, help='Number of processes to use (default: %(default)s)')
+	parser.add_argument('--chunk_size', default=CHUNK_SIZE, type=int, required=False, help='Size (bytes) of the parts of --blast_in sent to each process when --threads > 1 (default: %(default)s)')
 	parser.add_argument('--debug', action='store_true', required=False, help='Print DEBUG info (default: %(default)s)')
 	args = parser.parse_args()
 	
@@ -33,39 +69,74 @@ def main():
 		logging.getLogger().setLevel(logging.DEBUG)
 	
 	logging.debug('%s', args) ## DEBUG
-
-	for query_id, filtered_hits in top_hit_iter(args.blast_in, args.num_subjects, args.num_hits):
-		for hit in filtered_hits:
-			args.blast_out.write('\t'.join(hit) + '\n')
-	args.blast_in.close()
-	args.blast_out.close()
 	
+	try:
+		columns = parse_outfmt(args.outfmt)
+	except BlastFormatError as e:
+		parser.error('--outfmt %s: %s' % (args.outfmt, e))
+	if 'qseqid' not in columns or 'sseqid' not in columns:
+		parser.error('--outfmt must include qseqid and sseqid')
+	if args.threads < 1:
+		parser.error('-t/--threads must be >= 1')
+	if args.chunk_size < 1:
+		parser.error('--chunk_size must be >= 1')
+	if args.num_subjects < 1 or args.num_hits < 1:
+		parser.error('-s/--num_subjects and -n/--num_hits must be >= 1')
+	if args.rank is not None:
+		if args.threads > 1:
+			parser.error('-r/--rank can not be used with -t/--threads > 1')
+		if args.max_queries < 1 or args.partitions < 1:
+			parser.error('--max_queries and --partitions must be >= 1')
+		if args.tmp_dir is not None and not os.path.isdir(args.tmp_dir):
+			parser.error('--tmp_dir %s does not exist' % args.tmp_dir)
+		if args.rank not in columns or 'bitscore' not in columns:
+			parser.error('--outfmt must include %s and bitscore for -r/--rank' % args.rank)
+	
+	with args.blast_in as blast_fh, args.blast_out as blast_out_fh:
+		try:
+			if args.rank is not None:
+				top_hits_ranked(blast_fh, blast_out_fh, args.num_subjects, args.num_hits, columns, args.rank, args.max_queries, args.partitions, args.tmp_dir)
+			elif args.threads > 1:
+				## Plain text files can be split into byte ranges (read by each process)
+				file_name = args.blast_in.file_name
+				if file_name == '-' or get_codec(file_name) is not None:
+					file_name = None
+				top_hits_parallel(blast_fh, blast_out_fh, args.num_subjects, args.num_hits, columns, args.threads, args.chunk_size, file_name)
+			else:
+				for query_id, filtered_hits in top_hit_iter(blast_fh, args.num_subjects, args.num_hits, columns):
+					for hit in filtered_hits:
+						blast_out_fh.write(hit.line())
+		except BlastFormatError as e:
+			logging.error('%s', e)
+			sys.exit(1)
+
 
-def top_hit_iter(blast_fh, num_subjects, num_hits):
+def top_hit_iter(blast_fh, num_subjects, num_hits, columns=None):
 	"""
 	Takes BLAST filehandle and yields lists of hits which have been filtered by num_subjects and num_hits.
 	Allows for quick traversal and filtering of very large BLAST output files.
 	
-	Version: 0.1simple
-	Last Modified: 26/11/2019
+	Version: 0.2
+	Last Modified: 18/10/2026
 	
 	Arguments:
 		blast_fh:       File handle with BLAST output "-outfmt 6".
+		columns:        Column names of blast_fh (see src.blast.parse_outfmt(); default: std 12 columns).
 	
 	Yields:
-	blast_list:     List of BLAST hits after filtering in appropriate format. 
+	query_id, blast_list:     List of BlastHit's (src.blast) after filtering.
 	
-	Note:   - Must be sorted by key_col (all entries with same key_col must be next to each other)
-		- Ignores blank lines.
-		- Does not transform columns (will not convert str to int e.g. for start/stop/etc.)
+	Note:   - Must be sorted by query (all entries with same query must be next to each other)
+		- Ignores blank and comment lines.
+		- Each line is split once; use hit.line() to get the line back.
 
 	"""
-	delim='\t'
-	for query_id, hits in groupby(blast_fh, lambda x: x.strip().split(delim)[0]):
+	debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+	for query_id, hits in blast_groups(blast_iter(blast_fh, parse_outfmt(columns))):
 		subjects_seen = 0
 		filtered_hits = []
 		
-		for subject_id, hsps in groupby(hits, lambda l: l.strip().split(delim)[1]): # For each query iterate over subject seqs
+		for subject_id, hsps in blast_groups(hits, 'sseqid'): # For each query iterate over subject seqs
 			
 			subjects_seen += 1
 			if subjects_seen > num_subjects:
@@ -73,34 +144,197 @@ def top_hit_iter(blast_fh, num_subjects, num_hits):
 			
 			hsps_seen = 0
 			for h in hsps: # For each subject iterate over HSPs
-				logging.debug('subjects_seen: %s; hsps_seen: %s', subjects_seen, hsps_seen) ## DEBUG
-				logging.debug('Query_id: %s - Subject_id: %s - HSP: %s', query_id, subject_id, h.strip()) ## DEBUG
+				if debug:
+					logging.debug('subjects_seen: %s; hsps_seen: %s', subjects_seen, hsps_seen) ## DEBUG
+					logging.debug('Query_id: %s - Subject_id: %s - HSP: %s', query_id, subject_id, h.line().strip()) ## DEBUG
 				hsps_seen += 1
 				if hsps_seen > num_hits:
 					break
 				
-				filtered_hits.append(h.strip().split(delim))
+				filtered_hits.append(h)
 				
 		yield query_id, filtered_hits
 
 
 
-def __parse_file_check_compression(fh, mode='r'):
+def top_hits_parallel(blast_fh, blast_out_fh, num_subjects, num_hits, columns, threads, chunk_size=CHUNK_SIZE, file_name=None):
+	'''
+	Split the blast file into parts that only contain whole query groups and filter
+	them in a pool of worker processes. Filtered parts are written in the original order.
+	
+	If file_name is given (plain text file) the parts are byte ranges which each worker
+	reads from the file itself (only the lines around each boundary are read by the main
+	process); else the parts are read from blast_fh and sent to the workers.
+	
+	Parts are run with src.parallel.ordered_map() (at most 2*threads parts in flight).
+	'''
+	key_col = columns.index('qseqid')
+	if file_name is not None:
+		function = _top_hits_range
+		parts = ((file_name, start, end, num_subjects, num_hits, columns) for start, end in blast_ranges(file_name, chunk_size, key_col))
+	else:
+		function = _top_hits_chunk
+		parts = ((chunk, num_subjects, num_hits, columns) for chunk in blast_chunks(blast_fh, chunk_size, key_col))
+	for filtered in ordered_map(function, parts, threads):
+		blast_out_fh.write(filtered)
+
+
+def _top_hits_range(file_name, start, end, num_subjects, num_hits, columns):
 	'''
-	Open stdin/normal/gzip files - check file exists (if mode='r') and open using appropriate function.
+	Worker: filter the byte range start:end of file_name. Returns the filtered hits as text.
 	'''
-	# Check file exists if mode='r'
-	if not os.path.exists(fh) and mode == 'r':
-		raise argparse.ArgumentTypeError("The file %s does not exist!" % fh)
+	logging.debug('Filtering bytes %s-%s of %s', start, end, file_name) ## DEBUG
+	return _top_hits_chunk(read_range(file_name, start, end), num_subjects, num_hits, columns)
+
+
+def _top_hits_chunk(chunk, num_subjects, num_hits, columns):
+	'''
+	Worker: filter a chunk of text (whole query groups). Returns the filtered hits as text.
+	'''
+	lines = io.StringIO(chunk, newline='\n')
+	return ''.join([hit.line() for query_id, filtered_hits in top_hit_iter(lines, num_subjects, num_hits, columns) for hit in filtered_hits])
+
+
+
+def top_hits_ranked(blast_fh, blast_out_fh, num_subjects, num_hits, columns, rank='bitscore', max_queries=1000000, partitions=64, tmp_dir=None):
+	'''
+	Write the top num_subjects subjects (and top num_hits HSPs of each) of each query,
+	ranked by rank (see RANKS), from unsorted input.
 	
-	## open with gzip if it has the *.gz extension, else open normally (including stdin)
-	try:
-		if fh.endswith(".gz"):
-			return gzip.open(fh, mode+'b')
-		else:
-			return open(fh, mode)
-	except IOError as e:
-		raise argparse.ArgumentTypeError('%s' % e)
+	Queries are held in memory (QueryTopHits) until there are more than max_queries;
+	after that the hits are spilled to partition files (see top_hits_external()).
+	'''
+	rank_key = RANKS[rank]
+	queries = {}
+	hits = blast_iter(blast_fh, columns)
+	for hit_number, hit in enumerate(hits):
+		query = queries.get(hit.qseqid)
+		if query is None:
+			if len(queries) >= max_queries:
+				logging.info('More than %s queries; spilling hits to %s partitions', max_queries, partitions) ## INFO
+				top_hits_external(queries, hits, hit_number, hit, blast_out_fh, num_subjects, num_hits, columns, rank_key, partitions, tmp_dir)
+				return
+			query = queries[hit.qseqid] = QueryTopHits(hit_number)
+		query.add(hit.sseqid, rank_key(hit), hit_number, hit.line(), num_hits)
+	
+	for query in queries.values():
+		for line in query.lines(num_subjects):
+			blast_out_fh.write(line)
+
+
+
+def top_hits_external(queries, hits, hit_number, hit, blast_out_fh, num_subjects, num_hits, columns, rank_key, partitions=64, tmp_dir=None):
+	'''
+	External memory version of top_hits_ranked(); called with the queries held in memory
+	so far, the hits iterator, and the first hit that did not fit (with its number).
+	
+	1. The hits kept for each query in memory (all that can be in the output) and all the
+	   following hits are written to partition files (by hash of query), tagged with the
+	   number of the first hit of their query and their own hit number.
+	2. Each partition is ranked in memory (~1/partitions of the queries) and its output
+	   written to a run file, sorted by the number of the first hit of each query.
+	3. Run files are merged, so queries are written in the order they first appear.
+	'''
+	cls = hit_class(columns)
+	with tempfile.TemporaryDirectory(prefix='blast_top_hits.', dir=tmp_dir) as run_dir:
+		# Partition hits by query
+		partition_files = [os.path.join(run_dir, 'partition.%s.txt' % i) for i in range(partitions)]
+		partition_fhs = [open(x, 'w') for x in partition_files]
+		try:
+			for query_id, query in queries.items():
+				out = partition_fhs[hash(query_id) % partitions]
+				for number, line in query.hits():
+					out.write('%s\t%s\t%s' % (query.first_number, number, line))
+			queries.clear()
+			while hit is not None:
+				partition_fhs[hash(hit.qseqid) % partitions].write('%s\t%s\t%s' % (hit_number, hit_number, hit.line()))
+				hit = next(hits, None)
+				hit_number += 1
+		finally:
+			for fh in partition_fhs:
+				fh.close()
+		
+		# Rank each partition
+		run_files = []
+		for partition_file in partition_files:
+			queries = {}
+			with open(partition_file) as fh:
+				for record in fh:
+					first_number, number, line = record.split('\t', 2)
+					hit = cls(line.rstrip('\n').split('\t'))
+					first_number = int(first_number)
+					query = queries.get(hit.qseqid)
+					if query is None:
+						query = queries[hit.qseqid] = QueryTopHits(first_number)
+					query.first_number = min(query.first_number, first_number)
+					query.add(hit.sseqid, rank_key(hit), int(number), line, num_hits)
+			os.remove(partition_file)
+			run_file = partition_file + '.ranked'
+			with open(run_file, 'w') as out:
+				for query in sorted(queries.values(), key=lambda x: x.first_number):
+					for line in query.lines(num_subjects):
+						out.write('%s\t%s' % (query.first_number, line))
+			run_files.append(run_file)
+			logging.debug('Ranked %s queries from %s', len(queries), partition_file) ## DEBUG
+		
+		# Merge runs back into query order
+		run_fhs = [open(x) for x in run_files]
+		try:
+			for first_number, line in heapq.merge(*[_read_run(x) for x in run_fhs], key=lambda x: x[0]):
+				blast_out_fh.write(line)
+		finally:
+			for fh in run_fhs:
+				fh.close()
+
+
+
+def _read_run(run_fh):
+	'''
+	Yield (first hit number of query, line) from a run file of top_hits_external().
+	'''
+	for record in run_fh:
+		first_number, line = record.split('\t', 1)
+		yield int(first_number), line
+
+
+
+class QueryTopHits(object):
+	'''
+	Top num_hits HSPs of each subject of a query, each kept in a bounded min-heap of
+	(rank, -hit number, line) entries (ties are won by the hit seen first).
+	'''
+	__slots__ = ('first_number', 'subjects')
+	
+	def __init__(self, first_number):
+		self.first_number = first_number
+		self.subjects = {}
+	
+	def add(self, subject_id, rank, number, line, num_hits):
+		entry = (rank, -number, line)
+		heap = self.subjects.get(subject_id)
+		if heap is None:
+			self.subjects[subject_id] = [entry]
+		elif len(heap) < num_hits:
+			heapq.heappush(heap, entry)
+		elif entry > heap[0]:
+			heapq.heapreplace(heap, entry)
+	
+	def hits(self):
+		'''
+		Yield (hit number, line) of all kept hits.
+		'''
+		for heap in self.subjects.values():
+			for rank, number, line in heap:
+				yield -number, line
+	
+	def lines(self, num_subjects):
+		'''
+		Lines of the top num_subjects subjects (ranked by their best HSP), each subject's HSPs in rank order.
+		'''
+		lines = []
+		for heap in heapq.nlargest(num_subjects, self.subjects.values(), key=max):
+			lines.extend([x[2] for x in sorted(heap, reverse=True)])
+		return lines
 
 
 
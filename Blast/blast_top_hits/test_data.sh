@@ -1,4 +1,7 @@
 
 python blast_top_hits.py -i test_data/test_small1.outfmt6 -o test_data/test.small1.outfmt6.filtered --num_subjects 1 --num_hits 1 --debug  
+python blast_top_hits.py -i test_data/test_small1.outfmt6 -o test_data/test.small1.outfmt6.filtered.threads --num_subjects 1 --num_hits 1 --threads 2 --chunk_size 1000
+md5sum test_data/test.small1.outfmt6.filtered test_data/test.small1.outfmt6.filtered.threads
+sort -R test_data/test_small1.outfmt6 | python blast_top_hits.py -o test_data/test.small1.outfmt6.filtered.ranked --num_subjects 1 --num_hits 1 --rank bitscore --max_queries 2 --partitions 3
 
 
@@ -1,4 +1,4 @@
-#!/usr/bin/env python
+#!/usr/bin/env python3
 DESCRIPTION = '''
 Cleans a nucl or prot fasta file of non-standard seq and header characters. 
 Will print stats of the cleaning process once completed (unless --quiet set).
@@ -15,11 +15,18 @@ Script will (in this order):
 	. Replace internal stop codons
 	. Remove terminal stop codons
 	. Add prefix to seq header
+
+Use --threads N to clean the file in N processes (the input is split into
+record-aligned chunks; output order and stats are the same as with 1 process).
 '''
 import sys
+import os
 import argparse
 import logging
-from itertools import groupby
+from collections import Counter
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'Python'))
+from src.fastx import fasta_records, fasta_chunks, fasta_chunk_records, CHUNK_SIZE
+from src.parallel import ordered_map
 
 
 # Pass command line arguments. 
@@ -39,6 +46,9 @@ def main():
 	parser.add_argument('--keep_case', action='store_true', required=False, help='Keep case of seq characters (default: Convert to uppercase)')
 	parser.add_argument('--lower_case', action='store_true', required=False, help='Make seq characters lowercase (default: Convert to uppercase)')
 	
+	parser.add_argument('-t', '--threads', type=int, default=1, required=False, help='Number of processes to use for cleaning (default: %(default)s)')
+	parser.add_argument('--chunk_size', type=int, default=CHUNK_SIZE, required=False, help='Size (bytes) of the fasta chunks sent to each process when --threads > 1 (default: %(default)s)')
+	
 	parser.add_argument('--info', action='store_true', required=False, help='Info about the cleaning of each sequence (default: %(default)s)')
 	parser.add_argument('-q', '--quiet', action='store_true', required=False, help='Dont print any info (including stats at the end) (default: %(default)s)')
 	parser.add_argument('--debug', action='store_true', required=False, help='Print DEBUG info (default: %(default)s)')
@@ -55,9 +65,14 @@ def main():
 	
 	logging.debug('%s', args) ## DEBUG
 	
+	if args.threads < 1:
+		parser.error('--threads must be >= 1')
+	if args.chunk_size < 1:
+		parser.error('--chunk_size must be >= 1')
+	
 	clean_fasta(args.fasta_in, args.fasta_out, args.seq_type, args.header_type, 
 			args.prefix, args.keep_descriptions, args.fix_internal, args.remove_stop, 
-			args.keep_case, args.lower_case, args.quiet)
+			args.keep_case, args.lower_case, args.quiet, args.threads, args.chunk_size)
 
 
 # Accepted character lists
@@ -69,9 +84,40 @@ CHARACTERS_HEADER_BASIC = '._-abcdefghijklmnopqrstuvwyxzABCDEFGHIJKLMNOPQRSTUVWY
 
 def clean_fasta(in_fasta, out_fasta, seq_type, header_type, 
 			prefix, keep_descriptions, fix_internal, remove_stop, 
-			keep_case, lower_case, quiet):
-	fa = fasta_clean_and_track_problems()
-	for header, seq in fasta_iter(in_fasta):
+			keep_case, lower_case, quiet, threads=1, chunk_size=CHUNK_SIZE):
+	## Case conversion is folded into the sequence cleaning translate table
+	if keep_case:
+		case = None
+	elif lower_case:
+		case = 'lower'
+	else:
+		case = 'upper'
+	options = (seq_type, header_type, prefix, keep_descriptions, fix_internal, remove_stop, case)
+	
+	## Write bytes straight to the underlying binary buffer (e.g. sys.stdout.buffer)
+	out_fasta = getattr(out_fasta, 'buffer', out_fasta)
+	
+	if threads > 1:
+		fa = clean_fasta_parallel(in_fasta, out_fasta, options, threads, chunk_size)
+	else:
+		fa = fasta_clean_and_track_problems()
+		for entry in clean_fasta_entries(fa, fasta_records(in_fasta), *options):
+			out_fasta.write(entry)
+		
+	## Print stats
+	if not quiet:
+		logging.getLogger().setLevel(logging.INFO)
+	fa.print_cleaning_stats()
+
+
+
+def clean_fasta_entries(fa, records, seq_type, header_type, 
+			prefix, keep_descriptions, fix_internal, remove_stop, case):
+	'''
+	Clean (header, seq) records using fasta_clean_and_track_problems fa.
+	Yields cleaned fasta entries (as bytes).
+	'''
+	for header, seq in records:
 		## Load fasta header and seq into cleaning class
 		fa.load_fasta_entry(header, seq)
 		
@@ -86,19 +132,13 @@ def clean_fasta(in_fasta, out_fasta, seq_type, header_type,
 			fa.clean_header(CHARACTERS_HEADER_NORMAL, '_')
 		
 		## Replace problematic characters in sequences
+		## AND Convert sequence to uppercase (default) OR lowercase (--lower_case) OR keep case (--keep_case)
 		if seq_type == 'prot':
-			fa.clean_seq(CHARACTERS_SEQ_PROTEIN, 'X')
+			fa.clean_seq(CHARACTERS_SEQ_PROTEIN, 'X', case)
 		elif seq_type == 'nuc':
-			fa.clean_seq(CHARACTERS_SEQ_NUCLEOTIDE, 'N')
+			fa.clean_seq(CHARACTERS_SEQ_NUCLEOTIDE, 'N', case)
 		else: #seq_type == 'nucx':
-			fa.clean_seq(CHARACTERS_SEQ_NUCLEOTIDE_X, 'N')
-		
-		## Convert sequence to uppercase (default) OR lowercase (--lower_case) OR keep case (--keep_case)
-		if not keep_case:
-			if lower_case:
-				fa.seq_to_lower()
-			else:
-				fa.seq_to_upper()
+			fa.clean_seq(CHARACTERS_SEQ_NUCLEOTIDE_X, 'N', case)
 		
 		## Replace internal stop codons
 		if fix_internal:
@@ -111,13 +151,36 @@ def clean_fasta(in_fasta, out_fasta, seq_type, header_type,
 		## Add prefix to seq header
 		fa.add_prefix(prefix)
 		
-		## Write fasta to output
-		out_fasta.write(fa.return_fasta_entry())
-		
-	## Print stats
-	if not quiet:
-		logging.getLogger().setLevel(logging.INFO)
-	fa.print_cleaning_stats()
+		## Return cleaned fasta entry
+		yield fa.return_fasta_entry()
+
+
+
+def clean_fasta_parallel(in_fasta, out_fasta, options, threads, chunk_size):
+	'''
+	Split in_fasta into record-aligned chunks and clean them in a pool of
+	worker processes (src.parallel.ordered_map()). Cleaned chunks are written in
+	the original order.
+	
+	Returns the merged fasta_clean_and_track_problems stats from all the workers.
+	'''
+	fa = fasta_clean_and_track_problems()
+	parts = ((chunk, options) for chunk in fasta_chunks(in_fasta, chunk_size))
+	for cleaned, chunk_fa in ordered_map(_clean_fasta_chunk, parts, threads, log_format='#[%(levelname)s]: %(message)s'):
+		out_fasta.write(cleaned)
+		fa.merge_stats(chunk_fa)
+	return fa
+
+
+def _clean_fasta_chunk(chunk, options):
+	'''
+	Worker: clean a chunk of fasta records.
+	Returns (cleaned fasta as bytes, fasta_clean_and_track_problems stats for this chunk).
+	'''
+	fa = fasta_clean_and_track_problems()
+	cleaned = b''.join(clean_fasta_entries(fa, fasta_chunk_records(chunk), *options))
+	fa.translate_tables = {} # Dont send tables back to the main process
+	return cleaned, fa
 
 
 
@@ -125,25 +188,34 @@ class fasta_clean_and_track_problems:
 	'''
 	Class that acts to perform the cleaning of the fasta entry and also keep track
 	of the actions taken. Easy way to compile stats for printing at the end. 
+	
+	Works on bytes. Character replacement and case conversion are done with
+	bytes.translate() using 256-entry lookup tables (built once per set of allowed
+	characters), and problematic characters are found by deleting all the allowed
+	characters from the sequence (i.e. only the problematic characters are left
+	to count).
 	'''
 	def __init__(self):
 		# Current fasta entry
 		self.entry_count = 0
-		self.header = ''
-		self.seq = ''
+		self.header = b''
+		self.seq = b''
+		
+		# Translate tables, keyed by (allowed_chars, replace_with, case)
+		self.translate_tables = {}
 		
 		# Keep track of seq and header character replacement.
 		# Counts start as 'None' type so we know at the end if this step has been run. 
 		
 		# Check header
-		self.bad_header_headers = []
-		self.bad_header_chars = []
+		self.bad_header_headers = set()
+		self.bad_header_chars = Counter()
 		self.replaced_header_count = None
 		self.replaced_header_chars_count = None
 		
 		# Check seq
-		self.bad_seq_headers = []
-		self.bad_seq_chars = []
+		self.bad_seq_headers = set()
+		self.bad_seq_chars = Counter()
 		self.replaced_seq_count = None
 		self.replaced_seq_chars_count = None
 		
@@ -151,7 +223,7 @@ class fasta_clean_and_track_problems:
 		self.cleaned_descriptions_count = None
 		
 		# Internal stop codons
-		self.internal_stop_headers = []
+		self.internal_stop_headers = set()
 		self.internal_stop_count = None
 		self.internal_stop_seq_count = None
 		
@@ -161,7 +233,7 @@ class fasta_clean_and_track_problems:
 		self.seq = seq
 	
 	def return_fasta_entry(self):
-		return '>{}\n{}\n'.format(self.header, self.seq)
+		return b''.join([b'>', self.header, b'\n', self.seq, b'\n'])
 	
 	
 	########################
@@ -172,45 +244,57 @@ class fasta_clean_and_track_problems:
 			self.replaced_header_count = 0
 			self.replaced_header_chars_count = 0
 		
-		# for each character in header
-		self.t_header = ''
-		self.replaced_header_chars = []
-		
-		for i, h in enumerate(self.header):
-			if h not in allowed_chars:
-				self.t_header += replace_with
-				self.replaced_header_chars.append(replace_with)
-				self.found_bad_header_char(self.header, h)
-			else:
-				self.t_header += h
-		self.header = self.t_header
+		allowed, table = self.get_translate_table(allowed_chars, replace_with)
 		
-		# Print info
-		if len(self.replaced_header_chars) > 0:
-			logging.info('Found problematic header chracters %s in %s', ' '.join(set(self.replaced_header_chars)), self.header)
+		# Only the problematic characters are left after deleting the allowed characters
+		bad_chars = self.header.translate(None, allowed)
+		if bad_chars:
+			self.found_bad_header_chars(self.header, bad_chars)
+			self.header = self.header.translate(table)
+			
+			# Print info
+			logging.info('Found problematic header chracters %s in %s', replace_with, self.header.decode('latin-1'))
 	
 	
-	def clean_seq(self, allowed_chars, replace_with):
+	def clean_seq(self, allowed_chars, replace_with, case=None):
+		'''
+		Replace characters not in allowed_chars with replace_with.
+		case: Also convert sequence to 'upper' or 'lower' case in the same pass (default: keep case).
+		'''
 		if self.replaced_seq_count is None: # If this is the first time we have run this function
 			self.replaced_seq_count = 0
 			self.replaced_seq_chars_count = 0
 		
-		# For each character in seq
-		self.t_seq = ''
-		self.replaced_seq_chars = []
+		allowed, table = self.get_translate_table(allowed_chars, replace_with, case)
 		
-		for i, s in enumerate(self.seq):
-			if s not in allowed_chars:
-				self.t_seq += replace_with
-				self.replaced_seq_chars.append(s)
-				self.found_bad_seq_char(self.header, s)
-			else:
-				self.t_seq += s
-		self.seq = self.t_seq
+		# Only the problematic characters are left after deleting the allowed characters
+		bad_chars = self.seq.translate(None, allowed)
+		if bad_chars:
+			self.found_bad_seq_chars(self.header, bad_chars)
+			
+			# Print info
+			logging.info('Found problematic sequence chracters %s in %s', ' '.join(_char_set(bad_chars)), self.header.decode('latin-1'))
 		
-		# Print info
-		if len(self.replaced_seq_chars) > 0:
-			logging.info('Found problematic sequence chracters %s in %s', ' '.join(set(self.replaced_seq_chars)), self.header)
+		if bad_chars or case is not None:
+			self.seq = self.seq.translate(table)
+	
+	
+	def get_translate_table(self, allowed_chars, replace_with, case=None):
+		'''
+		Returns (allowed characters as bytes, 256-entry translate table) which maps
+		characters not in allowed_chars to replace_with, and then converts to upper/lower case.
+		'''
+		key = (allowed_chars, replace_with, case)
+		if key not in self.translate_tables:
+			allowed = allowed_chars.encode()
+			replace = ord(replace_with)
+			table = bytes(c if c in allowed else replace for c in range(256))
+			if case == 'upper':
+				table = table.upper()
+			elif case == 'lower':
+				table = table.lower()
+			self.translate_tables[key] = (allowed, table)
+		return self.translate_tables[key]
 	
 	
 	def remove_description(self):
@@ -218,10 +302,9 @@ class fasta_clean_and_track_problems:
 			self.cleaned_descriptions_count = 0
 		
 		# Keep count if we actually cleaned something
-		if len(self.header.split(' ')) > 1:
+		if b' ' in self.header:
 			self.cleaned_descriptions()
-		
-		self.header = self.header.split(' ')[0]
+			self.header = self.header.split(b' ', 1)[0]
 	
 	
 	def fix_internal_stop(self, replace_with):
@@ -229,29 +312,24 @@ class fasta_clean_and_track_problems:
 			self.internal_stop_seq_count = 0
 			self.internal_stop_count = 0
 		
-		# Track how many internal stop codons we find in this seq
-		self.stop_count = 0
-		
-		self.seq_split = list(self.seq)
-		for i in range(len(self.seq_split)-1): # Dont check last pos
-			if self.seq_split[i] == '*':
-				self.seq_split[i] = replace_with
-				self.stop_count += 1
-				self.found_internal_stop(self.header)
-		self.seq = ''.join(self.seq_split)
-		
-		# Print info
+		# Track how many internal stop codons we find in this seq (dont check last pos)
+		self.stop_count = self.seq.count(b'*', 0, len(self.seq)-1)
 		if self.stop_count > 0:
-			logging.info('Found %s internal stop codon/s in %s', self.stop_count, self.header)
+			self.seq = self.seq[:-1].replace(b'*', replace_with.encode()) + self.seq[-1:]
+			self.found_internal_stop(self.header, self.stop_count)
+			
+			# Print info
+			logging.info('Found %s internal stop codon/s in %s', self.stop_count, self.header.decode('latin-1'))
 	
 	
 	def remove_stop(self):
-		if self.seq[-1] == '*':
+		if self.seq.endswith(b'*'):
 			self.seq = self.seq[:-1]
 	
 	
 	def add_prefix(self, prefix):
-		self.header = prefix + self.header
+		if prefix:
+			self.header = prefix.encode() + self.header
 	
 	
 	def seq_to_upper(self):
@@ -266,28 +344,56 @@ class fasta_clean_and_track_problems:
 	########################
 	## Tracking functions ##
 	########################
-	def found_bad_header_char(self, header, header_char):
+	def found_bad_header_chars(self, header, header_chars):
 		if header not in self.bad_header_headers:
-			self.bad_header_headers.append(header)
+			self.bad_header_headers.add(header)
 			self.replaced_header_count += 1
-		self.bad_header_chars.append(header_char)
-		self.replaced_header_chars_count += 1
+		self.bad_header_chars.update(header_chars)
+		self.replaced_header_chars_count += len(header_chars)
 	
-	def found_bad_seq_char(self, header, seq_char):
+	def found_bad_seq_chars(self, header, seq_chars):
 		if header not in self.bad_seq_headers:
-			self.bad_seq_headers.append(header)
+			self.bad_seq_headers.add(header)
 			self.replaced_seq_count += 1
-		self.bad_seq_chars.append(seq_char)
-		self.replaced_seq_chars_count += 1
+		self.bad_seq_chars.update(seq_chars)
+		self.replaced_seq_chars_count += len(seq_chars)
 	
 	def cleaned_descriptions(self):
 		self.cleaned_descriptions_count += 1
 	
-	def found_internal_stop(self, header):
+	def found_internal_stop(self, header, stop_count=1):
 		if header not in self.internal_stop_headers:
-			self.internal_stop_headers.append(header)
-                        self.internal_stop_seq_count += 1
-                self.internal_stop_count += 1
+			self.internal_stop_headers.add(header)
+			self.internal_stop_seq_count += 1
+		self.internal_stop_count += stop_count
+	
+	
+	def merge_stats(self, other):
+		'''
+		Add the stats from another fasta_clean_and_track_problems object (e.g. from a worker process).
+		Headers seen by both objects are only counted once (same as running on the combined input).
+		'''
+		self.entry_count += other.entry_count
+		
+		if other.replaced_header_count is not None:
+			self.bad_header_headers.update(other.bad_header_headers)
+			self.bad_header_chars.update(other.bad_header_chars)
+			self.replaced_header_count = len(self.bad_header_headers)
+			self.replaced_header_chars_count = (self.replaced_header_chars_count or 0) + other.replaced_header_chars_count
+		
+		if other.replaced_seq_count is not None:
+			self.bad_seq_headers.update(other.bad_seq_headers)
+			self.bad_seq_chars.update(other.bad_seq_chars)
+			self.replaced_seq_count = len(self.bad_seq_headers)
+			self.replaced_seq_chars_count = (self.replaced_seq_chars_count or 0) + other.replaced_seq_chars_count
+		
+		if other.cleaned_descriptions_count is not None:
+			self.cleaned_descriptions_count = (self.cleaned_descriptions_count or 0) + other.cleaned_descriptions_count
+		
+		if other.internal_stop_seq_count is not None:
+			self.internal_stop_headers.update(other.internal_stop_headers)
+			self.internal_stop_seq_count = len(self.internal_stop_headers)
+			self.internal_stop_count = (self.internal_stop_count or 0) + other.internal_stop_count
 	
 	
 	#################
@@ -296,9 +402,9 @@ class fasta_clean_and_track_problems:
 	def print_cleaning_stats(self):
 		logging.info('STATS - Processed %s fasta sequences', self.entry_count)
 		if self.replaced_header_count is not None:
-			logging.info('STATS - Cleaned %s problematic headers with %s problematic characters - %s', self.replaced_header_count, self.replaced_header_chars_count, set(self.bad_header_chars))
+			logging.info('STATS - Cleaned %s problematic headers with %s problematic characters - %s', self.replaced_header_count, self.replaced_header_chars_count, _char_set(self.bad_header_chars))
 		if self.replaced_seq_count is not None:
-			logging.info('STATS - Cleaned %s problematic sequences with %s problematic characters - %s', self.replaced_seq_count, self.replaced_seq_chars_count, set(self.bad_seq_chars))
+			logging.info('STATS - Cleaned %s problematic sequences with %s problematic characters - %s', self.replaced_seq_count, self.replaced_seq_chars_count, _char_set(self.bad_seq_chars))
 		if self.cleaned_descriptions_count is not None:
 			logging.info('STATS - Cleaned %s descriptions from fasta headers', self.cleaned_descriptions_count)
 		if self.internal_stop_seq_count is not None:
@@ -306,24 +412,11 @@ class fasta_clean_and_track_problems:
 
 
 
-def fasta_iter(fh):
-    	"""
-    	Given a fasta file. yield tuples of header, sequence
-	Clears description from seq name.
-	
-	From: https://www.biostars.org/p/710/
-	Updated: 11/09/2018
-	Version: 0.2
-	"""
-    	# ditch the boolean (x[0]) and just keep the header or sequence since
-    	# we know they alternate.
-    	faiter = (x[1] for x in groupby(fh, lambda line: line[0] == ">"))
-    	for header in faiter:
-        	# drop the ">" and description
-        	header = header.next()[1:].strip()
-        	# join all sequence lines to one.
-        	seq = "".join(s.strip() for s in faiter.next())
-        	yield header, seq
+def _char_set(chars):
+	'''
+	Set of single character strings from bytes (or a Counter of byte values).
+	'''
+	return set(chr(c) for c in chars)
 
 
 if __name__ == '__main__':
@@ -1,11 +1,13 @@
-#!/usr/bin/env python2
+#!/usr/bin/env python3
 DESCRIPTION = '''
 Returns protein sequences that dont have internal stop codons.
 Can also invert the results i.e. return sequences that DO have internal stop codons.
 '''
 import sys
+import os
 import argparse
-from itertools import groupby
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'Python'))
+from src.fastx import fasta_iter
 
 # Pass command line arguments. 
 def main():
@@ -40,26 +42,5 @@ def drop_seqs_with_internal_stop_codons(in_fasta, out_fasta, invert):
 			out_fasta.write(seq + '\n')
 
 
-
-def fasta_iter(fh):
-    	"""
-    	Given a fasta file. yield tuples of header, sequence
-	Clears description from seq name.
-	
-	From: https://www.biostars.org/p/710/
-	Updated: 11/09/2018
-	Version: 0.2
-	"""
-    	# ditch the boolean (x[0]) and just keep the header or sequence since
-    	# we know they alternate.
-    	faiter = (x[1] for x in groupby(fh, lambda line: line[0] == ">"))
-    	for header in faiter:
-        	# drop the ">" and description
-        	header = header.next()[1:].strip().split(' ')[0]
-        	# join all sequence lines to one.
-        	seq = "".join(s.strip() for s in faiter.next())
-        	yield header, seq
-
-
 if __name__ == '__main__':
 	main()
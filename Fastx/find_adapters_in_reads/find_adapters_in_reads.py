@@ -1,23 +1,44 @@
-#!/usr/bin/env python2
+#!/usr/bin/env python3
 DESCRIPTION = '''
-Checks the top 1M lines of a compressed/uncompressed read file for the presence of adapters.
+Checks the top --number_reads reads of a compressed/uncompressed read file for the presence of adapters.
+
+--read_stats will write read length and per-position quality histograms of the reads
+checked in each file (collected in the same pass over the reads).
+
+--sample will randomly sample --number_reads reads from across each file instead (without reading
+the whole file; except for normal gzip files which can not be seeked, use bgzip to avoid this).
+
+All adapter k-mers are indexed once, so each read is checked for all adapters with a few dict
+lookups. Use --threads N to search N files at once.
+
+--max_mismatches N will also count reads with an adapter that has up to N mismatches
+(substitutions only; no indels). The number of reads found with each number of
+mismatches is reported after the adapter name.
 '''
 import sys
 import argparse
 import logging
 import os.path
-import gzip
-from itertools import groupby
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'Python'))
+from src.fastx import fasta_records, fastq_sample, FastqReader, FastqStats
+from src.seqsearch import KmerIndex, MismatchMatcher
+from src.files import File
+from src.parallel import ordered_map
 
 ## Pass arguments.
 def main():
 	# Pass command line arguments. 
 	parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter, description=DESCRIPTION)
-	parser.add_argument('-f', '--fastq', metavar='reads.fastq.gz', type=lambda x: __pass_file_check_compression(parser, x), required=True, nargs='+', help='Input fastq file/s (can be gziped)')
+	parser.add_argument('-f', '--fastq', metavar='reads.fastq.gz', type=lambda x: __pass_file_check_exists(parser, x), required=True, nargs='+', help='Input fastq file/s (can be gziped)')
 	parser.add_argument('-a', '--adapters', type=argparse.FileType('r'), required=True, help='Adapter sequences to search for in fastq file/s')
 	parser.add_argument('-o', '--adapters_out', default=None, type=argparse.FileType('w'), required=False, help='Adapter sequences found in fastq file/s')
 	parser.add_argument('-n', '--number_reads', default=200000, type=int, required=False, help='Number of reads to check (default: %(default)s)')
 	parser.add_argument('-r', '--report_read_count', default=1, type=int, required=False, help='Number of reads (across all files) with an adapter needed before that adapter is printed to output adapter file (default: %(default)s)')
+	parser.add_argument('-m', '--max_mismatches', default=0, type=int, required=False, help='Max number of mismatches allowed between an adapter and a read (default: %(default)s)')
+	parser.add_argument('-s', '--sample', action='store_true', required=False, help='Randomly sample --number_reads reads from each file (default: first --number_reads reads)')
+	parser.add_argument('--seed', default=None, type=int, required=False, help='Random seed for --sample (default: %(default)s)')
+	parser.add_argument('-t', '--threads', default=1, type=int, required=False, help='Number of files to search at once (default: %(default)s)')
+	parser.add_argument('--read_stats', default=None, type=argparse.FileType('w'), required=False, help='Write read length and per-position quality histograms of the reads checked in each file (default: %(default)s)')
 	parser.add_argument('-q', '--quiet', action='store_true', required=False, help='Dont print any info to stdout (default: %(default)s)')
 	parser.add_argument('--debug', action='store_true', required=False, help='Print DEBUG info (default: %(default)s)')
 	args = parser.parse_args()
@@ -32,106 +53,141 @@ def main():
 	
 	logging.debug('%s', args) ## DEBUG
 	
+	if args.max_mismatches < 0:
+		parser.error('--max_mismatches must be >= 0')
+	if args.threads < 1:
+		parser.error('--threads must be >= 1')
+	
 	# Load adapter seqs into a list. This is just to preserve order.
-	adapters = [[x, y] for x, y in fasta_iter(args.adapters)]
+	adapters = [[x.split(b' ', 1)[0].decode(), y] for x, y in fasta_records(args.adapters)]
 	logging.debug('%s', adapters) ## DEBUG
 	
-	search_fastq_files_for_adapters(args.fastq, adapters, args.number_reads, args.report_read_count, args.adapters_out)
+	search_fastq_files_for_adapters(args.fastq, adapters, args.number_reads, args.report_read_count, args.adapters_out, 
+			args.max_mismatches, args.sample, args.seed, args.threads, args.read_stats)
 	
 	
 
 
-def search_fastq_files_for_adapters(fastq_fh_list, adapters, number_reads_to_process, report_read_count, adapters_out):
+def search_fastq_files_for_adapters(fastq_files, adapters, number_reads_to_process, report_read_count, adapters_out, max_mismatches=0, sample=False, seed=None, threads=1, read_stats_out=None):
 	'''
 	Search fo each adapter in the given fastq files.
 	Writes the adapters found in the fastq files to a file.
+	
+	Files are searched in parallel (threads > 1) in a pool of worker processes (src.parallel.ordered_map()).
+	Per-file counts are reported (in the order the files were given) and merged into the total counts.
+	Read stats (collected in the same pass) are written to read_stats_out (if given).
 	'''
+	adapter_seqs = [y for x, y in adapters]
 	
-	total_read_count = {x:0 for x, y in adapters}
+	# Build the adapter index once: k-mer index for exact matches OR
+	# bit-parallel search for all adapters at once (allowing mismatches)
+	if max_mismatches > 0:
+		matcher = MismatchMatcher(adapter_seqs, max_mismatches)
+	else:
+		matcher = KmerIndex(adapter_seqs)
 	
-	for fastq_fh in fastq_fh_list:
-		logging.info('') ## INFO
-		logging.info('Processing file: %s', fastq_fh.name) ## INFO
+	search_args = (matcher, number_reads_to_process, max_mismatches, sample, seed, read_stats_out is not None)
+	if threads > 1:
+		results = ordered_map(search_fastq_file, ((x,) + search_args for x in fastq_files), threads)
+	else:
+		results = (search_fastq_file(x, *search_args) for x in fastq_files)
+	
+	total_read_count = {x:0 for x, y in adapters}
+	for fastq_file, reads_seen, read_count, mismatch_count, stats in results:
+		if stats is not None:
+			stats.write(read_stats_out, fastq_file)
 		
-		reads_seen = 0
-		read_count = {x:0 for x, y in adapters}
+		logging.info('') ## INFO
+		logging.info('Processing file: %s', fastq_file) ## INFO
+		logging.debug('Reads checked: %s', reads_seen) ## DEBUG
 		
-		# Take just the 'sequence' from each passed read
-		for read_name, read_seq, read_opt, read_qual in fastq_iter(fastq_fh):
-			
-			# Check for each adapter in read sequence
-			for adapter_name, adapter_seq in adapters:
-				if adapter_seq in read_seq:
-					total_read_count[adapter_name] += 1
-					read_count[adapter_name] += 1
-			
-			# Break bottom loop if we have checked enough reads.
-			reads_seen += 1
-			if reads_seen == number_reads_to_process:
-				break
+		# Counts per adapter name (sum of adapters with the same name; same as counting by name)
+		name_read_count = {x:0 for x, y in adapters}
+		name_mismatch_count = {x:[0] * (max_mismatches + 1) for x, y in adapters}
+		for adapter_index, (adapter_name, adapter_seq) in enumerate(adapters):
+			name_read_count[adapter_name] += read_count[adapter_index]
+			total_read_count[adapter_name] += read_count[adapter_index]
+			for i, x in enumerate(mismatch_count[adapter_index]):
+				name_mismatch_count[adapter_name][i] += x
 		
 		for adapter_name, adapter_seq in adapters:
-			logging.info('\t%s\t%s', read_count[adapter_name], adapter_name) ## INFO
+			if max_mismatches > 0:
+				logging.info('\t%s\t%s\t%s', name_read_count[adapter_name], adapter_name, ','.join('%smm=%s' % (i, x) for i, x in enumerate(name_mismatch_count[adapter_name]))) ## INFO
+			else:
+				logging.info('\t%s\t%s', name_read_count[adapter_name], adapter_name) ## INFO
 	
 	if adapters_out is not None:
 		for adapter_name, adapter_seq in adapters:
 			if total_read_count[adapter_name] >= report_read_count:
 				adapters_out.write('>' + adapter_name + '\n')
-				adapters_out.write(adapter_seq + '\n')
+				adapters_out.write(adapter_seq.decode() + '\n')
 	
 
 
-def __pass_file_check_compression(parser, arg):
+def search_fastq_file(fastq_file, matcher, number_reads_to_process, max_mismatches=0, sample=False, seed=None, read_stats=False):
 	'''
-	Check passed file name exists and opens using gzip when needed. 
+	Search for each adapter (in matcher) in the reads of a single fastq file.
+	
+	Returns:
+		fastq_file, number of reads checked, number of reads with each adapter,
+		number of reads with each adapter with 0..max_mismatches mismatches,
+		FastqStats of the reads checked (or None if read_stats=False).
 	'''
-	if not os.path.exists(arg):
-		parser.error("The file %s does not exist!" % arg)
-	else:
-		## open with gzip if it has the *.gz extension
-		if arg.endswith(".gz"):
-			return gzip.open(arg, 'rb')
-		else:
-			return open(arg, 'r')
+	reads_seen = 0
+	read_count = [0] * len(matcher)
+	mismatch_count = [[0] * (max_mismatches + 1) for x in range(len(matcher))]
+	stats = FastqStats() if read_stats else None
+	
+	# Take just the 'sequence' from each passed read (a block of reads at a time)
+	for read_seqs, read_quals in read_fastq_blocks(fastq_file, number_reads_to_process, sample, seed):
+		if stats is not None:
+			stats.update(read_seqs, read_quals)
+		
+		for read_seq in read_seqs:
+			# Check for each adapter in read sequence
+			if max_mismatches > 0:
+				for adapter_index, mismatches in matcher.best_hits(read_seq).items():
+					read_count[adapter_index] += 1
+					mismatch_count[adapter_index][mismatches] += 1
+			else:
+				for adapter_index in matcher.find_patterns(read_seq):
+					read_count[adapter_index] += 1
+					mismatch_count[adapter_index][0] += 1
+		reads_seen += len(read_seqs)
+	
+	return fastq_file, reads_seen, read_count, mismatch_count, stats
 
 
 
-def fastq_iter(fh):
+def read_fastq_blocks(fastq_file, number_reads_to_process, sample=False, seed=None):
+	'''
+	Yield (seqs, quals) lists for blocks of the first number_reads_to_process reads from fastq_file
+	OR randomly sample number_reads_to_process reads from the file (sample=True).
 	'''
-	Given a fastq file handle, yield a list of lines for 
-	each read.
-	['name', 'sequence', 'optional', 'quality']
+	if sample:
+		records = list(fastq_sample(fastq_file, number_reads_to_process, seed))
+		yield [x[1] for x in records], [x[3] for x in records]
+		return
 	
-	Code from: https://www.biostars.org/p/317524/
+	remaining = number_reads_to_process
+	with File(fastq_file, 'r', binary=True) as fastq_fh:
+		for block in FastqReader(fastq_fh).blocks():
+			yield block.seqs[:remaining], block.quals[:remaining]
+			
+			# Break loop if we have checked enough reads.
+			remaining -= len(block)
+			if remaining <= 0:
+				break
+
+
+
+def __pass_file_check_exists(parser, arg):
+	'''
+	Check passed file name exists (files are opened, using gzip when needed, by each worker).
 	'''
-	n = 4
-	lines = []
-	for line in fh:
-		lines.append(line.rstrip())
-		if len(lines) == n:
-			yield lines
-			lines = []
-
-
-
-def fasta_iter(fh):
-        '''
-        Given a fasta file handle, yield tuples of header, sequence
-        Clears description from seq name.
-        
-        Code from: https://www.biostars.org/p/710/
-        Updated: 07/08/2019
-        Version: 0.2
-        '''
-        # ditch the boolean (x[0]) and just keep the header or sequence since
-        # we know they alternate.
-        faiter = (x[1] for x in groupby(fh, lambda line: line[0] == ">"))
-        for header in faiter:
-                # drop the ">" and description
-                header = header.next()[1:].strip().split(' ')[0]
-                # join all sequence lines to one.
-                seq = "".join(s.strip() for s in faiter.next())
-                yield header, seq
+	if not os.path.exists(arg):
+		parser.error("The file %s does not exist!" % arg)
+	return arg
 
 
 
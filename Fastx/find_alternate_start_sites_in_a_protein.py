@@ -1,4 +1,4 @@
-#!/usr/bin/env python2
+#!/usr/bin/env python3
 DESCRIPTION = '''
 Takes a set of input proteins and outputs the positions of alternate in-frame start positions. 
 i.e. each methionine in the prot seq is an alternate start position.
@@ -6,9 +6,11 @@ i.e. each methionine in the prot seq is an alternate start position.
 Outputs bed coords from each alternative start (methionine) position to the end of the sequence. 
 '''
 import sys
+import os
 import argparse
-from itertools import groupby
 import re
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'Python'))
+from src.fastx import fasta_iter
 
 
 # Pass command line arguments. 
@@ -31,27 +33,5 @@ def find_alternate_start_sites_in_a_protein(fasta_fh, output_fh):
 			output_fh.write(header+'\t'+str(s)+'\t'+str(len(seq))+'\t'+feature_name+'\t0\t+\n')
 
 
-
-
-def fasta_iter(fh):
-    	"""
-    	Given a fasta file. yield tuples of header, sequence
-	Clears description from seq name.
-	
-	From: https://www.biostars.org/p/710/
-	Updated: 11/09/2018
-	Version: 0.2
-	"""
-    	# ditch the boolean (x[0]) and just keep the header or sequence since
-    	# we know they alternate.
-    	faiter = (x[1] for x in groupby(fh, lambda line: line[0] == ">"))
-    	for header in faiter:
-        	# drop the ">" and description
-        	header = header.next()[1:].strip().split(' ')[0]
-        	# join all sequence lines to one.
-        	seq = "".join(s.strip() for s in faiter.next())
-        	yield header, seq
-
-
 if __name__ == '__main__':
 	main()
@@ -1,23 +1,38 @@
-#!/usr/bin/env python2
+#!/usr/bin/env python3
 DESCRIPTION = '''
 Takes a fasta file with long seqs and a fasta file with short sub-seq to search for in the long fasta file.
 Returns a bed formateed file with the indentified subseq matches in each long fasta seq.
 
+All short seqs are compiled into a single Aho-Corasick automaton, so each long seq is
+scanned only once (run time scales with the size of the long seqs, not with
+number of short seqs x size of long seqs).
+
+--max_mismatches N will report matches with up to N mismatches (substitutions only; no indels)
+using a bit-parallel (Shift-And) search of all short seqs at once.
+
 NOTE:
-    - Will search each short seq against each long seq (very intensive and likely will be slow with lots of seqs)
+	- Overlapping matches are reported.
+	- Matching is case sensitive.
+	- --revcomp will also search for the reverse complement of each short seq (in the same pass).
+	- With --revcomp or --max_mismatches the output is bed6 (name, number of mismatches, strand) instead of bed4.
 '''
 import sys
 import os
 import argparse
 import logging
-from itertools import groupby
+import gzip
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'Python'))
+from src.fastx import fasta_records
+from src.seqsearch import AhoCorasick, MismatchMatcher, reverse_complement
 
 # Pass command line arguments. 
 def main():
 	parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter, description=DESCRIPTION)
 	parser.add_argument('-q', '--query', metavar='short.fa', type=lambda x: __parse_file_check_compression(x, 'r'), required=True, help='Short (sub-)seqs fasta file (required)')
-        parser.add_argument('-s', '--subject', metavar='long.fa', type=lambda x: __parse_file_check_compression(x, 'r'), default=sys.stdin, required=False, help='Long seqs fasta file (default: stdin)')
+	parser.add_argument('-s', '--subject', metavar='long.fa', type=lambda x: __parse_file_check_compression(x, 'r'), default=sys.stdin, required=False, help='Long seqs fasta file (default: stdin)')
 	parser.add_argument('-o', '--bed', metavar='output.fasta', type=lambda x: __parse_file_check_compression(x, 'w'), default=sys.stdout, required=False, help='Bed formatted matches of short seqs within long seqs (default: stdout)')
+	parser.add_argument('--revcomp', required=False, action='store_true', help='Also search for the reverse complement of each short seq (default: %(default)s)')
+	parser.add_argument('-m', '--max_mismatches', type=int, default=0, required=False, help='Max number of mismatches allowed in a match (default: %(default)s)')
 	parser.add_argument('--debug', required=False, action='store_true', help='Print DEBUG info (default: %(default)s)')
 	args = parser.parse_args()
 	
@@ -29,73 +44,59 @@ def main():
 
 	logging.debug('%s', args) ## DEBUG
 	
-	find_subseq(args.query, args.subject, args.bed)
+	if args.max_mismatches < 0:
+		parser.error('--max_mismatches must be >= 0')
+	
+	find_subseq(args.query, args.subject, args.bed, args.revcomp, args.max_mismatches)
 
 
 '''
 Find query seqs in long seqs.
 '''
-def find_subseq(query_fasta, subject_fasta, bed_out):
+def find_subseq(query_fasta, subject_fasta, bed_out, revcomp=False, max_mismatches=0):
 	
 	# Get short query seqs.
+	query_headers = []
 	query_seqs = []
-        for header, seq in fasta_iter(query_fasta):
-                query_seqs.append([header, seq])
+	for header, seq in fasta_records(query_fasta):
+		header = header.split(b' ', 1)[0].decode()
+		if not seq:
+			logging.warning('Query %s has no sequence; skipping', header) ## WARNING
+			continue
+		query_headers.append(header)
+		query_seqs.append(seq)
 	query_fasta.close()
-	logging.debug('Query seqs: %s', query_seqs) ## DEBUG
+	logging.debug('Query seqs: %s', list(zip(query_headers, query_seqs))) ## DEBUG
+	
+	# Build the search automaton (or bit vectors) once. Reverse complement queries (--revcomp) are
+	# added as extra patterns so both strands are found in the same scan of the subject.
+	n_queries = len(query_seqs)
+	patterns = list(query_seqs)
+	if revcomp:
+		patterns += [reverse_complement(seq) for seq in query_seqs]
+	if max_mismatches > 0:
+		matcher = MismatchMatcher(patterns, max_mismatches)
+	else:
+		matcher = AhoCorasick(patterns)
+	bed6 = revcomp or max_mismatches > 0
 	
-	# For each long seq search for each of the short seqs.
-	for subject_header, subject_seq in fasta_iter(subject_fasta):
-                for query_header, query_seq in query_seqs:
-			logging.debug('Finding matches for %s in %s', query_seq, subject_seq) ## DEBUG
-			matches = find_matches(query_seq, subject_seq)
-			logging.debug('Matches found: %s', matches) ## DEBUG
-			for start, end in matches:
-				bed_out.write(subject_header+"\t"+str(start)+"\t"+str(end)+"\t"+query_header+"\n")
+	# Scan each long seq once for all of the short seqs.
+	for subject_header, subject_seq in fasta_records(subject_fasta):
+		subject_header = subject_header.split(b' ', 1)[0].decode()
+		logging.debug('Finding matches in %s', subject_header) ## DEBUG
+		
+		# Hits are reported in query order (then strand, then position).
+		matches = sorted((hit[2] % n_queries, hit[2] >= n_queries, hit[0], hit[1], hit[3] if max_mismatches > 0 else 0) for hit in matcher.find_all(subject_seq))
+		logging.debug('Matches found: %s', matches) ## DEBUG
+		for query_index, minus_strand, start, end, mismatches in matches:
+			if bed6:
+				bed_out.write(subject_header+"\t"+str(start)+"\t"+str(end)+"\t"+query_headers[query_index]+"\t"+str(mismatches)+"\t"+('-' if minus_strand else '+')+"\n")
+			else:
+				bed_out.write(subject_header+"\t"+str(start)+"\t"+str(end)+"\t"+query_headers[query_index]+"\n")
 	subject_fasta.close()
 	bed_out.close()
 
 
-'''
-Find all matches between query string and subject string.
-Returns start and end index of match (already bed formatted coords)
-
-Based on code from: https://stackoverflow.com/questions/3873361/finding-multiple-occurrences-of-a-string-within-a-string-in-python
-
-NOTE:
-        - Allows overlapping hits
-'''
-def find_matches(query, subject):
-	matches = []
-	index = 0
-	while index < len(subject):
-		index = subject.find(query, index)
-		if index == -1:
-			break
-		matches.append([index, index+len(query)])
-		index += 1
-	return matches
-
-
-
-def fasta_iter(fh):
-    	"""
-    	Given a fasta file. yield tuples of header, sequence
-	Clears description from seq name.
-	
-	From: https://www.biostars.org/p/710/
-	Updated: 11/09/2018
-	Version: 0.2
-	"""
-    	# ditch the boolean (x[0]) and just keep the header or sequence since
-    	# we know they alternate.
-    	faiter = (x[1] for x in groupby(fh, lambda line: line[0] == ">"))
-    	for header in faiter:
-        	# drop the ">" and description
-        	header = header.next()[1:].strip().split(' ')[0]
-        	# join all sequence lines to one.
-        	seq = "".join(s.strip() for s in faiter.next())
-        	yield header, seq
 
 
 def __parse_file_check_compression(fh, mode='r'):
@@ -111,7 +112,7 @@ def __parse_file_check_compression(fh, mode='r'):
 	## open with gzip if it has the *.gz extension, else open normally (including stdin)
 	try:
 		if fh.endswith(".gz"):
-			return gzip.open(fh, mode+'b')
+			return gzip.open(fh, mode+'t')
 		else:
 			return open(fh, mode)
 	except IOError as e:
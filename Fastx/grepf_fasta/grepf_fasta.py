@@ -1,39 +1,88 @@
-#!/usr/bin/env python2
+#!/usr/bin/env python3
 DESCRIPTION = '''
 Takes a fasta file (either a file or from stadin) and returns only the sequecnes which match the names provided.
+
+NOTE:
+	- With --indexed a samtools compatible .fai index (plus a .gzi index for bgzip compressed
+	   input) is built (or reused if it already exists) and each sequence is read directly
+	   from its position in the file, instead of streaming the whole file.
+	- --indexed falls back to streaming the file for stdin and input that can not be indexed
+	   (e.g. normal gzip compressed files or records with uneven line lengths).
 '''
 import sys
+import os
 import argparse
-from itertools import groupby
+import logging
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'Python'))
+from src.fastx import fasta_iter
+from src.faidx import FastaIndex, FastaIndexError
+from src.files import File
 
 # Pass command line arguments. 
 def main():
 	parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter, description=DESCRIPTION)
 	parser.add_argument('-f', '-s', '--seq_names', metavar='seq_names.txt', type=argparse.FileType('r'), required=True, help='Return sequences from list')
-	parser.add_argument('-i', '--fasta_in', metavar='input.fasta', type=argparse.FileType('r'), default=sys.stdin, required=False, help='Input fasta file (default: stdin)')
+	parser.add_argument('-i', '--fasta_in', metavar='input.fasta', type=str, default=None, required=False, help='Input [gzip/bgzip] fasta file (default: stdin)')
 	parser.add_argument('-o', '--fasta_out', metavar='output.fasta', type=argparse.FileType('w'), default=sys.stdout, required=False, help='Output (filtered) fasta file (default: stdout)')
 	parser.add_argument('-v', '--invert', action='store_true', required=False, help='Return sequences not in --seq_names (default: %(default)s)')
+	parser.add_argument('-x', '--indexed', action='store_true', required=False, help='Use (or build) a .fai/.gzi index to read sequences directly from --fasta_in (default: %(default)s)')
+	parser.add_argument('--debug', action='store_true', required=False, help='Print DEBUG info (default: %(default)s)')
 	args = parser.parse_args()
 	
-	get_fasta(args.fasta_in, args.fasta_out, args.seq_names, args.invert)
+	# Set up basic debugger
+	logFormat = "[%(levelname)s]: %(message)s"
+	logging.basicConfig(format=logFormat, stream=sys.stderr, level=logging.INFO)
+	if args.debug:
+		logging.getLogger().setLevel(logging.DEBUG)
+	
+	logging.debug('%s', args) ## DEBUG
+	
+	## '-' == stdin (same as no -i/--fasta_in)
+	if args.fasta_in == '-':
+		args.fasta_in = None
+	if args.fasta_in is not None and not os.path.exists(args.fasta_in):
+		parser.error("The file %s does not exist!" % args.fasta_in)
+	
+	seq_names = load_seq_names(args.seq_names)
+	
+	# Read sequences directly using the fasta index (if possible)
+	if args.indexed and args.fasta_in is not None:
+		try:
+			with FastaIndex(args.fasta_in) as fai:
+				get_fasta_indexed(fai, args.fasta_out, seq_names, args.invert)
+			return
+		except FastaIndexError as e:
+			logging.warning('Can not index %s (%s) - streaming whole file instead', args.fasta_in, e) ## WARNING
+	
+	if args.fasta_in is None:
+		get_fasta(sys.stdin, args.fasta_out, seq_names, args.invert)
+	else:
+		with File(args.fasta_in, 'r') as in_fasta:
+			get_fasta(in_fasta, args.fasta_out, seq_names, args.invert)
 
 
 '''
-Write onlt the target sequecnes in 'seq_names'
+Load seq names to return.
 '''
-def get_fasta(in_fasta, out_fasta, seq_names_fh, invert):
-	
-	# Get seq names
+def load_seq_names(seq_names_fh):
 	seq_names = []
 	for line in seq_names_fh:
 		line = line.strip()
 		if not line or line.startswith('#'): # Ignore lines thta are blank or start with '#'
 			continue
 		seq_names.append(line)
-	seq_names = set(seq_names)
+	return set(seq_names)
+
+
+'''
+Write onlt the target sequecnes in 'seq_names'
+Seq name is the header up to the first whitespace (same as samtools faidx and get_fasta_indexed()).
+'''
+def get_fasta(in_fasta, out_fasta, seq_names, invert):
 	
 	# Pass fasta file
-	for header, seq in fasta_iter(in_fasta):
+	for header, seq in fasta_iter(in_fasta, keep_description=True):
+		header = header.split(None, 1)[0] if header.strip() else ''
 		if header in seq_names and not invert: ## If header in seq_names and we arent inverting the search (i.e. we want the seqs in seq_names).
 			out_fasta.write('>' + header + '\n')
 			out_fasta.write(seq + '\n')
@@ -42,25 +91,15 @@ def get_fasta(in_fasta, out_fasta, seq_names_fh, invert):
 			out_fasta.write(seq + '\n')
 
 
-
-def fasta_iter(fh):
-    	"""
-    	Given a fasta file. yield tuples of header, sequence
-	Clears description from seq name.
-	
-	From: https://www.biostars.org/p/710/
-	Updated: 11/09/2018
-	Version: 0.2
-	"""
-    	# ditch the boolean (x[0]) and just keep the header or sequence since
-    	# we know they alternate.
-    	faiter = (x[1] for x in groupby(fh, lambda line: line[0] == ">"))
-    	for header in faiter:
-        	# drop the ">" and description
-        	header = header.next()[1:].strip().split(' ')[0]
-        	# join all sequence lines to one.
-        	seq = "".join(s.strip() for s in faiter.next())
-        	yield header, seq
+'''
+Write only the target sequences in 'seq_names' by seeking to each sequence using the fasta index.
+Sequences are written in the order they appear in the fasta file (same as get_fasta()).
+'''
+def get_fasta_indexed(fai, out_fasta, seq_names, invert):
+	for header in fai:
+		if (header in seq_names) != invert:
+			out_fasta.write('>' + header + '\n')
+			out_fasta.write(fai.fetch(header).decode() + '\n')
 
 
 if __name__ == '__main__':
@@ -3,8 +3,18 @@
 cat test_data/test.fasta | python grepf_fasta.py -s test_data/test.names | md5sum
 2a64664b025bcf339ee4fbac27dce012  -
 
+python grepf_fasta.py -s test_data/test.names -i - < test_data/test.fasta | md5sum
+2a64664b025bcf339ee4fbac27dce012  -
+
 grep -f test_data/test.names -A 1 test_data/test.fasta | grep -v '\-\-' | awk '{print $1}' | md5sum
 2a64664b025bcf339ee4fbac27dce012  -
 
 
 
+## --indexed writes test.fasta.fai next to the fasta, so run it on a copy in a temp dir
+TMP_DIR=$(mktemp -d)
+cp test_data/test.fasta "$TMP_DIR/"
+python grepf_fasta.py -s test_data/test.names -i "$TMP_DIR/test.fasta" --indexed | md5sum
+2a64664b025bcf339ee4fbac27dce012  -
+rm -rf "$TMP_DIR"
+
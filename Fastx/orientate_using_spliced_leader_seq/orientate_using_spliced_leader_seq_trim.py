@@ -1,4 +1,4 @@
-#!/usr/bin/python
+#!/usr/bin/env python3
 DESCRIPTION = '''
 Will orientate given sequences using a provided spliced leader seq (i.e. will revcomp seq if needed to get spliced leader seq into correct orientation
 Will also trim SL from sequence.
@@ -10,12 +10,19 @@ Step:
 		2.5 Trim SL + 5-prime end of sequence if it has been found
 	If it is not:
 	3. Warn the user, do not output fasta seq.
+
+The RevComp of the spliced leader is searched for in the fwd seq (within max_from_end of the
+3-prime end) so only seqs that need to be RevComp'ed are. Use --threads N to process
+large files in N processes (output order is kept).
 '''
 import sys
+import os
 import argparse
 import logging
-from itertools import groupby
-from Bio.Seq import Seq
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'Python'))
+from src.fastx import fasta_records, fasta_chunks, fasta_chunk_records, CHUNK_SIZE
+from src.seqsearch import reverse_complement
+from src.parallel import ordered_map
 
 
 # Pass command line arguments. 
@@ -25,6 +32,8 @@ def main():
 	parser.add_argument('-o', '--fasta_out', metavar='out.fasta', type=argparse.FileType('w'), default=sys.stdout, required=False, help='Output file (default: %(default)s)')
 	parser.add_argument('-s', '--spliced_leader', metavar='ATGC', type=str, required=True, help='Spliced leader sequence (default: %(default)s)')
 	parser.add_argument('-m', '--max_from_end', metavar=50, type=int, required=True, help='Max distance of spliced leader from 5-prime end of sequence (default: %(default)s)')
+	parser.add_argument('-t', '--threads', type=int, default=1, required=False, help='Number of processes to use (default: %(default)s)')
+	parser.add_argument('--chunk_size', type=int, default=CHUNK_SIZE, required=False, help='Size (bytes) of the fasta chunks sent to each process when --threads > 1 (default: %(default)s)')
 	parser.add_argument('--debug', action='store_true', required=False, help='Print DEBUG info (default: %(default)s)')
 	args = parser.parse_args()
 	
@@ -37,51 +46,96 @@ def main():
 	
 	logging.debug('%s', args) ## DEBUG
 	
-	orientate_using_spliced_leader_seq(args.fasta_in, args.fasta_out, args.spliced_leader, args.max_from_end)
+	if args.threads < 1:
+		parser.error('--threads must be >= 1')
+	if args.chunk_size < 1:
+		parser.error('--chunk_size must be >= 1')
+	
+	orientate_using_spliced_leader_seq(args.fasta_in, args.fasta_out, args.spliced_leader, args.max_from_end, args.threads, args.chunk_size)
+
+
+
+def orientate_using_spliced_leader_seq(in_fasta, out_fasta, spliced_leader, max_from_end, threads=1, chunk_size=CHUNK_SIZE):
+	spliced_leader = spliced_leader.encode()
+	
+	## Write bytes straight to the underlying binary buffer (e.g. sys.stdout.buffer)
+	out_fasta = getattr(out_fasta, 'buffer', out_fasta)
+	
+	if threads > 1:
+		orientate_parallel(in_fasta, out_fasta, spliced_leader, max_from_end, threads, chunk_size)
+		return
+	
+	for header, seq, seq_out in orientate_seqs(fasta_records(in_fasta), spliced_leader, max_from_end):
+		if seq_out is None:
+			logging.info('No leader seq found in %s: %s', header.decode(), seq.decode()) ## INFO
+		else:
+			out_fasta.write(b'>' + header + b'\n' + seq_out + b'\n')
 
 
 
-def orientate_using_spliced_leader_seq(in_fasta, out_fasta, spliced_leader, max_from_end):
+def orientate_seqs(records, spliced_leader, max_from_end):
+	'''
+	Orientate (header, seq) records (bytes). Yields (header, seq, orientated seq or None if no leader seq was found).
+	
+	The spliced leader is RevComp'ed once, and both the leader and its RevComp are
+	searched for in the fwd seq (only within max_from_end of the relevant end):
+		- Leader at position <= max_from_end from the 5-prime end of the seq (first match)
+		- RevComp leader at position <= max_from_end from the 3-prime end of the seq (last match;
+		   == first match of the leader in the RevComp seq)
+	'''
 	spliced_leader_length = len(spliced_leader)
-	for header, seq in fasta_iter(in_fasta):
-		if spliced_leader in seq:
-			pos = seq.index(spliced_leader)+1
-			if pos <= max_from_end:
-				out_fasta.write('>' + header + '\n')
-				out_fasta.write(seq[pos+(spliced_leader_length-1):] + '\n')
-				logging.debug('Fwd - Leader seq found at position %s in %s: %s', pos, header, seq) ## DEBUG
-				continue
+	spliced_leader_rc = reverse_complement(spliced_leader)
+	for header, seq in records:
+		header = header.split(b' ', 1)[0]
+		if max_from_end < 1:
+			yield header, seq, None
+			continue
 		
-		seq_rc = str(Seq(seq).reverse_complement())
-		if spliced_leader in seq_rc:
-			pos = seq_rc.index(spliced_leader)+1
-			if pos <= max_from_end:
-				out_fasta.write('>' + header + '\n')
-				out_fasta.write(seq_rc[pos+(spliced_leader_length-1):] + '\n')
-				logging.debug('RevComp - Leader seq found at position %s in %s: %s', pos, header, seq_rc) ## DEBUG
-				continue
+		i = seq.find(spliced_leader, 0, max_from_end-1+spliced_leader_length)
+		if i != -1:
+			## Trim SL + 5-prime end of sequence
+			logging.debug('Fwd - Leader seq found at position %s in %s: %s', i+1, header.decode(), seq.decode()) ## DEBUG
+			yield header, seq, seq[i+spliced_leader_length:]
+			continue
 		
-		logging.info('No leader seq found in %s: %s', header, seq) ## INFO
+		j = seq.rfind(spliced_leader_rc, max(0, len(seq)-spliced_leader_length-max_from_end+1))
+		if j != -1:
+			## Trim SL + 5-prime end of the RevComp sequence (== 3-prime end of the fwd sequence; only the kept part is RevComp'ed)
+			seq_out = reverse_complement(seq[:j])
+			logging.debug('RevComp - Leader seq found at position %s in %s: %s', len(seq)-j-spliced_leader_length+1, header.decode(), seq_out.decode()) ## DEBUG
+			yield header, seq, seq_out
+			continue
+		
+		yield header, seq, None
 
 
-def fasta_iter(fh):
-    	"""
-    	Given a fasta file. yield tuples of header, sequence
-	Clears description from seq name.
-	
-	From: https://www.biostars.org/p/710/
-	Updated: 11/09/2018
-	Version: 0.2
-	"""
-    	# ditch the boolean (x[0]) and just keep the header or sequence since
-    	# we know they alternate.
-    	faiter = (x[1] for x in groupby(fh, lambda line: line[0] == ">"))
-    	for header in faiter:
-        	# drop the ">" and description
-        	header = header.next()[1:].strip().split(' ')[0]
-        	# join all sequence lines to one.
-        	seq = "".join(s.strip() for s in faiter.next())
-        	yield header, seq
+
+def orientate_parallel(in_fasta, out_fasta, spliced_leader, max_from_end, threads, chunk_size):
+	'''
+	Split in_fasta into record-aligned chunks and orientate them in a pool of
+	worker processes (src.parallel.ordered_map()). Chunks are written (and seqs
+	without a leader seq reported) in the original order.
+	'''
+	parts = ((chunk, spliced_leader, max_from_end) for chunk in fasta_chunks(in_fasta, chunk_size))
+	for orientated, not_found in ordered_map(_orientate_chunk, parts, threads, log_format='#[%(levelname)s]: %(message)s'):
+		out_fasta.write(orientated)
+		for header, seq in not_found:
+			logging.info('No leader seq found in %s: %s', header.decode(), seq.decode()) ## INFO
+
+
+def _orientate_chunk(chunk, spliced_leader, max_from_end):
+	'''
+	Worker: orientate a chunk of fasta records.
+	Returns (orientated fasta as bytes, list of (header, seq) without a leader seq).
+	'''
+	orientated = []
+	not_found = []
+	for header, seq, seq_out in orientate_seqs(fasta_chunk_records(chunk), spliced_leader, max_from_end):
+		if seq_out is None:
+			not_found.append((header, seq))
+		else:
+			orientated.append(b'>' + header + b'\n' + seq_out + b'\n')
+	return b''.join(orientated), not_found
 
 
 if __name__ == '__main__':
@@ -0,0 +1,3 @@
+./orientate_using_spliced_leader_seq.py -s CCGGCTTTTCTG -m 16 -i test_data/seqs.fa 2>/dev/null | diff - test_data/seqs.SL_orientated.fa
+./orientate_using_spliced_leader_seq_trim.py -s CCGGCTTTTCTG -m 16 -i test_data/seqs.fa 2>/dev/null | diff - test_data/seqs.SL_orientated_trimmed.fa
+./orientate_using_spliced_leader_seq.py -s CCGGCTTTTCTG -m 16 -i test_data/seqs.fa --threads 2 2>/dev/null | diff - test_data/seqs.SL_orientated.fa
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+'''
+Shared helpers for the benchmark scripts (Table/benchmark, Blast/benchmark).
+
+Each benchmark runs a script (as a subprocess) on synthetic data and writes one JSON
+record per run (wall time, throughput and peak RSS); the records of the different
+benchmarks have the same fields so results can be compared between commits.
+
+Usage (from a script two directories below the repo root):
+	sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'Python'))
+	from src.benchmark import run_command, benchmark_result, write_result
+
+	runs = [run_command(cmd) for _ in range(repeats)]
+	result = benchmark_result('groupby', num_rows, file_mb, runs, cols=10)
+	write_result(out, result)
+
+NOTE:
+	- Peak RSS is the max resident set size of the script process (os.wait4; linux/macOS).
+'''
+import os
+import json
+import math
+import time
+import logging
+import subprocess
+
+
+
+def run_command(cmd):
+	'''
+	Run cmd (list; output discarded). Returns (wall time in seconds, peak RSS in MB, return code).
+	'''
+	logging.debug('Running: %s', ' '.join(cmd)) ## DEBUG
+	with open(os.devnull, 'w') as devnull:
+		start = time.perf_counter()
+		process = subprocess.Popen(cmd, stdout=devnull, stderr=devnull)
+		_, status, rusage = os.wait4(process.pid, 0)
+		seconds = time.perf_counter() - start
+	returncode = os.waitstatus_to_exitcode(status)
+	if returncode != 0:
+		logging.warning('Failed (return code %s): %s', returncode, ' '.join(cmd)) ## WARNING
+	## ru_maxrss is in KB on linux
+	return seconds, rusage.ru_maxrss / 1024.0, returncode
+
+
+
+def benchmark_result(tool, rows, file_mb, runs, **fields):
+	'''
+	Result record for runs (list of run_command() results) of tool on a file of rows
+	lines (file_mb MB); the fastest run is kept. Extra fields (e.g. cols=10) are added
+	to the record.
+	'''
+	seconds = min([x[0] for x in runs])
+	result = {
+		'tool': tool,
+		'rows': rows,
+		'file_mb': round(file_mb, 3),
+		'seconds': round(seconds, 4),
+		'rows_per_sec': round(rows / seconds, 1),
+		'mb_per_sec': round(file_mb / seconds, 3),
+		'peak_rss_mb': round(max([x[1] for x in runs]), 1),
+		'returncode': max([x[2] for x in runs]),
+	}
+	result.update(fields)
+	return result
+
+
+
+def write_result(output_fh, result):
+	'''
+	Write result (dict) as a line of JSON.
+	'''
+	output_fh.write(json.dumps(result, sort_keys=True) + '\n')
+	output_fh.flush()
+
+
+
+def scaling_exponent(points):
+	'''
+	Least squares slope of log(seconds) vs log(rows) for (rows, seconds) points
+	(~1 == linear; None if < 2 sizes).
+	'''
+	points = [(math.log(rows), math.log(seconds)) for rows, seconds in points if seconds > 0]
+	if len(set([x for x, y in points])) < 2:
+		return None
+	mean_x = sum([x for x, y in points]) / len(points)
+	mean_y = sum([y for x, y in points]) / len(points)
+	slope = sum([(x - mean_x) * (y - mean_y) for x, y in points]) / sum([(x - mean_x) ** 2 for x, y in points])
+	return round(slope, 3)
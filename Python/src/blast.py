@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+'''
+Shared BLAST tabular (-outfmt 6) hit parser.
+
+Replaces the per-script outfmt 6 parsers (BLAST_iter()/BLAST_to_dict(), top_hit_iter(),
+the tuple unpacking in blast_hit_coverage.py, etc.). Each line is split once; the
+fields are kept in a __slots__ object with one attribute per column. Numeric columns
+(e.g. evalue, bitscore, qstart) are only converted to int/float when they are
+accessed, so scripts that just group or filter on the ids never pay for the
+conversion of the other columns.
+
+Usage (from a script two directories below the repo root):
+	sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'Python'))
+	from src.blast import blast_iter, blast_groups, parse_outfmt
+
+	columns = parse_outfmt('6 std qlen slen')
+	for query_id, hits in blast_groups(blast_iter(fh, columns)):
+		for hit in hits:
+			if hit.evalue < 1e-5:
+				out.write(hit.line())
+
+NOTE:
+	- The default columns are the 12 'std' columns used by BLAST+, DIAMOND and MMseqs2:
+		qseqid sseqid pident length mismatch gapopen qstart qend sstart send evalue bitscore
+	- Custom column orders are given the same way as to blast (-outfmt "6 qseqid sseqid ... qlen slen");
+	   'std' is expanded to the 12 default columns.
+	- Blank lines and comment lines (starting with '#'; e.g. -outfmt 7) are skipped.
+	- Lines with fewer columns than expected raise BlastFormatError. Extra columns (e.g. qlen slen
+	   when only the std columns are given) are kept (hit[i], hit.line()) but have no attribute.
+	- Columns without a known numeric type (e.g. stitle, staxids) are returned as str.
+	- blast_ranges()/blast_chunks() split a file into parts that only contain whole query
+	   groups (for processing the parts in parallel).
+'''
+import os
+from itertools import groupby
+from operator import attrgetter
+
+
+STD_COLUMNS = ('qseqid', 'sseqid', 'pident', 'length', 'mismatch', 'gapopen',
+	'qstart', 'qend', 'sstart', 'send', 'evalue', 'bitscore')
+
+## Approx. size (bytes) of the parts made by blast_ranges()/blast_chunks().
+CHUNK_SIZE = 16 * 1024 * 1024
+
+## Type of the numeric -outfmt 6 columns (all other columns are str).
+COLUMN_TYPES = {
+	'pident': float, 'ppos': float, 'evalue': float, 'bitscore': float,
+	'qcovs': float, 'qcovhsp': float, 'qcovus': float,
+	'length': int, 'mismatch': int, 'gapopen': int, 'gaps': int,
+	'nident': int, 'positive': int, 'score': int,
+	'qstart': int, 'qend': int, 'sstart': int, 'send': int,
+	'qlen': int, 'slen': int, 'qframe': int, 'sframe': int,
+}
+
+
+class BlastFormatError(Exception):
+	'''
+	Raised when a line does not match the expected columns (or the -outfmt spec is not tabular).
+	'''
+	pass
+
+
+
+class BlastHit(object):
+	'''
+	A single hit (one line of -outfmt 6).
+
+	Columns are attributes (hit.qseqid, hit.evalue, ...). Numeric columns are
+	converted to int/float each time they are accessed (store the value in a local
+	variable if it is used many times). hit[i] is the raw str of column i.
+
+	Use hit_class() to get the class for a custom column order.
+	'''
+	__slots__ = ('fields',)
+	columns = STD_COLUMNS
+
+	def __init__(self, fields):
+		self.fields = fields
+
+	def __getitem__(self, i):
+		return self.fields[i]
+
+	def __len__(self):
+		return len(self.fields)
+
+	def __iter__(self):
+		return iter(self.fields)
+
+	def __repr__(self):
+		return 'BlastHit(%s)' % ', '.join(['%s=%r' % x for x in zip(self.columns, self.fields)])
+
+	def line(self, delim='\t'):
+		'''
+		The hit as a line of text (with newline).
+		'''
+		return delim.join(self.fields) + '\n'
+
+
+## Cache of hit_class() results; tuple of columns: class.
+_HIT_CLASSES = {}
+
+def hit_class(columns=STD_COLUMNS):
+	'''
+	BlastHit subclass with an attribute for each of columns (list of -outfmt 6 column names).
+	'''
+	columns = tuple(columns)
+	cls = _HIT_CLASSES.get(columns)
+	if cls is None:
+		if len(set(columns)) != len(columns):
+			raise BlastFormatError('Duplicate column names in: %s' % ' '.join(columns))
+		attrs = {'__slots__': (), 'columns': columns}
+		for i, name in enumerate(columns):
+			if hasattr(BlastHit, name):
+				raise BlastFormatError('Column name %s can not be used' % name)
+			convert = COLUMN_TYPES.get(name)
+			if convert is None:
+				attrs[name] = property(lambda self, i=i: self.fields[i])
+			else:
+				attrs[name] = property(lambda self, i=i, convert=convert: convert(self.fields[i]))
+		cls = _HIT_CLASSES[columns] = type('BlastHit', (BlastHit,), attrs)
+	return cls
+
+
+
+def parse_outfmt(spec=None):
+	'''
+	Column names from a blast -outfmt spec (e.g. '6 qseqid sseqid ... qlen slen', '6 std qlen slen'
+	or just the column names). None or '6' gives the 12 'std' columns.
+	'''
+	if spec is None:
+		return STD_COLUMNS
+	fields = spec.split() if isinstance(spec, str) else list(spec)
+	if fields and fields[0].isdigit():
+		if fields[0] not in ('6', '7'):
+			raise BlastFormatError('-outfmt %s is not tabular (only 6 or 7 can be parsed)' % fields[0])
+		fields = fields[1:]
+	if not fields:
+		return STD_COLUMNS
+	columns = []
+	for name in fields:
+		if name == 'std':
+			columns.extend(STD_COLUMNS)
+		else:
+			columns.append(name)
+	return tuple(columns)
+
+
+
+def blast_iter(blast_fh, columns=STD_COLUMNS, delim='\t'):
+	'''
+	Yield a BlastHit (see hit_class()) for each line of blast_fh.
+
+	Arguments:
+		blast_fh: File handle with BLAST output "-outfmt 6" (or 7).
+		columns:  Column names, in file order (see parse_outfmt()).
+		delim:    Column delimiter.
+
+	Raises:
+		BlastFormatError if a line has less than len(columns) columns.
+	'''
+	cls = hit_class(columns)
+	num_cols = len(cls.columns)
+	for line_number, line in enumerate(blast_fh, 1):
+		line = line.rstrip('\r\n')
+		if not line or line.startswith('#'):
+			continue
+		fields = line.split(delim)
+		if len(fields) < num_cols:
+			raise BlastFormatError('Line %s has %s columns (expected >= %s: %s): %s' % (line_number, len(fields), num_cols, ' '.join(cls.columns), line))
+		yield cls(fields)
+
+
+
+def blast_groups(hits, column='qseqid'):
+	'''
+	Yield (value, iterator of hits) for each run of hits with the same value in column
+	(itertools.groupby; i.e. hits must be grouped by column, like normal blast output is by qseqid).
+	'''
+	return groupby(hits, key=attrgetter(column))
+
+
+
+def blast_to_dict(hits, column='qseqid', value=None):
+	'''
+	Dict of value in column: list of hits (keys in the order they first appear; hits do not need to be grouped).
+	If value (column name) is given the lists hold just that column of each hit (e.g. value='sseqid').
+	'''
+	get_value = None if value is None else attrgetter(value)
+	blast_dict = {}
+	for key, group in blast_groups(hits, column):
+		if get_value is not None:
+			group = map(get_value, group)
+		blast_dict.setdefault(key, []).extend(group)
+	return blast_dict
+
+
+
+
+def blast_ranges(file_name, chunk_size=CHUNK_SIZE, key_col=0, delim='\t'):
+	'''
+	Yield (start, end) byte ranges of a (plain text) blast file. Each range is about
+	chunk_size bytes, ends at the end of a line and never splits a group of lines with
+	the same value in key_col (0-based; qseqid by default). Only the lines around each
+	boundary are read, so ranges can be handed to other processes to read themselves.
+	'''
+	size = os.path.getsize(file_name)
+	delim = delim.encode()
+	with open(file_name, 'rb') as fh:
+		start = 0
+		while start < size:
+			end = _next_group_start(fh, start + chunk_size, size, key_col, delim)
+			yield start, end
+			start = end
+
+
+
+def read_range(file_name, start, end):
+	'''
+	Text of the byte range start:end of file_name (e.g. from blast_ranges()).
+	'''
+	with open(file_name, 'rb') as fh:
+		fh.seek(start)
+		return fh.read(end - start).decode()
+
+
+
+def blast_chunks(blast_fh, chunk_size=CHUNK_SIZE, key_col=0, delim='\t'):
+	'''
+	Yield chunks of text from blast_fh (text file handle; e.g. stdin or a compressed file)
+	that only contain whole lines and never split a group of lines with the same value
+	in key_col (0-based; qseqid by default). Chunks are about chunk_size characters
+	(bigger if a single group is bigger).
+	'''
+	pending = ''
+	while True:
+		data = blast_fh.read(chunk_size)
+		if not data:
+			break
+		buf = pending + data
+		end = buf.rfind('\n') + 1
+		cut = _last_group_start(buf, end, key_col, delim) if end else 0
+		if cut == 0:
+			pending = buf # Group (or line) bigger than the buffer; keep reading
+			continue
+		pending = buf[cut:]
+		yield buf[:cut]
+	if pending:
+		yield pending
+
+
+
+def _line_key(line, key_col, delim):
+	fields = line.split(delim, key_col + 1)
+	return fields[key_col] if len(fields) > key_col else None
+
+
+
+def _next_group_start(fh, offset, size, key_col, delim):
+	'''
+	Offset of the first line (at or after the line containing offset) whose key
+	differs from the key of the line before it.
+	'''
+	if offset >= size:
+		return size
+	fh.seek(offset - 1)
+	fh.readline() # Skip to the start of the next line (or stay if offset is a line start)
+	line = fh.readline()
+	if not line:
+		return size
+	key = _line_key(line.rstrip(b'\r\n'), key_col, delim)
+	while True:
+		pos = fh.tell()
+		line = fh.readline()
+		if not line:
+			return size
+		if _line_key(line.rstrip(b'\r\n'), key_col, delim) != key:
+			return pos
+
+
+
+def _last_group_start(buf, end, key_col, delim):
+	'''
+	Start of the group containing the last line of buf[:end] (end is just after a newline).
+	Returns 0 if the group starts at (or before) the start of buf.
+	'''
+	line_start = buf.rfind('\n', 0, end - 1) + 1
+	key = _line_key(buf[line_start:end-1].rstrip('\r'), key_col, delim)
+	while line_start > 0:
+		prev_start = buf.rfind('\n', 0, line_start - 1) + 1
+		if _line_key(buf[prev_start:line_start-1].rstrip('\r'), key_col, delim) != key:
+			return line_start
+		line_start = prev_start
+	return 0
@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+'''
+Samtools compatible fasta indexes (.fai) and bgzip block indexes (.gzi).
+
+Lets scripts seek straight to a sequence in a (bgzip compressed) fasta file
+instead of streaming the whole file to find it.
+
+	with FastaIndex('genome.fa.gz') as fai:
+		seq = fai.fetch('chr1')
+
+.fai columns (same as `samtools faidx`):
+	NAME       Name of the sequence (first word of the header)
+	LENGTH     Total length of the sequence, in bases
+	OFFSET     Offset (uncompressed) of the first base of the sequence
+	LINEBASES  Number of bases on each line
+	LINEWIDTH  Number of bytes in each line, including the newline
+
+.gzi (same as `bgzip -i`): little-endian uint64 number of entries, followed by
+a (compressed offset, uncompressed offset) uint64 pair for the start of each
+BGZF block (after the first).
+
+NOTE:
+	- Normal gzip files can not be indexed (only bgzip/BGZF compressed files).
+	- Index files are written next to the fasta file (if possible) and reused if
+	   they are newer than the fasta file.
+'''
+import os
+import zlib
+import struct
+import logging
+from bisect import bisect_right
+from collections import OrderedDict, namedtuple
+
+
+FaiEntry = namedtuple('FaiEntry', ['name', 'length', 'offset', 'linebases', 'linewidth'])
+
+
+class FastaIndexError(Exception):
+	'''
+	Raised when a fasta file can not be indexed (e.g. normal gzip or uneven line lengths).
+	'''
+	pass
+
+
+
+class FastaIndex(object):
+	'''
+	Random access to the sequences in a plain or bgzip compressed fasta file.
+
+	Arguments:
+		fasta_path: Path to the fasta file (plain text or bgzip compressed).
+		build:      Build the .fai/.gzi indexes if they do not exist (or are older than the fasta).
+		write:      Write newly built indexes next to the fasta file.
+
+	Raises:
+		FastaIndexError if the file can not be indexed.
+	'''
+	def __init__(self, fasta_path, build=True, write=True):
+		self.fasta_path = fasta_path
+		self.fai_path = fasta_path + '.fai'
+		self.gzi_path = fasta_path + '.gzi'
+		self.compressed = is_gzip(fasta_path)
+
+		if self.compressed and not is_bgzf(fasta_path):
+			raise FastaIndexError('%s is gzip (not bgzip) compressed and can not be indexed' % fasta_path)
+
+		if self.compressed:
+			if _is_current(self.gzi_path, fasta_path):
+				logging.debug('Loading gzi index: %s', self.gzi_path) ## DEBUG
+				blocks = read_gzi(self.gzi_path)
+			elif build:
+				logging.debug('Building gzi index: %s', self.gzi_path) ## DEBUG
+				blocks = build_gzi(fasta_path)
+				if write:
+					_try_write(write_gzi, self.gzi_path, blocks)
+			else:
+				raise FastaIndexError('%s does not exist' % self.gzi_path)
+			self._fh = BgzfReader(fasta_path, blocks)
+		else:
+			self._fh = open(fasta_path, 'rb')
+
+		try:
+			if _is_current(self.fai_path, fasta_path):
+				logging.debug('Loading fai index: %s', self.fai_path) ## DEBUG
+				self.entries = read_fai(self.fai_path)
+			elif build:
+				logging.debug('Building fai index: %s', self.fai_path) ## DEBUG
+				self._fh.seek(0)
+				self.entries = build_fai(self._fh)
+				if write:
+					_try_write(write_fai, self.fai_path, self.entries)
+			else:
+				raise FastaIndexError('%s does not exist' % self.fai_path)
+		except BaseException:
+			## Dont leak the open fasta file if the index can not be loaded/built
+			self._fh.close()
+			raise
+
+	def __enter__(self):
+		return self
+	def __exit__(self, type, value, traceback):
+		self.close()
+
+	def __contains__(self, name):
+		return name in self.entries
+
+	def __iter__(self):
+		## Names in the order they appear in the fasta file
+		return iter(self.entries)
+
+	def __len__(self):
+		return len(self.entries)
+
+	def fetch(self, name):
+		'''
+		Return the sequence (as bytes, without line breaks) of the named record.
+		'''
+		entry = self.entries[name]
+		if entry.linebases == 0:
+			return b''
+		full_lines, remainder = divmod(entry.length, entry.linebases)
+		self._fh.seek(entry.offset)
+		seq = self._fh.read(full_lines * entry.linewidth + remainder)
+		if entry.linewidth != entry.linebases:
+			seq = seq.replace(b'\n', b'')
+			if entry.linewidth - entry.linebases > 1:
+				seq = seq.replace(b'\r', b'')
+		return seq
+
+	def close(self):
+		self._fh.close()
+
+
+
+class BgzfReader(object):
+	'''
+	Minimal seek()/read() interface over the uncompressed data in a BGZF file.
+
+	Arguments:
+		path:   Path to the bgzip compressed file.
+		blocks: List of (compressed offset, uncompressed offset) for each block (from read_gzi()/build_gzi()).
+	'''
+	def __init__(self, path, blocks):
+		self._fh = open(path, 'rb')
+		self._coffsets = [0] + [c for c, u in blocks]
+		self._uoffsets = [0] + [u for c, u in blocks]
+		self._pos = 0
+		self._block_index = None
+		self._block = b''
+
+	def seek(self, offset):
+		self._pos = offset
+
+	def size(self):
+		'''
+		Total size of the uncompressed data.
+		'''
+		return self._uoffsets[-1] + len(self._load_block(len(self._uoffsets) - 1))
+
+	def read(self, size):
+		out = []
+		while size > 0:
+			i = bisect_right(self._uoffsets, self._pos) - 1
+			block = self._load_block(i)
+			start = self._pos - self._uoffsets[i]
+			if start >= len(block):
+				break # EOF
+			data = block[start:start+size]
+			out.append(data)
+			self._pos += len(data)
+			size -= len(data)
+		return b''.join(out)
+
+	def _load_block(self, i):
+		if i != self._block_index:
+			self._fh.seek(self._coffsets[i])
+			self._block = _read_bgzf_block(self._fh)[1]
+			self._block_index = i
+		return self._block
+
+	def close(self):
+		self._fh.close()
+
+
+
+def build_fai(fh):
+	'''
+	Build a samtools compatible fasta index from a binary file handle (positioned at the start of the file).
+
+	Returns:
+		OrderedDict of name:FaiEntry (in file order).
+
+	Raises:
+		FastaIndexError if a record has lines of different lengths (other than the last line).
+	'''
+	entries = OrderedDict()
+	pos = 0
+	name = None
+	for line in _iter_lines(fh):
+		line_length = len(line)
+		if line.startswith(b'>'):
+			if name is not None:
+				entries[name] = FaiEntry(name, length, offset, linebases or 0, linewidth or 0)
+			name = line[1:].split(None, 1)[0].decode() if line[1:].strip() else ''
+			if name in entries:
+				raise FastaIndexError('Duplicate sequence name %s' % name)
+			offset = pos + line_length
+			length = 0
+			linebases = None
+			linewidth = None
+			last_line = False
+		elif name is not None:
+			bases = len(line.rstrip(b'\r\n'))
+			if bases == 0:
+				last_line = True
+			elif last_line:
+				raise FastaIndexError('Different line length in sequence %s' % name)
+			elif linebases is None:
+				linebases = bases
+				linewidth = line_length
+			elif bases != linebases or line_length != linewidth:
+				if bases > linebases:
+					raise FastaIndexError('Different line length in sequence %s' % name)
+				last_line = True
+			length += bases
+		pos += line_length
+	if name is not None:
+		entries[name] = FaiEntry(name, length, offset, linebases or 0, linewidth or 0)
+	return entries
+
+
+def read_fai(fai_path):
+	entries = OrderedDict()
+	with open(fai_path) as fh:
+		for line in fh:
+			line_split = line.rstrip('\n').split('\t')
+			if len(line_split) < 5:
+				continue
+			name = line_split[0]
+			entries[name] = FaiEntry(name, *[int(x) for x in line_split[1:5]])
+	return entries
+
+
+def write_fai(fai_path, entries):
+	with open(fai_path, 'w') as fh:
+		for e in entries.values():
+			fh.write('%s\t%s\t%s\t%s\t%s\n' % e)
+
+
+
+def build_gzi(path):
+	'''
+	Build a bgzip compatible block index by walking the BGZF block headers
+	(only the last 4 bytes of each block, ISIZE, are needed; nothing is decompressed).
+
+	Returns:
+		List of (compressed offset, uncompressed offset) for each block after the first.
+	'''
+	blocks = []
+	coffset = 0
+	uoffset = 0
+	with open(path, 'rb') as fh:
+		while True:
+			header = fh.read(18)
+			if not header:
+				break
+			block_size = _bgzf_block_size(header)
+			fh.seek(coffset + block_size - 4)
+			isize = struct.unpack('<I', fh.read(4))[0]
+			if coffset != 0:
+				blocks.append((coffset, uoffset))
+			coffset += block_size
+			uoffset += isize
+			fh.seek(coffset)
+	return blocks
+
+
+def read_gzi(gzi_path):
+	with open(gzi_path, 'rb') as fh:
+		n = struct.unpack('<Q', fh.read(8))[0]
+		data = struct.unpack('<%sQ' % (n * 2), fh.read(n * 16))
+	return list(zip(data[0::2], data[1::2]))
+
+
+def write_gzi(gzi_path, blocks):
+	with open(gzi_path, 'wb') as fh:
+		fh.write(struct.pack('<Q', len(blocks)))
+		for coffset, uoffset in blocks:
+			fh.write(struct.pack('<QQ', coffset, uoffset))
+
+
+
+def is_gzip(path):
+	with open(path, 'rb') as fh:
+		return fh.read(2) == b'\x1f\x8b'
+
+
+def is_bgzf(path):
+	'''
+	True if the first block of the file has the BGZF 'BC' extra field.
+	'''
+	with open(path, 'rb') as fh:
+		header = fh.read(18)
+	try:
+		_bgzf_block_size(header)
+		return True
+	except FastaIndexError:
+		return False
+
+
+
+def _bgzf_block_size(header):
+	'''
+	Return the total size of a BGZF block given the first 18 bytes of the block.
+	'''
+	if len(header) < 18 or header[:4] != b'\x1f\x8b\x08\x04' or header[12:14] != b'BC':
+		raise FastaIndexError('Not a BGZF block')
+	return struct.unpack('<H', header[16:18])[0] + 1
+
+
+def _read_bgzf_block(fh):
+	'''
+	Read and decompress the BGZF block at the current position of fh.
+	Returns (compressed block size, uncompressed data).
+	'''
+	header = fh.read(18)
+	block_size = _bgzf_block_size(header)
+	rest = fh.read(block_size - 18)
+	return block_size, zlib.decompress(rest[:-8], -15)
+
+
+def _iter_lines(fh):
+	'''
+	Iterate over lines of a file handle that only has seek()/read() (e.g. BgzfReader).
+	'''
+	if hasattr(fh, 'readline'):
+		for line in fh:
+			yield line
+		return
+	leftover = b''
+	while True:
+		chunk = fh.read(1024 * 1024)
+		if not chunk:
+			break
+		lines = (leftover + chunk).split(b'\n')
+		leftover = lines.pop()
+		for line in lines:
+			yield line + b'\n'
+	if leftover:
+		yield leftover
+
+
+def _is_current(index_path, fasta_path):
+	return os.path.exists(index_path) and os.path.getmtime(index_path) >= os.path.getmtime(fasta_path)
+
+
+def _try_write(write_function, path, data):
+	try:
+		write_function(path, data)
+	except (IOError, OSError) as e:
+		logging.warning('Could not write index %s (%s); index will only be kept in memory', path, e) ## WARNING
+
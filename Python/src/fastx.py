@@ -0,0 +1,659 @@
+#!/usr/bin/env python3
+'''
+Shared fasta/fastq record readers.
+
+Replaces the itertools.groupby based fasta_iter() that was copy-pasted into most
+of the Fastx scripts. Instead of calling a lambda, strip() and join() for every
+line, the file is read in large binary chunks and record boundaries are found
+with bytes.find()/rfind() (memchr). Each record is sliced out of the chunk in one
+go, so there are no per-line copies (sequence newlines are dropped with a single
+bytes.replace() call per record).
+
+Usage (from a script two directories below the repo root):
+	sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'Python'))
+	from src.fastx import fasta_iter
+
+	for header, seq in fasta_iter(fh):
+		...
+
+NOTE:
+	- fasta_iter() and fastq_iter() yield str (drop in replacements for the old functions).
+	- fasta_records() and fastq_records() yield the raw bytes (fastest; no decoding).
+	- fasta_chunks() yields record-aligned blocks of bytes (for multiprocessing).
+	- fastq_sample() yields randomly sampled fastq records (without reading the whole file).
+	- FastqReader reads fastq files in validated blocks (optionally collecting
+	   FastqStats read length/quality histograms in the same pass).
+	- File handles can be opened in text or binary mode (incl. sys.stdin and gzip files).
+'''
+import os
+import gzip
+import random
+import logging
+from collections import Counter
+from src.faidx import BgzfReader, build_gzi, is_gzip, is_bgzf
+
+## Size of the binary chunks read from the file handle.
+CHUNK_SIZE = 4 * 1024 * 1024
+
+## Number of bytes read at each random position by fastq_sample() (doubled until a whole record is found).
+SAMPLE_WINDOW = 4096
+
+## Characters that are stripped from the ends of each sequence line.
+_LINE_WHITESPACE = b' \t\r\n\x0b\x0c'
+
+
+
+def fasta_iter(fh, keep_description=False, chunk_size=CHUNK_SIZE):
+	'''
+	Given a fasta file handle, yield tuples of header, sequence (as str).
+	Clears description from seq name (unless keep_description=True).
+
+	Same interface as the old groupby based fasta_iter():
+		From: https://www.biostars.org/p/710/
+
+	Arguments:
+		fh:               File handle (text or binary) with fasta formatted seqs.
+		keep_description: Return the full header line (minus '>') instead of just the seq name.
+		chunk_size:       Number of bytes to read from fh at a time.
+
+	Yields:
+		(header, seq) tuples of str.
+	'''
+	for header, seq in fasta_records(fh, chunk_size):
+		if not keep_description:
+			header = header.split(b' ', 1)[0]
+		yield header.decode(), seq.decode()
+
+
+
+def fasta_records(fh, chunk_size=CHUNK_SIZE):
+	'''
+	Given a fasta file handle, yield tuples of header, sequence (as bytes).
+
+	Header is the full header line without the leading '>' or trailing whitespace.
+	Sequence has all line breaks removed (and leading/trailing whitespace
+	stripped from each line; same as the old fasta_iter()).
+
+	Arguments:
+		fh:         File handle (text or binary) with fasta formatted seqs.
+		chunk_size: Number of bytes to read from fh at a time.
+
+	Yields:
+		(header, seq) tuples of bytes.
+
+	Note:	- Anything before the first '>' is ignored.
+		- Records can span any number of chunks (e.g. whole chromosomes). Chunk
+		   pieces are kept as memoryviews and only joined once the end of the
+		   record has been found.
+	'''
+	pending = [] # Chunk pieces of the last (incomplete) record
+	started = False
+	for chunk in _read_chunks(fh, chunk_size):
+		## Position of the last header in this chunk. Everything before it is complete records.
+		cut = _last_header(chunk, not pending or pending[-1][-1:] == b'\n')
+		if cut == -1:
+			pending.append(memoryview(chunk))
+			continue
+		if pending:
+			pending.append(memoryview(chunk)[:cut])
+			buf = b''.join(pending)
+			end = len(buf)
+		else:
+			buf = chunk
+			end = cut
+		pending = [memoryview(chunk)[cut:]]
+
+		start = 0
+		if not started:
+			start = _first_header(buf, end)
+			if start == -1:
+				continue
+			started = True
+		for record in _split_fasta_records(buf, start, end):
+			yield record
+
+	## Last record in the file
+	buf = b''.join(pending)
+	start = 0
+	if not started:
+		start = _first_header(buf, len(buf))
+	if start != -1 and buf:
+		for record in _split_fasta_records(buf, start, len(buf)):
+			yield record
+
+
+
+def fasta_chunks(fh, chunk_size=CHUNK_SIZE):
+	'''
+	Given a fasta file handle, yield record-aligned chunks of bytes (for
+	splitting work between processes). Each chunk starts with '>' and only
+	contains complete records; use fasta_chunk_records() to split it.
+
+	Arguments:
+		fh:         File handle (text or binary) with fasta formatted seqs.
+		chunk_size: Number of bytes to read from fh at a time. Chunks are
+		             about this size (records longer than chunk_size are
+		             returned whole in a bigger chunk).
+
+	Yields:
+		bytes
+	'''
+	pending = [] # Chunk pieces of the last (incomplete) record
+	started = False
+	for chunk in _read_chunks(fh, chunk_size):
+		cut = _last_header(chunk, not pending or pending[-1][-1:] == b'\n')
+		if cut == -1:
+			pending.append(memoryview(chunk))
+			continue
+		pending.append(memoryview(chunk)[:cut])
+		buf = b''.join(pending)
+		pending = [memoryview(chunk)[cut:]]
+
+		if not started:
+			start = _first_header(buf, len(buf))
+			if start == -1:
+				continue
+			started = True
+			buf = buf[start:]
+		if buf:
+			yield buf
+
+	## Last record/s in the file
+	buf = b''.join(pending)
+	if not started:
+		start = _first_header(buf, len(buf))
+		if start == -1:
+			return
+		buf = buf[start:]
+	if buf:
+		yield buf
+
+
+
+def fasta_chunk_records(chunk):
+	'''
+	Split a chunk from fasta_chunks() into (header, seq) tuples of bytes
+	(same format as fasta_records()).
+	'''
+	return _split_fasta_records(chunk, 0, len(chunk))
+
+
+
+def _last_header(chunk, at_line_start):
+	'''
+	Return the index of the last '>' in chunk which starts a line (or -1 if not found).
+	at_line_start: True if chunk[0] is the first character of a line.
+
+	Searching for b'>' (memrchr) and checking the preceding character is much
+	faster than searching for b'\n>'.
+	'''
+	rfind = chunk.rfind
+	i = rfind(b'>')
+	while i > 0:
+		if chunk[i-1] == 10: # 10 == ord('\n')
+			return i
+		i = rfind(b'>', 0, i)
+	if i == 0 and at_line_start:
+		return 0
+	return -1
+
+
+
+def _first_header(buf, end):
+	'''
+	Return the index of the first '>' in buf[:end] which starts a line (or -1 if not found).
+	'''
+	find = buf.find
+	i = find(b'>', 0, end)
+	while i > 0:
+		if buf[i-1] == 10:
+			return i
+		i = find(b'>', i+1, end)
+	return i
+
+
+
+def _split_fasta_records(buf, start, end):
+	'''
+	Split buf[start:end] (complete fasta records, starting with '>') into (header, seq) tuples.
+	'''
+	find = buf.find
+	while start < end:
+		## Start of the next record
+		i = find(b'>', start+1, end)
+		while i != -1 and buf[i-1] != 10:
+			i = find(b'>', i+1, end)
+		if i == -1:
+			i = end
+		yield _parse_fasta_record(buf[start+1:i])
+		start = i
+
+
+
+def _parse_fasta_record(record):
+	'''
+	Split a single fasta record (without the leading '>') into header and seq.
+	'''
+	header, _, seq = record.partition(b'\n')
+
+	## Fast path: only line breaks need to be removed.
+	## Slow path: some lines have other leading/trailing whitespace which needs stripping.
+	if b' ' in seq or b'\t' in seq:
+		seq = b''.join(line.strip(_LINE_WHITESPACE) for line in seq.split(b'\n'))
+	else:
+		seq = seq.replace(b'\n', b'')
+		if b'\r' in seq:
+			seq = seq.replace(b'\r', b'')
+	return header.rstrip(), seq
+
+
+
+def fastq_iter(fh, chunk_size=CHUNK_SIZE):
+	'''
+	Given a fastq file handle, yield a list of lines (as str) for each read.
+	['name', 'sequence', 'optional', 'quality']
+
+	Same interface as the old fastq_iter():
+		From: https://www.biostars.org/p/317524/
+	'''
+	for record in fastq_records(fh, chunk_size):
+		yield [x.decode() for x in record]
+
+
+
+def fastq_records(fh, chunk_size=CHUNK_SIZE, validate=True, stats=None):
+	'''
+	Given a fastq file handle, yield a tuple of lines (as bytes) for each read.
+	(name, sequence, optional, quality)
+
+	Assumes the standard 4 line fastq format (i.e. no wrapped sequence lines).
+	Lines are returned without trailing whitespace.
+
+	Arguments:
+		fh:         File handle (text or binary) with fastq formatted reads.
+		chunk_size: Number of bytes to read from fh at a time.
+		validate:   Check the '@'/'+' lines and seq/quality lengths of every record (see FastqReader).
+		stats:      FastqStats object to update with each block of reads (optional).
+	'''
+	for block in FastqReader(fh, chunk_size, validate, stats).blocks():
+		for record in zip(block.names, block.seqs, block.opts, block.quals):
+			yield record
+
+
+
+class FastqFormatError(Exception):
+	'''
+	Raised when a fastq file is not in the 4 line format (e.g. truncated or corrupt records).
+	'''
+	pass
+
+
+
+class FastqRecord(object):
+	'''
+	A single fastq record. Unpacks like a tuple: name, seq, opt, qual = record
+	'''
+	__slots__ = ('name', 'seq', 'opt', 'qual')
+
+	def __iter__(self):
+		return iter((self.name, self.seq, self.opt, self.qual))
+
+	def __repr__(self):
+		return 'FastqRecord(%r, %r, %r, %r)' % tuple(self)
+
+
+
+class FastqBlock(object):
+	'''
+	A block of fastq records stored by column (lists of bytes).
+	'''
+	__slots__ = ('names', 'seqs', 'opts', 'quals', 'first_record')
+
+	def __len__(self):
+		return len(self.names)
+
+
+
+class FastqReader(object):
+	'''
+	Block based fastq reader.
+
+	The file is read in chunk_size blocks which are split into lines in one go
+	and sliced into name/seq/opt/qual columns (no per-read list or rstrip() calls,
+	unless lines have trailing whitespace).
+
+	Validation is done per block with C level calls: each name line must start with
+	'@' and each optional line with '+' (checked by counting '\n@'/'\n+' in the
+	joined lines) and each seq must be the same length as its quality. So a
+	truncated/corrupt record raises FastqFormatError instead of misaligning every
+	later record.
+
+	Arguments:
+		fh:         File handle (text or binary) with fastq formatted reads.
+		chunk_size: Number of bytes to read from fh at a time.
+		validate:   Check each block of records (raise FastqFormatError if bad).
+		stats:      FastqStats object to update with each block of reads (optional).
+
+	Usage:
+		for block in FastqReader(fh).blocks():  # Columns: block.names, block.seqs, block.opts, block.quals
+			...
+		for record in FastqReader(fh):          # FastqRecord: record.name, record.seq, record.opt, record.qual
+			...
+
+	Note:	- blocks() yields the same FastqBlock object each time, and iterating over the
+		   reader yields the same (preallocated) FastqRecord slots for each block. Copy
+		   anything you want to keep (e.g. tuple(record)) before reading the next block.
+	'''
+	def __init__(self, fh, chunk_size=CHUNK_SIZE, validate=True, stats=None):
+		self.fh = fh
+		self.chunk_size = chunk_size
+		self.validate = validate
+		self.stats = stats
+		self.records_read = 0
+		self._block = FastqBlock()
+		self._slots = []
+
+	def __iter__(self):
+		slots = self._slots
+		for block in self.blocks():
+			n = len(block)
+			while len(slots) < n:
+				slots.append(FastqRecord())
+			for i, name, seq, opt, qual in zip(range(n), block.names, block.seqs, block.opts, block.quals):
+				slot = slots[i]
+				slot.name = name
+				slot.seq = seq
+				slot.opt = opt
+				slot.qual = qual
+				yield slot
+
+	def blocks(self):
+		'''
+		Yield a FastqBlock for each chunk of complete records.
+		'''
+		leftover = b''
+		for chunk in _read_chunks(self.fh, self.chunk_size):
+			data = leftover + chunk
+			lines = data.split(b'\n')
+
+			## Everything after the last complete record is carried over to the next chunk
+			n_complete = (len(lines) - 1) // 4 * 4
+			leftover = b'\n'.join(lines[n_complete:])
+			if n_complete:
+				del lines[n_complete:]
+				## Only strip lines if there is trailing whitespace somewhere in the chunk
+				## (single byte searches (memchr) first; two byte searches are much slower)
+				strip = b'\r' in data or (b' ' in data and b' \n' in data) or (b'\t' in data and b'\t\n' in data)
+				yield self._fill_block(lines, strip)
+
+		## Last record (if file does not end with a newline)
+		lines = leftover.split(b'\n')
+		if lines[-1] == b'':
+			lines.pop() # Final newline
+		while len(lines) % 4 and not lines[-1].strip():
+			lines.pop() # Blank lines at the end of the file
+		incomplete = len(lines) % 4
+		if incomplete:
+			message = 'Incomplete fastq record at end of file (record %s): %s' % (self.records_read + len(lines) // 4 + 1, lines[-incomplete:])
+			if self.validate:
+				raise FastqFormatError(message)
+			logging.warning('%s', message) ## WARNING
+			del lines[-incomplete:]
+		if lines:
+			yield self._fill_block(lines, True)
+
+	def _fill_block(self, lines, strip):
+		if strip:
+			lines = [x.rstrip() for x in lines]
+		block = self._block
+		block.names = lines[0::4]
+		block.seqs = lines[1::4]
+		block.opts = lines[2::4]
+		block.quals = lines[3::4]
+		block.first_record = self.records_read + 1
+		if self.validate:
+			self._validate_block(block)
+		self.records_read += len(block.names)
+		if self.stats is not None:
+			self.stats.update(block.seqs, block.quals)
+		return block
+
+	def _validate_block(self, block):
+		n = len(block.names)
+		if (b'\n' + b'\n'.join(block.names)).count(b'\n@') == n and \
+		   (b'\n' + b'\n'.join(block.opts)).count(b'\n+') == n and \
+		   list(map(len, block.seqs)) == list(map(len, block.quals)):
+			return
+		## Something is wrong; find the first bad record for the error message
+		for i, (name, seq, opt, qual) in enumerate(zip(block.names, block.seqs, block.opts, block.quals)):
+			if name[:1] != b'@' or opt[:1] != b'+' or len(seq) != len(qual):
+				raise FastqFormatError('Bad fastq record %s (line %s): %s' % (block.first_record + i, (block.first_record + i - 1) * 4 + 1, [name, seq, opt, qual]))
+
+
+
+class FastqStats(object):
+	'''
+	Read length and per-position quality histograms, collected inline by
+	FastqReader/fastq_records(stats=...).
+
+	Per-position quality counts are collected a block at a time: quality strings of
+	the same length are joined and each position is a strided slice of the joined
+	bytes, which is counted with one bytes.count() call per quality character seen
+	in the file, so there is no per-base python loop.
+
+	Arguments:
+		quality: Also collect per-position quality histograms (default: only length histogram).
+		offset:  Quality score offset (Phred+33).
+	'''
+	def __init__(self, quality=True, offset=33):
+		self.quality = quality
+		self.offset = offset
+		self.n_reads = 0
+		self.n_bases = 0
+		self.length_hist = Counter()
+		self.quality_hist = [] # Counter of quality characters (as ints) per position
+		self._quality_chars = b'' # Quality characters seen so far
+
+	def update(self, seqs, quals):
+		lengths = list(map(len, seqs))
+		self.n_reads += len(lengths)
+		self.n_bases += sum(lengths)
+		self.length_hist.update(lengths)
+		if not self.quality or not lengths:
+			return
+
+		## Group quality strings by length
+		if min(lengths) == max(lengths):
+			by_length = {lengths[0]: quals}
+		else:
+			by_length = {}
+			for length, qual in zip(lengths, quals):
+				by_length.setdefault(length, []).append(qual)
+
+		quality_hist = self.quality_hist
+		for length, length_quals in by_length.items():
+			while len(quality_hist) < length:
+				quality_hist.append(Counter())
+			joined = b''.join(length_quals)
+			
+			## New quality characters are whatever is left after deleting the known ones
+			new_chars = joined.translate(None, self._quality_chars)
+			if new_chars:
+				self._quality_chars = bytes(sorted(set(self._quality_chars) | set(new_chars)))
+			chars = [(c, bytes((c,))) for c in self._quality_chars]
+			
+			for position in range(length):
+				column = joined[position::length]
+				counts = quality_hist[position]
+				for c, char in chars:
+					n = column.count(char)
+					if n:
+						counts[c] += n
+
+	def merge(self, other):
+		'''
+		Add the counts from another FastqStats object (e.g. from another file or process).
+		'''
+		self.n_reads += other.n_reads
+		self.n_bases += other.n_bases
+		self.length_hist.update(other.length_hist)
+		while len(self.quality_hist) < len(other.quality_hist):
+			self.quality_hist.append(Counter())
+		for position, counts in enumerate(other.quality_hist):
+			self.quality_hist[position].update(counts)
+
+	def mean_quality(self):
+		'''
+		Mean quality score at each position (list; position 1 is index 0).
+		'''
+		means = []
+		for counts in self.quality_hist:
+			total = sum(counts.values())
+			means.append(sum(q * x for q, x in counts.items()) / total - self.offset if total else 0.0)
+		return means
+
+	def write(self, fh, prefix=''):
+		'''
+		Write stats as tab separated lines (optionally starting with prefix, e.g. the file name):
+			reads     <number of reads>
+			bases     <number of bases>
+			length    <read length>    <number of reads>
+			quality   <position>       <quality score>    <number of bases>
+		'''
+		if prefix:
+			prefix += '\t'
+		fh.write('%sreads\t%s\n' % (prefix, self.n_reads))
+		fh.write('%sbases\t%s\n' % (prefix, self.n_bases))
+		for length in sorted(self.length_hist):
+			fh.write('%slength\t%s\t%s\n' % (prefix, length, self.length_hist[length]))
+		for position, counts in enumerate(self.quality_hist, 1):
+			for q in sorted(counts):
+				fh.write('%squality\t%s\t%s\t%s\n' % (prefix, position, q - self.offset, counts[q]))
+
+
+
+def fastq_sample(file_name, number_reads, seed=None):
+	'''
+	Randomly sample (about) number_reads records from a fastq file, without
+	reading the whole file. Random positions in the file are picked, and the
+	first complete record after each position is returned (in file order).
+
+	Works on uncompressed and bgzip compressed files (using the .gzi block index,
+	built by walking the block headers if needed). Normal gzip files can not be
+	seeked so the whole file is read (reservoir sampling).
+
+	Arguments:
+		file_name:    Fastq file name.
+		number_reads: Number of reads to sample. Can return fewer reads if two
+		               positions fall in the same record.
+		seed:         Random seed (default: random).
+
+	Yields:
+		(name, sequence, optional, quality) tuples of bytes (same as fastq_records()).
+
+	Note:	- Records after long records are slightly more likely to be picked.
+		- If the file has about number_reads records (or fewer) all records are returned.
+	'''
+	rng = random.Random(seed)
+	if is_gzip(file_name):
+		if not is_bgzf(file_name):
+			logging.warning('%s is gzip (not bgzip) compressed; reading the whole file to sample reads', file_name) ## WARNING
+			with gzip.open(file_name, 'rb') as fh:
+				for record in _reservoir_sample(fastq_records(fh), number_reads, rng):
+					yield record
+			return
+		fh = BgzfReader(file_name, build_gzi(file_name))
+		size = fh.size()
+	else:
+		fh = open(file_name, 'rb')
+		size = os.path.getsize(file_name)
+
+	try:
+		## Small file (compared to the number of reads wanted): return everything
+		first_offset, first_record = _fastq_record_at(fh, 0)
+		if first_record is None:
+			return
+		if number_reads * (sum(len(x) for x in first_record) + 4) >= size:
+			fh.seek(0)
+			for record in fastq_records(fh):
+				yield record
+			return
+
+		seen = set()
+		for offset in sorted(rng.randrange(size) for _ in range(number_reads)):
+			record_offset, record = _fastq_record_at(fh, offset)
+			if record is None or record_offset in seen:
+				continue
+			seen.add(record_offset)
+			yield record
+	finally:
+		fh.close()
+
+
+
+def _fastq_record_at(fh, offset, window=SAMPLE_WINDOW):
+	'''
+	Return (offset, record) of the first complete fastq record which starts after
+	offset (or at offset == 0). Returns (None, None) if there is no record.
+
+	A record start is a line starting with '@', followed by a seq line, a line starting
+	with '+', and a quality line the same length as the seq (quality lines can also start with '@').
+	'''
+	while True:
+		fh.seek(offset)
+		data = fh.read(window)
+		at_eof = len(data) < window
+		lines = data.split(b'\n')
+		if not at_eof:
+			lines.pop() # Last line may be incomplete
+		pos = offset
+		start = 0
+		if offset != 0:
+			## Skip the (possibly partial) line that offset falls in
+			pos += len(lines[0]) + 1
+			start = 1
+		for i in range(start, len(lines) - 3):
+			if lines[i][:1] == b'@' and lines[i+2][:1] == b'+':
+				record = (lines[i].rstrip(), lines[i+1].rstrip(), lines[i+2].rstrip(), lines[i+3].rstrip())
+				if len(record[1]) == len(record[3]):
+					return pos, record
+			pos += len(lines[i]) + 1
+		if at_eof:
+			return None, None
+		window *= 2
+
+
+
+def _reservoir_sample(records, number_reads, rng):
+	'''
+	Uniform random sample of number_reads records (returned in file order).
+	'''
+	sample = []
+	for i, record in enumerate(records):
+		if i < number_reads:
+			sample.append((i, record))
+		else:
+			j = rng.randint(0, i)
+			if j < number_reads:
+				sample[j] = (i, record)
+	sample.sort(key=lambda x: x[0])
+	return [record for i, record in sample]
+
+
+
+def _read_chunks(fh, chunk_size=CHUNK_SIZE):
+	'''
+	Yield chunks of bytes from a text or binary file handle.
+	'''
+	## Use the underlying binary buffer of text file handles (e.g. sys.stdin or gzip.open(..., 'rt'))
+	raw = getattr(fh, 'buffer', fh)
+	read = raw.read
+	while True:
+		chunk = read(chunk_size)
+		if not chunk:
+			break
+		if isinstance(chunk, str):
+			chunk = chunk.encode()
+		yield chunk
+
+
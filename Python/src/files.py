@@ -1,8 +1,31 @@
 #!/usr/bin/env python3
 import sys
 import os
+import io
+import shutil
 import logging
 import argparse
+import threading
+import subprocess
+import queue
+
+## Module logger; logging.debug() would set up the root logger (with the default format) when
+## File() is used as an argparse type, i.e. before the script calls logging.basicConfig().
+log = logging.getLogger(__name__)
+
+
+## Size of the blocks passed between the (de)compression thread and the caller.
+BLOCK_SIZE = 1024 * 1024
+
+## Max number of blocks held in the read-ahead/write-behind queue of each file.
+QUEUE_SIZE = 16
+
+## Buffer size of the BufferedReader/BufferedWriter wrapped around compressed streams.
+BUFFER_SIZE = 1024 * 1024
+
+## Number of threads given to external (de)compression tools (pigz/bgzip).
+THREADS = max(1, min(4, os.cpu_count() or 1))
+
 
 
 class File(object):
@@ -12,87 +35,374 @@ class File(object):
 	 - Will check that file exists if mode='r'.
 	 - Will check that file exists if mode='s' and return just the string.
 	 - Will overwrite file by default in mode='w'.
-	 - Will open using either normal open() or gzip.open() if *.gz extension detected.
-	 - Designed to be handled by a 'with' statement (other wise __enter__() method wont 
+	 - Will open using the codec registered for the file extension (see CODECS) if
+	    a *.gz, *.bgz, *.bz2, *.xz, *.lzma or *.zst extension is detected, else open normally
+	    (with a BUFFER_SIZE buffer, so writes are done in large blocks).
+	 - Compressed files are (de)compressed in a background thread (or external pigz/bgzip/zstd
+	    process if available, which can use multiple threads) so reading/writing overlaps with parsing.
+	 - File name '-' is stdin (mode='r') or stdout (mode='w'); these are not closed on exit.
+	 - Returns a text file handle for all file types (or a binary file handle if binary=True).
+	 - Designed to be handled by a 'with' statement (other wise __enter__() method wont
 	    be run and the file handle wont be returned)
-	
+
 	NOTE:
 		- Can't use .close() directly on this class unless you uncomment the close() method
 		- Can't use this class with a 'for' loop unless you uncomment the __iter__() method
 			- In this case you should also uncomment the close() method as a 'for'
-			   loop does not automatically cloase files, so you will have to do this 
+			   loop does not automatically cloase files, so you will have to do this
 			   manually.
-		- __iter__() and close() are commented out by default as it is better to use a 'with' 
-		   statement instead as it will automatically close files when finished/an exception 
-		   occures. 
-		- Without __iter__() and close() this object will return an error when directly closed 
-		   or you attempt to use it with a 'for' loop. This is to force the use of a 'with' 
-		   statement instead. 
-	
+		- __iter__() and close() are commented out by default as it is better to use a 'with'
+		   statement instead as it will automatically close files when finished/an exception
+		   occures.
+		- Without __iter__() and close() this object will return an error when directly closed
+		   or you attempt to use it with a 'for' loop. This is to force the use of a 'with'
+		   statement instead.
+
 	Code based off of context manager tutorial from: https://book.pythontips.com/en/latest/context_managers.html
 	'''
-	def __init__(self, file_name, mode, overwrite=True):
+	def __init__(self, file_name, mode, overwrite=True, binary=False, threads=THREADS, external=True):
 		## Upon initializing class open file (using gzip, bz2, or lzma if needed)
 		self.file_name = file_name
 		self.mode = mode
 		self.overwrite = overwrite
-		
+		self.binary = binary
+
 		## Check that mode in one of the allowed options
 		if not self.mode in ['r', 'w', 's']:
 			raise argparse.ArgumentTypeError("Mode %s is not one of the allowed options: ['r', 'w', 's']!" % self.mode)
-		
+
 		## Check file exists if mode='r'
-		if self.mode == 'r' and not os.path.exists(self.file_name):
+		if self.mode == 'r' and self.file_name != '-' and not os.path.exists(self.file_name):
 			raise argparse.ArgumentTypeError("The file %s does not exist!" % self.file_name)
-		
+
 		## Check file exists if mode='w' - Stop of overwrite=False
-		if self.mode == 'w' and os.path.exists(self.file_name) and not self.overwrite:
+		if self.mode == 'w' and self.file_name != '-' and os.path.exists(self.file_name) and not self.overwrite:
 			raise argparse.ArgumentTypeError("The file %s already exist and we dont want to overwrite it!" % self.file_name)
-		
+
 		## If mode=='s' return just the file name
 		if self.mode == 's':
 			self.file_obj = self.file_name
+		elif self.file_name == '-':
+			std = sys.stdin if self.mode == 'r' else sys.stdout
+			self.file_obj = std.buffer if self.binary else std
 		else:
-			## Open with gzip if it has the *.gz extension, else open normally (including stdin)
+			## Open with the codec registered for the files extension, else open normally (including stdin)
 			try:
-				if self.file_name.endswith(".gz"):
-					logging.debug('Opening gzip compressed file (mode: %s): %s', self.mode, self.file_name) ## DEBUG
-					import gzip
-					self.file_obj = gzip.open(self.file_name, self.mode+'t')
-				elif self.file_name.endswith(".bz2"):
-					logging.debug('Opening bz2 compressed file (mode: %s): %s', self.mode, self.file_name) ## DEBUG
-					import bz2
-					self.file_obj = bz2.open(self.file_name, self.mode+'b')
-				elif self.file_name.endswith(".lzma"):
-					logging.debug('Opening lzma compressed file (mode: %s): %s', self.mode, self.file_name) ## DEBUG
-					import lzma
-					self.file_obj = lzma.open(self.file_name, self.mode+'b')
-				elif self.file_name.endswith(".xz"):
-					logging.debug('Opening xz compressed file (mode: %s): %s', self.mode, self.file_name) ## DEBUG
-					import xz
-					self.file_obj = xz.open(self.file_name, self.mode+'b')
+				codec = get_codec(self.file_name)
+				if codec is not None:
+					log.debug('Opening %s compressed file (mode: %s): %s', codec.name, self.mode, self.file_name) ## DEBUG
+					self.file_obj = codec.open(self.file_name, self.mode, binary=self.binary, threads=threads, external=external)
 				else:
-					logging.debug('Opening normal file (mode: %s): %s', self.mode, self.file_name) ## DEBUG
-					self.file_obj = open(self.file_name, self.mode)
+					log.debug('Opening normal file (mode: %s): %s', self.mode, self.file_name) ## DEBUG
+					self.file_obj = open(self.file_name, self.mode+'b' if self.binary else self.mode, buffering=BUFFER_SIZE)
 			except IOError as e:
 				raise argparse.ArgumentTypeError('%s' % e)
-	
+
 	def __enter__(self):
 		## Run When 'with' statement uses this class.
-		logging.debug('__enter__: %s', self.file_name) ## DEBUG
+		log.debug('__enter__: %s', self.file_name) ## DEBUG
 		return self.file_obj
 	def __exit__(self, type, value, traceback):
 		## Run when 'with' statement is done with object. Either because file has been exhausted, we are done writing, or an error has been encountered.
-		logging.debug('__exit__: %s', self.file_name) ## DEBUG
-		if self.mode != 's':
+		log.debug('__exit__: %s', self.file_name) ## DEBUG
+		if self.mode == 's':
+			return
+		if self.file_name == '-':
+			if self.mode == 'w':
+				self.file_obj.flush()
+		else:
 			self.file_obj.close()
 #	def __iter__(self):
 #		## iter method need for class to work with 'for' loops
-#		logging.debug('__iter__: %s', self.file_name) ## DEBUG
+#		log.debug('__iter__: %s', self.file_name) ## DEBUG
 #		return self.file_obj
 #	def close(self):
 #		## method to call .close() directly on object.
-#		logging.debug('close: %s', self.file_name) ## DEBUG
+#		log.debug('close: %s', self.file_name) ## DEBUG
 #		self.file_obj.close()
 
 
+
+class Codec(object):
+	'''
+	A compression format that File() can read and write.
+
+	Arguments:
+		name:      Name of the format (used in log messages).
+		open_raw:  Function(file_name, mode) returning a binary (de)compressing file object.
+		external:  List of external tools (in order of preference) which can be used instead
+		            of open_raw. Each tool is a tuple of (executable, read_args, write_args)
+		            where the args can contain '{threads}'.
+
+	Reading/writing is always done through a ThreadedReader/ThreadedWriter so that
+	(de)compression runs in a background thread, and the result is wrapped in a
+	BufferedReader/BufferedWriter (binary=True) or TextIOWrapper (default).
+	'''
+	def __init__(self, name, open_raw, external=()):
+		self.name = name
+		self.open_raw = open_raw
+		self.external = external
+
+	def open(self, file_name, mode, binary=False, threads=THREADS, external=True):
+		tool = self.find_external() if external else None
+		if mode == 'r':
+			if tool is not None:
+				stream = ExternalProcessStream.reader(tool, file_name, threads)
+			else:
+				stream = self.open_raw(file_name, 'rb')
+			f = io.BufferedReader(ThreadedReader(stream), buffer_size=BUFFER_SIZE)
+		else:
+			if tool is not None:
+				stream = ExternalProcessStream.writer(tool, file_name, threads)
+			else:
+				stream = self.open_raw(file_name, 'wb')
+			f = io.BufferedWriter(ThreadedWriter(stream), buffer_size=BUFFER_SIZE)
+		if binary:
+			return f
+		return io.TextIOWrapper(f)
+
+	def find_external(self):
+		for tool in self.external:
+			path = shutil.which(tool[0])
+			if path is not None:
+				return (path,) + tool[1:]
+		return None
+
+
+
+def _open_gzip(file_name, mode):
+	import gzip
+	return gzip.open(file_name, mode)
+
+def _open_bz2(file_name, mode):
+	import bz2
+	return bz2.open(file_name, mode)
+
+def _open_xz(file_name, mode):
+	import lzma
+	return lzma.open(file_name, mode, format=lzma.FORMAT_XZ if 'w' in mode else lzma.FORMAT_AUTO)
+
+def _open_lzma(file_name, mode):
+	import lzma
+	return lzma.open(file_name, mode, format=lzma.FORMAT_ALONE if 'w' in mode else lzma.FORMAT_AUTO)
+
+def _open_zstd(file_name, mode):
+	try:
+		import zstandard
+	except ImportError:
+		raise IOError('Can not open %s: needs the zstd executable or the zstandard python package' % file_name)
+	return zstandard.open(file_name, mode)
+
+
+## pigz/bgzip both read normal gzip and bgzip (BGZF) files. Output written by bgzip is
+## BGZF (i.e. can be indexed), output written by pigz is normal gzip.
+_GZIP_TOOLS = (
+	('pigz', ['-d', '-c', '-p', '{threads}'], ['-c', '-p', '{threads}']),
+	('bgzip', ['-d', '-c', '-@', '{threads}'], ['-c', '-@', '{threads}']),
+)
+_BGZIP_TOOLS = (
+	('bgzip', ['-d', '-c', '-@', '{threads}'], ['-c', '-@', '{threads}']),
+)
+_ZSTD_TOOLS = (
+	('zstd', ['-d', '-c', '-q', '-T{threads}'], ['-c', '-q', '-T{threads}']),
+)
+
+## Codecs for each file extension. New formats can be added with register_codec().
+CODECS = {
+	'.gz':   Codec('gzip', _open_gzip, _GZIP_TOOLS),
+	'.bgz':  Codec('bgzip', _open_gzip, _BGZIP_TOOLS),
+	'.bz2':  Codec('bz2', _open_bz2),
+	'.xz':   Codec('xz', _open_xz),
+	'.lzma': Codec('lzma', _open_lzma),
+	'.zst':  Codec('zstd', _open_zstd, _ZSTD_TOOLS),
+}
+
+
+def register_codec(extension, codec):
+	'''
+	Register (or replace) the Codec used for files with the given extension (e.g. '.zst').
+	'''
+	CODECS[extension] = codec
+
+
+def get_codec(file_name):
+	'''
+	Return the Codec for file_name (based on its extension) or None if it is not compressed.
+	'''
+	for extension, codec in CODECS.items():
+		if file_name.endswith(extension):
+			return codec
+	return None
+
+
+
+class ThreadedReader(io.RawIOBase):
+	'''
+	Reads blocks from a binary stream (e.g. gzip.open(..., 'rb')) in a background thread.
+
+	Decompression happens in the background thread while the caller parses the
+	previous blocks. The read-ahead buffer is bounded by queue_size blocks, so
+	memory use is fixed no matter how large the file is. Exceptions raised by
+	the stream are re-raised in the calling thread.
+	'''
+	def __init__(self, stream, block_size=BLOCK_SIZE, queue_size=QUEUE_SIZE):
+		self._stream = stream
+		self._block_size = block_size
+		self._queue = queue.Queue(maxsize=queue_size)
+		self._block = b''
+		self._pos = 0
+		self._eof = False
+		self._stop = threading.Event()
+		self._thread = threading.Thread(target=self._fill, daemon=True)
+		self._thread.start()
+
+	def _fill(self):
+		try:
+			read = self._stream.read
+			while not self._stop.is_set():
+				block = read(self._block_size)
+				if not block:
+					break
+				self._put(block)
+		except Exception as e:
+			self._put(e)
+		self._put(None)
+
+	def _put(self, item):
+		## Wait for space in the queue (unless we are closing)
+		while not self._stop.is_set():
+			try:
+				self._queue.put(item, timeout=0.1)
+				return
+			except queue.Full:
+				continue
+
+	def readable(self):
+		return True
+
+	def readinto(self, b):
+		while self._pos >= len(self._block):
+			if self._eof:
+				return 0
+			item = self._queue.get()
+			if item is None:
+				self._eof = True
+				return 0
+			if isinstance(item, Exception):
+				self._eof = True
+				raise item
+			self._block = item
+			self._pos = 0
+		n = min(len(b), len(self._block) - self._pos)
+		b[:n] = memoryview(self._block)[self._pos:self._pos+n]
+		self._pos += n
+		return n
+
+	def close(self):
+		if self.closed:
+			return
+		self._stop.set()
+		self._thread.join()
+		self._stream.close()
+		super().close()
+
+
+
+class ThreadedWriter(io.RawIOBase):
+	'''
+	Writes blocks to a binary stream (e.g. gzip.open(..., 'wb')) in a background thread.
+
+	Compression happens in the background thread while the caller carries on
+	producing output. Blocks waiting to be compressed are bounded by queue_size.
+	Exceptions raised by the stream are re-raised on the next write() or close().
+	'''
+	def __init__(self, stream, queue_size=QUEUE_SIZE):
+		self._stream = stream
+		self._queue = queue.Queue(maxsize=queue_size)
+		self._error = None
+		self._thread = threading.Thread(target=self._drain, daemon=True)
+		self._thread.start()
+
+	def _drain(self):
+		write = self._stream.write
+		while True:
+			block = self._queue.get()
+			if block is None:
+				break
+			if self._error is not None:
+				continue
+			try:
+				write(block)
+			except Exception as e:
+				self._error = e
+
+	def writable(self):
+		return True
+
+	def write(self, b):
+		if self._error is not None:
+			raise self._error
+		block = bytes(b)
+		self._queue.put(block)
+		return len(block)
+
+	def close(self):
+		if self.closed:
+			return
+		self._queue.put(None)
+		self._thread.join()
+		try:
+			self._stream.close()
+		finally:
+			super().close()
+		if self._error is not None:
+			raise self._error
+
+
+
+class ExternalProcessStream(object):
+	'''
+	Binary stream to/from an external (de)compression process (e.g. pigz, bgzip).
+	'''
+	def __init__(self, process, stream, out_fh=None, command=None):
+		self._process = process
+		self._stream = stream
+		self._out_fh = out_fh
+		self._command = command
+		self._eof = False
+
+	def read(self, size=-1):
+		data = self._stream.read(size)
+		if not data:
+			self._eof = True
+		return data
+
+	def write(self, b):
+		return self._stream.write(b)
+
+	@classmethod
+	def reader(cls, tool, file_name, threads):
+		command = [tool[0]] + [x.format(threads=threads) for x in tool[1]] + [file_name]
+		log.debug('Decompressing using: %s', ' '.join(command)) ## DEBUG
+		process = subprocess.Popen(command, stdout=subprocess.PIPE)
+		return cls(process, process.stdout, command=command)
+
+	@classmethod
+	def writer(cls, tool, file_name, threads):
+		command = [tool[0]] + [x.format(threads=threads) for x in tool[2]]
+		log.debug('Compressing using: %s > %s', ' '.join(command), file_name) ## DEBUG
+		out_fh = open(file_name, 'wb')
+		process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=out_fh)
+		return cls(process, process.stdin, out_fh=out_fh, command=command)
+
+	def close(self):
+		self._stream.close()
+		returncode = self._process.wait()
+		if self._out_fh is not None:
+			self._out_fh.close()
+		## A reader that is closed before the end of the file will kill the process with SIGPIPE
+		stopped_early = self._out_fh is None and not self._eof
+		if returncode != 0 and not stopped_early:
+			raise IOError('%s exited with status %s' % (' '.join(self._command), returncode))
+
+
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+'''
+Persistent on-disk key index for key:value table files (e.g. add_value_to_table.py --add files).
+
+Lets scripts look up the values of a few keys in a huge key:value file without
+parsing the whole file each time. The index holds the sorted keys and the offset
+of each key's line in the value file; the values themselves are read from the
+value file only when a key is found.
+
+	build_key_index('uniprot_descriptions.txt')  # writes uniprot_descriptions.txt.kidx
+	with KeyIndex('uniprot_descriptions.txt') as idx:
+		value = idx.get('P12345')
+
+Index file layout (little-endian; memory mapped, so opening is ~instant):
+	header       MAGIC, number of entries, size of key blob, value file size,
+	              value file mtime (ns), number of key columns, length of delimiter,
+	              flags (STRIP_WHITESPACE), padding
+	delimiter    padded to 8 bytes
+	key_offsets  uint64 x (entries + 1); start of each key in the key blob
+	line_offsets uint64 x entries; (uncompressed) offset of each key's line in the value file
+	keys         key blob; keys sorted (bytewise), duplicated keys kept in file order
+
+NOTE:
+	- Keys are the first key_cols columns of each line (joined with the delimiter).
+	- Blank lines and comment lines (starting with '#') are not indexed.
+	- Only the line ending ('\n' or '\r\n') is stripped from each line (the same as reading the
+	   file in text mode and using line.strip('\n')); other whitespace is part of the key/value.
+	   Use build_key_index(..., strip_whitespace=True) to strip whitespace from both ends of each
+	   line (line.strip()) instead; the mode is stored in the index and used for the keys and values.
+	- The value file can be plain text or bgzip compressed (not normal gzip).
+	- The index is tied to the value file size + mtime; KeyIndexError is raised if the
+	   value file has changed since the index was built.
+	- Keys are held in memory while the index is being built (not while it is used).
+'''
+import os
+import sys
+import mmap
+import struct
+import logging
+from src.faidx import BgzfReader, build_gzi, is_gzip, is_bgzf, _iter_lines
+
+
+INDEX_SUFFIX = '.kidx'
+MAGIC = b'KEYIDX02'
+HEADER = struct.Struct('<8sQQQqIIII')
+
+## Header flags
+STRIP_WHITESPACE = 1
+
+## Size of the reads used to find the end of a line in a bgzip compressed value file.
+LINE_READ_SIZE = 4096
+
+
+class KeyIndexError(Exception):
+	'''
+	Raised when an index can not be built or used (e.g. normal gzip or changed value file).
+	'''
+	pass
+
+
+
+def build_key_index(value_path, key_cols=1, delim='\t', index_path=None, strip_whitespace=False):
+	'''
+	Build the index for value_path and write it to index_path (default: value_path + INDEX_SUFFIX).
+	With strip_whitespace=True lines are stripped with line.strip() (default: only the line ending).
+
+	Returns:
+		Number of unique keys (use KeyIndex.duplicates() to find the duplicated keys).
+	'''
+	if index_path is None:
+		index_path = value_path + INDEX_SUFFIX
+	delim_bytes = delim.encode()
+	strip = bytes.strip if strip_whitespace else _strip_line_end
+
+	entries = []
+	fh = _open_value_file(value_path)
+	try:
+		pos = 0
+		for line in _iter_lines(fh):
+			line_start = pos
+			pos += len(line)
+			line = strip(line)
+			if not line or line.startswith(b'#'):
+				continue
+			line_split = line.split(delim_bytes, key_cols)
+			if len(line_split) < key_cols:
+				raise KeyIndexError('Less than %s key columns in line at offset %s of %s' % (key_cols, line_start, value_path))
+			entries.append((delim_bytes.join(line_split[:key_cols]), line_start))
+	finally:
+		fh.close()
+	## Stable sort; keeps duplicated keys in file order
+	entries.sort(key=lambda x: x[0])
+	logging.debug('Indexed %s lines from %s', len(entries), value_path) ## DEBUG
+
+	key_offsets = [0]
+	num_keys = 0
+	previous_key = None
+	for key, line_start in entries:
+		key_offsets.append(key_offsets[-1] + len(key))
+		if key != previous_key:
+			num_keys += 1
+			previous_key = key
+
+	stat = os.stat(value_path)
+	with open(index_path, 'wb') as out:
+		out.write(HEADER.pack(MAGIC, len(entries), key_offsets[-1], stat.st_size, stat.st_mtime_ns, key_cols, len(delim_bytes), STRIP_WHITESPACE if strip_whitespace else 0, 0))
+		out.write(delim_bytes + b'\0' * (-len(delim_bytes) % 8))
+		out.write(struct.pack('<%sQ' % len(key_offsets), *key_offsets))
+		out.write(struct.pack('<%sQ' % len(entries), *[x[1] for x in entries]))
+		out.write(b''.join([x[0] for x in entries]))
+	return num_keys
+
+
+
+class KeyIndex(object):
+	'''
+	Look up values in a key:value file using an index written by build_key_index().
+
+	Arguments:
+		value_path: Path to the key:value file.
+		index_path: Path to the index (default: value_path + INDEX_SUFFIX).
+
+	Keys (str, or tuple of str for multiple key columns) are found by binary search
+	over the memory mapped key blob. Values are returned as str (the rest of the line
+	after the key columns; stripped the same way as when the index was built, see strip_whitespace).
+
+	Raises:
+		KeyIndexError if the index does not exist, is not an index, or is out of date.
+	'''
+	def __init__(self, value_path, index_path=None):
+		self.value_path = value_path
+		self.index_path = value_path + INDEX_SUFFIX if index_path is None else index_path
+		if not os.path.exists(self.index_path):
+			raise KeyIndexError('%s does not exist (build it with --build_index)' % self.index_path)
+
+		with open(self.index_path, 'rb') as fh:
+			self._mmap = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+		magic, n, keys_size, file_size, file_mtime, self.key_cols, delim_size, flags, _ = HEADER.unpack_from(self._mmap, 0)
+		if magic != MAGIC:
+			raise KeyIndexError('%s is not a key index (or was built by an older version; rebuild it with --build_index)' % self.index_path)
+		self.strip_whitespace = bool(flags & STRIP_WHITESPACE)
+		self._strip = bytes.strip if self.strip_whitespace else _strip_line_end
+		stat = os.stat(value_path)
+		if stat.st_size != file_size or stat.st_mtime_ns != file_mtime:
+			raise KeyIndexError('%s has changed since %s was built' % (value_path, self.index_path))
+
+		offset = HEADER.size
+		self._delim = self._mmap[offset:offset+delim_size]
+		self.delim = self._delim.decode()
+		offset += delim_size + (-delim_size % 8)
+		view = memoryview(self._mmap)
+		self._key_offsets = _uint64_array(view, offset, n + 1)
+		offset += 8 * (n + 1)
+		self._line_offsets = _uint64_array(view, offset, n)
+		offset += 8 * n
+		self._keys_start = offset
+		self._n = n
+		self._fh = _open_value_file(value_path)
+		self._readline = self._fh.readline if hasattr(self._fh, 'readline') else self._bgzf_readline
+
+	def __enter__(self):
+		return self
+	def __exit__(self, type, value, traceback):
+		self.close()
+
+	def __len__(self):
+		return self._n
+
+	def __contains__(self, key):
+		return self._find(self._encode(key)) != -1
+
+	def get(self, key, default=None):
+		'''
+		Value of key (the last one in the file if key is duplicated, like loading into a dict), or default.
+		'''
+		values = self.get_all(key)
+		return values[-1] if values else default
+
+	def get_all(self, key):
+		'''
+		List of all values of key (in file order; empty if not found).
+		'''
+		key = self._encode(key)
+		i = self._find(key)
+		if i == -1:
+			return []
+		values = []
+		while i < self._n and self._key(i) == key:
+			values.append(self._value(self._line_offsets[i]))
+			i += 1
+		return values
+
+	def duplicates(self):
+		'''
+		Yield (key, count) for keys that occur multiple times (keys are str; tuple for multiple key columns).
+		'''
+		i = 0
+		while i < self._n:
+			key = self._key(i)
+			j = i + 1
+			while j < self._n and self._key(j) == key:
+				j += 1
+			if j - i > 1:
+				yield self._decode(key), j - i
+			i = j
+
+	def close(self):
+		## Release the views before closing the mmap
+		for array in (self._key_offsets, self._line_offsets):
+			if isinstance(array, memoryview):
+				array.release()
+		self._mmap.close()
+		self._fh.close()
+
+	def _encode(self, key):
+		if isinstance(key, tuple):
+			key = self.delim.join(key)
+		return key.encode()
+
+	def _decode(self, key):
+		key = key.decode()
+		return tuple(key.split(self.delim)) if self.key_cols > 1 else key
+
+	def _key(self, i):
+		start = self._keys_start
+		return self._mmap[start+self._key_offsets[i]:start+self._key_offsets[i+1]]
+
+	def _find(self, key):
+		'''
+		Index of the first entry with key (binary search), or -1.
+		'''
+		lo = 0
+		hi = self._n
+		while lo < hi:
+			mid = (lo + hi) // 2
+			if self._key(mid) < key:
+				lo = mid + 1
+			else:
+				hi = mid
+		if lo < self._n and self._key(lo) == key:
+			return lo
+		return -1
+
+	def _value(self, line_offset):
+		self._fh.seek(line_offset)
+		line_split = self._strip(self._readline()).split(self._delim, self.key_cols)
+		return line_split[self.key_cols].decode() if len(line_split) > self.key_cols else ''
+
+	def _bgzf_readline(self):
+		chunks = []
+		while True:
+			chunk = self._fh.read(LINE_READ_SIZE)
+			end = chunk.find(b'\n')
+			if end != -1 or not chunk:
+				chunks.append(chunk if end == -1 else chunk[:end+1])
+				return b''.join(chunks)
+			chunks.append(chunk)
+
+
+
+def _strip_line_end(line):
+	'''
+	line (bytes) without its line ending ('\n' or '\r\n'; as text mode + strip('\n')).
+	'''
+	if line.endswith(b'\n'):
+		line = line[:-2] if line.endswith(b'\r\n') else line[:-1]
+	return line
+
+
+
+def _open_value_file(value_path):
+	'''
+	Binary handle (open() or BgzfReader) with seek() by uncompressed offset.
+	'''
+	if is_gzip(value_path):
+		if not is_bgzf(value_path):
+			raise KeyIndexError('%s is gzip (not bgzip) compressed and can not be indexed' % value_path)
+		return BgzfReader(value_path, build_gzi(value_path))
+	return open(value_path, 'rb')
+
+
+def _uint64_array(view, offset, n):
+	'''
+	Zero copy view of n little-endian uint64 values starting at offset
+	(a copy on big-endian machines).
+	'''
+	if sys.byteorder != 'little':
+		return struct.unpack_from('<%sQ' % n, view, offset)
+	return view[offset:offset+8*n].cast('Q')
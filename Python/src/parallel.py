@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+'''
+Shared ordered process pool.
+
+Replaces the ProcessPoolExecutor loops that were copy-pasted into the scripts that
+split their input into independent parts (clean_fasta.py, blast_top_hits.py,
+orientate_using_spliced_leader_seq{,_trim}.py, find_adapters_in_reads.py).
+
+Usage (from a script two directories below the repo root):
+	sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'Python'))
+	from src.parallel import ordered_map
+
+	parts = ((chunk, options) for chunk in fasta_chunks(fh, chunk_size))
+	for result in ordered_map(_worker, parts, threads):
+		out.write(result)
+
+NOTE:
+	- pool_fn must be a top level (picklable) function; it is called as pool_fn(*part).
+	- Results are yielded in the order of parts. Futures are kept in submission order
+	   (reorder buffer), so parts that finish early wait until all the parts before them
+	   have been yielded. At most 2*threads parts are in flight, so memory is bounded by
+	   the size of the parts * threads (not by the size of the input).
+	- Workers log with the same level as the main process (see init_worker()).
+'''
+import sys
+import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+## Default log format of the worker processes (same as the scripts).
+LOG_FORMAT = '[%(levelname)s]: %(message)s'
+
+
+
+def ordered_map(pool_fn, parts, threads, log_format=LOG_FORMAT):
+	'''
+	Yield pool_fn(*part) for each part (tuple of arguments) in parts, in order, using threads worker processes.
+	'''
+	max_pending = 2 * threads
+	pending = deque()
+	with ProcessPoolExecutor(max_workers=threads, initializer=init_worker, initargs=(logging.getLogger().level, log_format)) as pool:
+		for part in parts:
+			pending.append(pool.submit(pool_fn, *part))
+			while len(pending) >= max_pending:
+				yield pending.popleft().result()
+		while pending:
+			yield pending.popleft().result()
+
+
+
+def init_worker(level, log_format=LOG_FORMAT):
+	'''
+	Process pool initializer; workers log (to stderr) the same way as the main process.
+	'''
+	logging.basicConfig(format=log_format, stream=sys.stderr)
+	logging.getLogger().setLevel(level)
@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+'''
+Multi-pattern sequence search.
+
+AhoCorasick builds an automaton from a set of query seqs once, then finds every
+(overlapping) occurrence of every query in a subject seq with a single scan of
+the subject. Cost is O(subject length + number of hits), independent of the
+number of queries (instead of one str.find() scan of the subject per query).
+
+MismatchMatcher finds occurrences of a set of query seqs with up to k mismatches
+(substitutions; no indels). It uses bit-parallel Shift-And (Baeza-Yates-Gonnet,
+with the Wu-Manber extension for mismatches) with all of the patterns packed into
+a single (arbitrary length) python int, so each subject character costs k+1
+shift/and/or operations for the whole pattern set. Regions of the subject are
+only scanned if they contain an exact 'seed' (pigeonhole principle: if a pattern
+is split into k+1 pieces, at least one piece must match exactly), which are found
+with bytes.find() (few seeds) or AhoCorasick (many seeds).
+
+KmerIndex answers 'which patterns occur in this (short) subject?' (e.g. adapters
+in reads). All k-mers of all patterns are indexed once; only every s-th k-mer of
+the subject is looked up (s = shortest pattern - k + 1, so every occurrence of
+every pattern covers at least one of the looked up k-mers) and candidates are
+confirmed with bytes.startswith().
+
+Usage (from a script two directories below the repo root):
+	sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'Python'))
+	from src.seqsearch import AhoCorasick, MismatchMatcher
+
+	ac = AhoCorasick([b'ACGT', b'GTA'])
+	for start, end, pattern_index in ac.find_all(b'TTACGTACGTA'):
+		...
+
+	mm = MismatchMatcher([b'ACGT', b'GTA'], max_mismatches=1)
+	for start, end, pattern_index, mismatches in mm.find_all(b'TTACGTACGTA'):
+		...
+
+NOTE:
+	- Patterns and subjects are bytes (matching is case sensitive).
+	- reverse_complement() works on nucleotide seqs (IUPAC codes; case is kept).
+'''
+from collections import deque
+
+## Shortest seed that is worth searching for (shorter seeds match almost everywhere,
+## so the whole subject is scanned instead).
+MIN_SEED_LENGTH = 4
+
+## Use AhoCorasick (instead of one bytes.find() per seed) to find seeds when there are more than this many.
+MAX_FIND_SEEDS = 32
+
+## Max k-mer size used by KmerIndex (smaller k == more k-mers looked up per subject).
+KMER_SIZE = 12
+
+## Complement of each nucleotide (and IUPAC ambiguity) code; other characters are unchanged.
+_COMPLEMENT = bytes.maketrans(
+	b'ACGTUMRWSYKVHDBNacgtumrwsykvhdbn',
+	b'TGCAAKYWSRMBDHVNtgcaakywsrmbdhvn')
+
+
+
+def reverse_complement(seq):
+	'''
+	Reverse complement of a nucleotide seq (bytes).
+	'''
+	return seq.translate(_COMPLEMENT)[::-1]
+
+
+
+class AhoCorasick(object):
+	'''
+	Aho-Corasick automaton for finding all occurrences of a set of patterns.
+
+	Arguments:
+		patterns: List of patterns (bytes). Identical patterns are allowed (each
+		           is reported separately). Empty patterns are ignored.
+
+	The goto/fail links are compiled into a full transition table (one dict per
+	state, keyed by byte value) so each subject character costs a single dict
+	lookup. Bytes that do not appear in any pattern go back to the root state.
+	'''
+	def __init__(self, patterns):
+		self.patterns = list(patterns)
+
+		## Build the trie (goto function)
+		goto = [{}]
+		out = [[]]
+		for pattern_index, pattern in enumerate(self.patterns):
+			if not pattern:
+				continue
+			state = 0
+			for c in pattern:
+				next_state = goto[state].get(c)
+				if next_state is None:
+					next_state = len(goto)
+					goto[state][c] = next_state
+					goto.append({})
+					out.append([])
+				state = next_state
+			out[state].append(pattern_index)
+
+		## Breadth first: add fail links and merge outputs + transitions from the fail state
+		fail = [0] * len(goto)
+		queue = deque(goto[0].values())
+		while queue:
+			state = queue.popleft()
+			for c, next_state in list(goto[state].items()):
+				queue.append(next_state)
+				f = goto[fail[state]].get(c, 0)
+				fail[next_state] = f
+				out[next_state] = out[next_state] + out[f]
+			## Missing transitions are taken from the fail state (already complete; it is closer to the root)
+			for c, next_state in goto[fail[state]].items():
+				goto[state].setdefault(c, next_state)
+
+		## Outputs as (pattern_index, pattern_length) tuples; None for states without outputs
+		self._goto = goto
+		self._out = [tuple((i, len(self.patterns[i])) for i in o) if o else None for o in out]
+
+	def __len__(self):
+		return len(self.patterns)
+
+	def find_all(self, subject):
+		'''
+		Yield (start, end, pattern_index) for every occurrence of every pattern in subject.
+		Overlapping occurrences are reported. Coords are 0-based, end exclusive (i.e. bed formatted).
+		Hits are yielded in order of their end position.
+		'''
+		goto = self._goto
+		out = self._out
+		state = 0
+		for end, c in enumerate(subject, 1):
+			state = goto[state].get(c, 0)
+			hits = out[state]
+			if hits is not None:
+				for pattern_index, length in hits:
+					yield end - length, end, pattern_index
+
+
+
+class MismatchMatcher(object):
+	'''
+	Find all occurrences of a set of patterns with up to max_mismatches mismatches.
+
+	Arguments:
+		patterns:       List of patterns (bytes). Empty patterns are ignored.
+		max_mismatches: Max number of mismatching characters (Hamming distance) in a hit.
+		use_seeds:      Only scan regions of the subject that contain an exact seed
+		                 (set False to always scan the whole subject).
+
+	Pattern p occupies bits [offset_p, offset_p+len_p) of the state vectors.
+	For each character c of the subject (R[j] == prefixes matched with <= j mismatches):
+		R[0]' = ((R[0] << 1) | init) & masks[c]
+		R[j]' = (((R[j] << 1) | init) & masks[c]) | ((R[j-1] << 1) | init)
+	A hit for pattern p ends at the current character if its last bit is set in R[j]
+	(the smallest such j is the number of mismatches).
+	'''
+	def __init__(self, patterns, max_mismatches, use_seeds=True):
+		self.patterns = list(patterns)
+		self.max_mismatches = max_mismatches
+
+		## Pack patterns into bit vectors
+		masks = [0] * 256
+		init = 0
+		accept = 0
+		self._last_bit = {} # last bit: (pattern_index, pattern_length)
+		offset = 0
+		for pattern_index, pattern in enumerate(self.patterns):
+			if not pattern:
+				continue
+			init |= 1 << offset
+			for i, c in enumerate(pattern):
+				masks[c] |= 1 << (offset + i)
+			offset += len(pattern)
+			accept |= 1 << (offset - 1)
+			self._last_bit[offset - 1] = (pattern_index, len(pattern))
+		self._masks = masks
+		self._init = init
+		self._accept = accept
+
+		## Seeds: split each pattern into max_mismatches+1 pieces.
+		## seed: (min start, max end) of the pattern hits relative to the start of the seed.
+		self._seeds = None
+		if use_seeds and self._last_bit:
+			seeds = {}
+			n_pieces = max_mismatches + 1
+			for pattern in self.patterns:
+				if not pattern:
+					continue
+				piece_length = len(pattern) // n_pieces
+				if piece_length < MIN_SEED_LENGTH:
+					seeds = None
+					break
+				for i in range(n_pieces):
+					piece_start = i * piece_length
+					seed = pattern[piece_start:piece_start+piece_length]
+					window = seeds.get(seed, (0, 0))
+					seeds[seed] = (min(window[0], -piece_start), max(window[1], len(pattern) - piece_start))
+			self._seeds = seeds
+			if seeds is not None and len(seeds) > MAX_FIND_SEEDS:
+				self._seed_list = list(seeds)
+				self._seed_ac = AhoCorasick(self._seed_list)
+			else:
+				self._seed_ac = None
+
+	def __len__(self):
+		return len(self.patterns)
+
+	def find_all(self, subject):
+		'''
+		Yield (start, end, pattern_index, mismatches) for every occurrence of every pattern in subject
+		with <= max_mismatches mismatches. Overlapping occurrences are reported.
+		Coords are 0-based, end exclusive (i.e. bed formatted).
+		'''
+		if not self._last_bit:
+			return
+		if self._seeds is None:
+			for hit in self._scan(subject, 0, len(subject)):
+				yield hit
+			return
+		for start, end in self._candidate_regions(subject):
+			for hit in self._scan(subject, start, end):
+				yield hit
+
+	def best_hits(self, subject):
+		'''
+		Return {pattern_index: min mismatches} for the patterns found in subject.
+		'''
+		best = {}
+		for start, end, pattern_index, mismatches in self.find_all(subject):
+			if mismatches < best.get(pattern_index, mismatches + 1):
+				best[pattern_index] = mismatches
+		return best
+
+	def _candidate_regions(self, subject):
+		'''
+		Yield (merged, sorted) regions of subject that contain an exact seed.
+		Every hit lies completely within one region.
+		'''
+		seeds = self._seeds
+		windows = []
+		if self._seed_ac is None:
+			for seed, (before, after) in seeds.items():
+				find = subject.find
+				i = find(seed)
+				while i != -1:
+					windows.append((i + before, i + after))
+					i = find(seed, i + 1)
+		else:
+			seed_list = self._seed_list
+			for start, end, seed_index in self._seed_ac.find_all(subject):
+				before, after = seeds[seed_list[seed_index]]
+				windows.append((start + before, start + after))
+		if not windows:
+			return
+		windows.sort()
+		length = len(subject)
+		region_start, region_end = windows[0]
+		for start, end in windows:
+			if start > region_end:
+				yield max(region_start, 0), min(region_end, length)
+				region_start = start
+			region_end = max(region_end, end)
+		yield max(region_start, 0), min(region_end, length)
+
+	def _scan(self, subject, start, end):
+		'''
+		Bit-parallel scan of subject[start:end].
+		'''
+		masks = self._masks
+		init = self._init
+		accept = self._accept
+		last_bit = self._last_bit
+		k = self.max_mismatches
+		levels = range(1, k + 1)
+		R = [0] * (k + 1)
+		for pos in range(start, end):
+			mask = masks[subject[pos]]
+			shifted = (R[0] << 1) | init
+			R[0] = shifted & mask
+			for j in levels:
+				## Shift of R[j-1] (before update) == a mismatch at this character
+				next_shifted = (R[j] << 1) | init
+				R[j] = (next_shifted & mask) | shifted
+				shifted = next_shifted
+			hits = R[k] & accept
+			if hits:
+				## Report each pattern once, with the smallest number of mismatches
+				for mismatches in range(k + 1):
+					level = R[mismatches] & hits
+					hits ^= level
+					while level:
+						low = level & -level
+						level ^= low
+						pattern_index, pattern_length = last_bit[low.bit_length() - 1]
+						yield pos + 1 - pattern_length, pos + 1, pattern_index, mismatches
+					if not hits:
+						break
+
+
+
+class KmerIndex(object):
+	'''
+	Exact search for a set of patterns in many short subjects (e.g. adapters in reads).
+
+	Arguments:
+		patterns: List of patterns (bytes). Empty patterns are ignored.
+		k:        k-mer size (default: half the length of the shortest pattern, max KMER_SIZE).
+	'''
+	def __init__(self, patterns, k=None):
+		self.patterns = list(patterns)
+		lengths = [len(x) for x in self.patterns if x]
+		min_length = min(lengths) if lengths else 1
+		if k is None:
+			k = max(1, min(KMER_SIZE, min_length // 2))
+		self.k = min(k, min_length)
+		
+		## Any occurrence of a pattern covers at least one k-mer starting at a multiple of the step
+		self.step = min_length - self.k + 1
+		
+		## k-mer: list of (pattern_index, offset of the k-mer in the pattern)
+		index = {}
+		for pattern_index, pattern in enumerate(self.patterns):
+			if not pattern:
+				continue
+			for offset in range(len(pattern) - self.k + 1):
+				index.setdefault(pattern[offset:offset+self.k], []).append((pattern_index, offset))
+		self._index = index
+
+	def __len__(self):
+		return len(self.patterns)
+
+	def find_patterns(self, subject):
+		'''
+		Return the set of indexes of the patterns that occur in subject.
+		'''
+		found = set()
+		get = self._index.get
+		patterns = self.patterns
+		k = self.k
+		for i in range(0, len(subject) - k + 1, self.step):
+			candidates = get(subject[i:i+k])
+			if candidates is None:
+				continue
+			for pattern_index, offset in candidates:
+				start = i - offset
+				if start >= 0 and pattern_index not in found and subject.startswith(patterns[pattern_index], start):
+					found.add(pattern_index)
+		return found
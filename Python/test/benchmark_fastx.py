@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+'''
+Benchmark src.fastx.fasta_iter() against the old groupby based fasta_iter()
+that was copy-pasted into the Fastx scripts.
+
+Usage:
+	cd Python/test
+	./benchmark_fastx.py [num_seqs] [seq_length] [line_width]
+'''
+import sys
+import os
+import time
+import random
+import tempfile
+from itertools import groupby
+
+# setting path
+sys.path.append('../')
+
+# importing
+from src.fastx import fasta_iter, fasta_records
+
+
+def groupby_fasta_iter(fh):
+	'''
+	Old fasta_iter() (From: https://www.biostars.org/p/710/) ported to python3.
+	'''
+	faiter = (x[1] for x in groupby(fh, lambda line: line[0] == ">"))
+	for header in faiter:
+		header = next(header)[1:].strip().split(' ')[0]
+		seq = "".join(s.strip() for s in next(faiter))
+		yield header, seq
+
+
+def write_test_fasta(fh, num_seqs, seq_length, line_width):
+	random.seed(42)
+	for i in range(num_seqs):
+		seq = ''.join(random.choice('ACGT') for _ in range(seq_length))
+		fh.write('>seq_%s description of seq %s\n' % (i, i))
+		for j in range(0, seq_length, line_width):
+			fh.write(seq[j:j+line_width] + '\n')
+
+
+def time_reader(name, file_name, reader, mode):
+	start = time.perf_counter()
+	total_length = 0
+	with open(file_name, mode) as fh:
+		for header, seq in reader(fh):
+			total_length += len(seq)
+	elapsed = time.perf_counter() - start
+	size_mb = os.path.getsize(file_name) / 1024 / 1024
+	print('%-20s %8.3f s  %8.1f MB/s  (%s bp)' % (name, elapsed, size_mb / elapsed, total_length))
+	return elapsed
+
+
+def main():
+	num_seqs = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+	seq_length = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+	line_width = int(sys.argv[3]) if len(sys.argv) > 3 else 60
+
+	with tempfile.NamedTemporaryFile('w', suffix='.fa', delete=False) as fh:
+		write_test_fasta(fh, num_seqs, seq_length, line_width)
+		file_name = fh.name
+	try:
+		print('%s seqs x %s bp (line width %s): %.1f MB' % (num_seqs, seq_length, line_width, os.path.getsize(file_name) / 1024 / 1024))
+
+		## Check both readers return the same records
+		with open(file_name) as fh1, open(file_name) as fh2:
+			assert list(groupby_fasta_iter(fh1)) == list(fasta_iter(fh2)), 'Readers returned different records!'
+
+		old = time_reader('groupby fasta_iter', file_name, groupby_fasta_iter, 'r')
+		new = time_reader('src.fastx fasta_iter', file_name, fasta_iter, 'rb')
+		raw = time_reader('src.fastx records', file_name, fasta_records, 'rb')
+		print('Speedup: %.1fx (str) %.1fx (bytes)' % (old / new, old / raw))
+	finally:
+		os.remove(file_name)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+'''
+Benchmark src.seqsearch.AhoCorasick against searching for each query with
+str.find() (the old find_subseqs.py find_matches() loop), and
+src.seqsearch.MismatchMatcher (--max_mismatches) against exact search for
+long subjects (find_subseqs.py) and short reads (find_adapters_in_reads.py).
+
+Usage:
+	cd Python/test
+	./benchmark_seqsearch.py [num_queries] [query_length] [subject_length] [num_reads]
+'''
+import sys
+import time
+import random
+
+# setting path
+sys.path.append('../')
+
+# importing
+from src.seqsearch import AhoCorasick, MismatchMatcher
+
+
+def find_matches(query, subject):
+	'''
+	Old find_subseqs.py find_matches() (one str.find() scan of the subject per query).
+	'''
+	matches = []
+	index = 0
+	while index < len(subject):
+		index = subject.find(query, index)
+		if index == -1:
+			break
+		matches.append([index, index+len(query)])
+		index += 1
+	return matches
+
+
+def random_seq(length):
+	return bytes(random.choice(b'ACGT') for _ in range(length))
+
+
+def main():
+	num_queries = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+	query_length = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+	subject_length = int(sys.argv[3]) if len(sys.argv) > 3 else 1000000
+	num_reads = int(sys.argv[4]) if len(sys.argv) > 4 else 100000
+
+	random.seed(42)
+	subject = random_seq(subject_length)
+	## Half of the queries are taken from the subject so there are some hits
+	queries = []
+	for i in range(num_queries):
+		if i % 2:
+			start = random.randint(0, subject_length - query_length)
+			queries.append(subject[start:start+query_length])
+		else:
+			queries.append(random_seq(query_length))
+	print('%s queries x %s bp vs %s bp subject' % (num_queries, query_length, subject_length))
+
+	start = time.perf_counter()
+	old = sorted((i, s, e) for i, q in enumerate(queries) for s, e in find_matches(q, subject))
+	old_time = time.perf_counter() - start
+	print('%-20s %8.3f s  (%s hits)' % ('str.find per query', old_time, len(old)))
+
+	start = time.perf_counter()
+	ac = AhoCorasick(queries)
+	build_time = time.perf_counter() - start
+	new = sorted((i, s, e) for s, e, i in ac.find_all(subject))
+	new_time = time.perf_counter() - start
+	print('%-20s %8.3f s  (%s hits; %.3f s to build)' % ('Aho-Corasick', new_time, len(new), build_time))
+
+	assert old == new, 'Searches returned different hits!'
+	print('Speedup: %.1fx' % (old_time / new_time))
+
+	## Mismatch search (long subject)
+	for max_mismatches in (1, 2):
+		start = time.perf_counter()
+		mm = MismatchMatcher(queries, max_mismatches)
+		hits = [(i, s, e) for s, e, i, m in mm.find_all(subject)]
+		mm_time = time.perf_counter() - start
+		assert set(new) <= set(hits), 'Mismatch search missed exact hits!'
+		print('%-20s %8.3f s  (%s hits; %.1fx exact search time)' % ('%s mismatch/es' % max_mismatches, mm_time, len(hits), mm_time / new_time))
+
+	## Adapters in short reads
+	adapters = queries[:20]
+	reads = [random_seq(150) for _ in range(num_reads)]
+	print('\n%s adapters vs %s reads x 150 bp' % (len(adapters), num_reads))
+	start = time.perf_counter()
+	exact = sum(1 for read in reads for adapter in adapters if adapter in read)
+	exact_time = time.perf_counter() - start
+	print('%-20s %8.3f s  (%s hits)' % ('adapter in read', exact_time, exact))
+	for max_mismatches in (1, 2):
+		start = time.perf_counter()
+		mm = MismatchMatcher(adapters, max_mismatches)
+		hits = sum(len(mm.best_hits(read)) for read in reads)
+		mm_time = time.perf_counter() - start
+		print('%-20s %8.3f s  (%s hits; %.1fx exact search time)' % ('%s mismatch/es' % max_mismatches, mm_time, hits, mm_time / exact_time))
+
+
+if __name__ == '__main__':
+	main()
@@ -17,6 +17,13 @@ for file_name in [p, p+".gz"]:
 		for f in fh:
 			print(f)
 
+## Read files (binary mode)
+p = "file.txt"
+for file_name in [p, p+".gz"]:
+	with File(file_name, 'r', binary=True) as fh:
+		for f in fh:
+			print(f)
+
 ## Write files
 p = "file_out.txt"
 for file_name in [p, p+".gz"]:
@@ -1,4 +1,4 @@
-#!/usr/bin/env python2
+#!/usr/bin/env python3
 DESCRIPTION = '''
 add_value_to_table - Will add values into a table (via a new end column)
 		     given key:value pairs. 
@@ -7,14 +7,26 @@ NOTE:
 	- Ignore comment ('#' by defult; can be turned off) and blank lines	
 	- Uses exact string matching. Can not do regex or partial matching
 	- Assumes first column is 'key' and collowing column/s are 'value'
+		(first N columns if N -c/--col columns are given; i.e. a composite key)
 	- Assumes key is unique in -a/--add; if not unique will take the last value and print warning.
-	- Will always add 'blank' values if target column not in key:value pairs.
+	   Use --duplicates to write a report of the duplicated keys.
+	- Will always add 'blank' values if target column not in key:value pairs (default --join left).
+	- Multiple -a/--add files are joined in one pass (one new column per file, in the order given).
+	- All -a/--add files are loaded into memory (dict; hash-join).
+	   OR use --build_index once to write an on disk index for each -a/--add file
+	   (info_to_add.txt.kidx; sorted keys + offsets into info_to_add.txt), then --index
+	   to look keys up in the index instead of loading -a/--add (values are read from
+	   -a/--add only for keys that are found). -a/--add must be plain text or bgzip.
 '''
 import sys
 import os
 import argparse
-import gzip
 import logging
+from operator import itemgetter
+from collections import Counter
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'Python'))
+from src.keyindex import KeyIndex, KeyIndexError, build_key_index, INDEX_SUFFIX
+from src.files import File
 
 VERSION=0.1
 
@@ -23,20 +35,36 @@ def main():
 	# Pass command line arguments. 
 	parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter, description=DESCRIPTION)
 	parser.add_argument('-i', '--input', metavar='data_file.txt', 
-		required=False, default=sys.stdin, type=lambda x: File(x, 'r'), 
-		help='Input [gzip] file (default: stdin)'
+		required=False, default='-', type=lambda x: File(x, 'r'), 
+		help='Input [gzip/bgzip/zstd] file (default: stdin)'
 	)
 	parser.add_argument('-o', '--output', metavar='data_file_with_extra_column.txt', 
-		required=False, default=sys.stdout, type=lambda x: File(x, 'w'), 
-		help='Output [gzip] file (default: stdout)'
+		required=False, default='-', type=lambda x: File(x, 'w'), 
+		help='Output [gzip/bgzip/zstd] file (default: stdout)'
 	)
 	parser.add_argument('-a', '--add', metavar='info_to_add.txt', 
-		required=True, type=lambda x: File(x, 'r'), 
-		help='Input [gzip] key:value pairs'
+		required=True, nargs='+', type=str, 
+		help='Input [gzip/bgzip/zstd] key:value pairs (can give multiple files; a value column is added for each file)'
 	)
 	parser.add_argument('-c', '--col', 
-		required=False, default=1, type=int, 
-		help='Column in --input of interest'
+		required=False, default=[1], nargs='+', type=int, 
+		help='Column/s in --input of interest (multiple columns == composite key; matched to the first columns of --add) (default: 1)'
+	)
+	parser.add_argument('-j', '--join', 
+		required=False, default='left', choices=['left', 'inner', 'anti'], 
+		help='left: all lines; inner: only lines with key in every --add file; anti: only lines with key missing from at least one --add file (default: %(default)s)'
+	)
+	parser.add_argument('--duplicates', metavar='duplicate_keys.txt', 
+		required=False, default=None, type=lambda x: File(x, 'w'), 
+		help='Write keys which occur multiple times in --add (file, key, count) (default: %(default)s)'
+	)
+	parser.add_argument('--build_index', 
+		required=False, action='store_true', 
+		help='Write index for each -a/--add file (<file>%s; for the -c/--col key columns and --delim_add) and exit (default: %%(default)s)' % INDEX_SUFFIX
+	)
+	parser.add_argument('--index', 
+		required=False, action='store_true', 
+		help='Use the index of each -a/--add file (from --build_index) instead of loading it into memory (default: %(default)s)'
 	)
 	parser.add_argument('-d', '--default', 
 		required=False, default='', type=str, 
@@ -68,124 +96,171 @@ def main():
 	
 	logging.debug('%s', args) ## DEBUG
 	
-	with args.add as add_file:
-		info2add = load_key_value_from_file(add_file, args.delim_add)
+	if min(args.col) < 1:
+		parser.error('-c/--col must be >= 1')
+	for add in args.add:
+		if not os.path.exists(add):
+			parser.error('The file %s does not exist!' % add)
 	
-	with args.input as input_file, args.output as output_file:
-		# For each line in input file
-		for line in input_file:
-			line = line.strip('\n')
-			if not line:
-				continue
-			
-			if line.startswith('#'):
-				if args.keep_comments:
-					output_file.write(line + '\n')
-				continue
-			
-			line_sep = line.split(args.delim_input)
-			
+	if args.build_index:
+		for add in args.add:
+			## Lines are stripped of whitespace (keys and values), like load_key_value_from_file()
 			try:
-				key = line_sep[args.col-1]
-				if key in info2add.keys():
-					output_file.write(line + args.delim_input + info2add[key] + '\n')
-					logging.debug('Value added: %s:%s', key, info2add[key]) ## DEBUG
-				else:
-					output_file.write(line + args.delim_input + args.default + '\n')
-					logging.debug('Default added: %s', args.default) ## DEBUG
-			except IndexError:
-				logging.info("[ERROR]: %s", line)
-				logging.info("[ERROR]: -c/--col %s out of range for --infile", args.col)
-				sys.exit(1)
+				n = build_key_index(add, len(args.col), args.delim_add, strip_whitespace=True)
+			except KeyIndexError as e:
+				parser.error('%s' % e)
+			with KeyIndex(add) as idx:
+				for key, count in idx.duplicates():
+					logging.info('[WARNING]: %s occurs multiple times - taking latest entry.', key) ## DEBUG
+			logging.info('Indexed %s keys: %s%s', n, add, INDEX_SUFFIX)
+		return
+	
+	# Load key:value pairs (or open index) from each --add file
+	info2add_list = []
+	duplicates = []
+	for add in args.add:
+		if args.index:
+			try:
+				info2add = open_key_index(add, len(args.col), args.delim_add)
+			except KeyIndexError as e:
+				parser.error('%s' % e)
+			file_duplicates = Counter(dict(info2add.duplicates())) if args.duplicates is not None else Counter()
+		else:
+			with File(add, 'r') as add_file:
+				info2add, file_duplicates = load_key_value_from_file(add_file, args.delim_add, len(args.col))
+		info2add_list.append(info2add)
+		duplicates.append(file_duplicates)
+	
+	if args.duplicates is not None:
+		with args.duplicates as duplicates_file:
+			write_duplicates(duplicates_file, args.add, duplicates)
+	
+	with args.input as input_file, args.output as output_file:
+		add_values(input_file, output_file, info2add_list, args.col, args.default, args.delim_input, args.keep_comments, args.join)
+	
+	if args.index:
+		for info2add in info2add_list:
+			info2add.close()
+
+
+
+def open_key_index(file_name, key_cols, delim):
+	'''
+	Open index of key:value file; check it was built (by this script) with the same key columns and delimiter.
+	'''
+	idx = KeyIndex(file_name)
+	if idx.key_cols != key_cols or idx.delim != delim or not idx.strip_whitespace:
+		idx.close()
+		raise KeyIndexError('%s%s was built for %s key column/s with delimiter %r%s (rebuild with --build_index)' % (file_name, INDEX_SUFFIX, idx.key_cols, idx.delim, '' if idx.strip_whitespace else ' by add_value_to_table_SQLite3.py'))
+	return idx
+
+
+
+def add_values(input_file, output_file, info2add_list, cols, default, delim_input, keep_comments, join='left'):
+	'''
+	Hash-join the lines in input_file with the key:value dicts in info2add_list.
+	
+	join:
+		left  - Output all lines; add value from each dict (or default if key not in dict)
+		inner - Only output lines with keys in every dict
+		anti  - Only output lines with keys missing from at least one dict (without added values)
+	'''
+	get_key = itemgetter(*[x-1 for x in cols])
+	debug = logging.getLogger().isEnabledFor(logging.DEBUG)
 	
+	# For each line in input file
+	for line in input_file:
+		line = line.strip('\n')
+		if not line:
+			continue
+		
+		if line.startswith('#'):
+			if keep_comments:
+				output_file.write(line + '\n')
+			continue
+		
+		line_sep = line.split(delim_input)
+		
+		try:
+			key = get_key(line_sep)
+		except IndexError:
+			logging.info("[ERROR]: %s", line)
+			logging.info("[ERROR]: -c/--col %s out of range for --infile", ','.join([str(x) for x in cols]))
+			sys.exit(1)
+		
+		values = [info2add.get(key) for info2add in info2add_list]
+		found = None not in values
+		
+		if join == 'inner' and not found:
+			continue
+		if join == 'anti':
+			if not found:
+				output_file.write(line + '\n')
+			continue
+		
+		if not found:
+			values = [default if value is None else value for value in values]
+		if debug:
+			for info2add, value in zip(info2add_list, values):
+				if key in info2add:
+					logging.debug('Value added: %s:%s', key, value) ## DEBUG
+				else:
+					logging.debug('Default added: %s', default) ## DEBUG
+		output_file.write(line + delim_input + delim_input.join(values) + '\n')
 
 
 
-def load_key_value_from_file(keyvalue_file, delim):
+def load_key_value_from_file(keyvalue_file, delim, key_cols=1):
 	'''
 	Loads a dict of key:value pairs to add to table.
+	Key is the first key_cols columns (a tuple if key_cols > 1); value is the remaining columns.
+	
+	Returns:
+		dict of key:value pairs, Counter of the number of times each duplicated key was seen.
 	'''
 	info2add = {}
-	ids_seen = []
+	duplicates = Counter()
+	get_key = itemgetter(*range(key_cols))
 	for line in keyvalue_file:
 		line = line.strip()
 		if not line or line.startswith('#'):
 			continue
-		line_split = line.split(delim)
+		## Only split off the key columns; the rest of the line is the value
+		line_split = line.split(delim, key_cols)
 		
-		key = line_split[0]
-		if key in ids_seen:
+		try:
+			key = get_key(line_split)
+		except IndexError:
+			logging.info("[ERROR]: %s", line)
+			logging.info("[ERROR]: less than %s key columns in --add file", key_cols)
+			sys.exit(1)
+		if key in info2add:
 			logging.info('[WARNING]: %s occurs multiple times - taking latest entry.', key) ## DEBUG
-		ids_seen.append(key)
+			duplicates[key] += 1
 		
-		info2add[key] = delim.join(line_split[1:])
+		info2add[key] = line_split[key_cols] if len(line_split) > key_cols else ''
 	
+	# Count first occurrence as well
+	for key in duplicates:
+		duplicates[key] += 1
 	
 	logging.debug('Pairs: %s', info2add) ## DEBUG
-	logging.debug('Number of keys loaded: %s', len(info2add.keys())) ## DEBUG
-	return info2add
+	logging.debug('Number of keys loaded: %s', len(info2add)) ## DEBUG
+	logging.debug('Number of duplicated keys: %s', len(duplicates)) ## DEBUG
+	return info2add, duplicates
 
 
 
-class File(object):
+def write_duplicates(duplicates_file, file_names, duplicates):
 	'''
-	Context Manager class for opening stdin/stdout/normal/gzip files.
-
-	 - Will check that file exists if mode='r'
-	 - Will open using either normal open() or gzip.open() if *.gz extension detected.
-	 - Designed to be handled by a 'with' statement (other wise __enter__() method wont
-	    be run and the file handle wont be returned)
-
-	NOTE:
-		- Can't use .close() directly on this class unless you uncomment the close() method
-		- Can't use this class with a 'for' loop unless you uncomment the __iter__() method
-			- In this case you should also uncomment the close() method as a 'for'
-			   loop does not automatically cloase files, so you will have to do this
-			   manually.
-		- __iter__() and close() are commented out by default as it is better to use a 'with'
-		   statement instead as it will automatically close files when finished/an exception
-		   occures.
-		- Without __iter__() and close() this object will return an error when directly closed
-		   or you attempt to use it with a 'for' loop. This is to force the use of a 'with'
-		   statement instead.
-
-	Code based off of context manager tutorial from: https://book.pythontips.com/en/latest/context_managers.html
+	Write report of keys that occur multiple times in each --add file.
+	File name, key, number of times key was seen.
 	'''
-	def __init__(self, file_name, mode):
-		## Upon initializing class open file (using gzip if needed)
-		self.file_name = file_name
-		self.mode = mode
-
-		## Check file exists if mode='r'
-		if not os.path.exists(self.file_name) and mode == 'r':
-			raise argparse.ArgumentTypeError("The file %s does not exist!" % self.file_name)
-
-		## Open with gzip if it has the *.gz extension, else open normally (including stdin)
-		try:
-			if self.file_name.endswith(".gz"):
-				#print "Opening gzip compressed file (mode: %s): %s" % (self.mode, self.file_name) ## DEBUG
-				self.file_obj = gzip.open(self.file_name, self.mode+'b')
-			else:
-				#print "Opening normal file (mode: %s): %s" % (self.mode, self.file_name) ## DEBUG
-				self.file_obj = open(self.file_name, self.mode)
-		except IOError as e:
-			raise argparse.ArgumentTypeError('%s' % e)
-	def __enter__(self):
-		## Run When 'with' statement uses this class.
-		#print "__enter__: %s" % (self.file_name) ## DEBUG
-		return self.file_obj
-	def __exit__(self, type, value, traceback):
-		## Run when 'with' statement is done with object. Either because file has been exhausted, we are done writing, or an error has been encountered.
-		#print "__exit__: %s" % (self.file_name) ## DEBUG
-		self.file_obj.close()
-#	def __iter__(self):
-#		## iter method need for class to work with 'for' loops
-#		#print "__iter__: %s" % (self.file_name) ## DEBUG
-#		return self.file_obj
-#	def close(self):
-#		## method to call .close() directly on object.
-#		#print "close: %s" % (self.file_name) ## DEBUG
-#		self.file_obj.close()
+	for file_name, file_duplicates in zip(file_names, duplicates):
+		for key, count in file_duplicates.items():
+			if isinstance(key, tuple):
+				key = '\t'.join(key)
+			duplicates_file.write('%s\t%s\t%s\n' % (file_name, key, count))
 
 
 
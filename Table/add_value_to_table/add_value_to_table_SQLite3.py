@@ -1,4 +1,4 @@
-#!/usr/bin/env python2
+#!/usr/bin/env python3
 DESCRIPTION = '''
 add_value_to_table - Will add values into a table (via a new end column)
                      given key:value pairs. 
@@ -11,12 +11,26 @@ NOTE:
 	- Will always add 'blank' values if target column not in key:value pairs.
 
 Uses SQLite3 to work quickly with large --add files.
+	- Use --on_disk to store the --add file in a temporary SQLite3 database on disk
+	   (in --tmp_dir) instead of in memory. Peak memory is then fixed (SQLite3 page cache
+	   [--cache_mb] + one batch of --input lines [--batch_size]) regardless of the size of --add.
+	- --add is bulk loaded (executemany) and the key index is built after loading.
+	- Keys are looked up in batches (SELECT ... WHERE key IN (...)); output order is unchanged.
+	- Use --build_index once to write an on disk index of --add (info_to_add.txt.kidx;
+	   sorted keys + offsets into info_to_add.txt), then --index to look keys up in
+	   the index instead of loading --add into SQLite3. --add must be plain text or bgzip.
 
 '''
+import os
 import sys
 import argparse
 import logging
 import sqlite3
+import tempfile
+from itertools import islice
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'Python'))
+from src.keyindex import KeyIndex, KeyIndexError, build_key_index, INDEX_SUFFIX
+from src.files import File
 
 VERSION=0.1
 
@@ -24,14 +38,20 @@ VERSION=0.1
 def main():
 	# Pass command line arguments. 
 	parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter, description=DESCRIPTION)
-	parser.add_argument('-i', '--input', metavar='data_file.txt', default=sys.stdin, type=argparse.FileType('r'), required=False, help='Input file (default: stdin)')
-	parser.add_argument('-o', '--output', metavar='data_file_with_extra_column.txt', default=sys.stdout, type=argparse.FileType('w'), required=False, help='Output file (default: stdout)')
-	parser.add_argument('-a', '--add', metavar='info_to_add.txt', type=argparse.FileType('r'), required=True, help='Input key:value pairs')
+	parser.add_argument('-i', '--input', metavar='data_file.txt', default='-', type=lambda x: File(x, 'r'), required=False, help='Input [gzip/bgzip/zstd] file (default: stdin)')
+	parser.add_argument('-o', '--output', metavar='data_file_with_extra_column.txt', default='-', type=lambda x: File(x, 'w'), required=False, help='Output [gzip/bgzip/zstd] file (default: stdout)')
+	parser.add_argument('-a', '--add', metavar='info_to_add.txt', type=str, required=True, help='Input [gzip/bgzip/zstd] key:value pairs')
 	parser.add_argument('-c', '--col', default=1, type=int, required=False, help='Column in --input of interest')
 	parser.add_argument('-d', '--default', default='', type=str, required=False, help='Value to add if not in -a/--add (default: %(default)s)')
 	parser.add_argument('--delim_input', default='\t', type=str, required=False, help='Delimiter for --input (default: \\t)')
 	parser.add_argument('--delim_add', default='\t', type=str, required=False, help='Delimiter for --add (default: \\t)')
 	parser.add_argument('--keep_comments', action='store_true', required=False, help='Keep comment lines from input file in output file (default: %(default)s)')
+	parser.add_argument('--on_disk', action='store_true', required=False, help='Store --add in a temporary on disk database (default: in memory)')
+	parser.add_argument('--tmp_dir', default=None, type=str, required=False, help='Directory for --on_disk database and SQLite3 temp files (default: system temp dir)')
+	parser.add_argument('--cache_mb', default=256, type=int, required=False, help='SQLite3 page cache size in MB (default: %(default)s)')
+	parser.add_argument('--build_index', action='store_true', required=False, help='Write index of --add (<file>%s) and exit (default: %%(default)s)' % INDEX_SUFFIX)
+	parser.add_argument('--index', action='store_true', required=False, help='Use the index of --add (from --build_index) instead of loading it into SQLite3 (default: %(default)s)')
+	parser.add_argument('--batch_size', default=500, type=int, required=False, help='Number of --input lines to look up per query (default: %(default)s)')
 	parser.add_argument('--debug', action='store_true', required=False, help='Print DEBUG info (default: %(default)s)')
 	args = parser.parse_args()
 	
@@ -43,70 +63,184 @@ def main():
 	
 	logging.debug('%s', args) ## DEBUG
 	
-	db = sqlite3.connect(":memory:")
-	load_key_value_from_file(db, args.add, args.delim_add)
-	add_new_column(db, args.input, args.output, args.col, args.default, args.delim_input, args.keep_comments)
+	if not os.path.exists(args.add):
+		parser.error('The file %s does not exist!' % args.add)
+	if args.batch_size < 1:
+		parser.error('--batch_size must be >= 1')
+	if args.cache_mb < 1:
+		parser.error('--cache_mb must be >= 1')
+	if args.tmp_dir is not None:
+		if not os.path.isdir(args.tmp_dir):
+			parser.error('--tmp_dir %s does not exist' % args.tmp_dir)
+		## SQLite3 puts its temp files (e.g. for sorting when building the index) in SQLITE_TMPDIR
+		os.environ['SQLITE_TMPDIR'] = args.tmp_dir
+	
+	if args.build_index:
+		try:
+			n = build_key_index(args.add, 1, args.delim_add)
+		except KeyIndexError as e:
+			parser.error('%s' % e)
+		logging.info('Indexed %s keys: %s%s', n, args.add, INDEX_SUFFIX)
+		return
+	
+	if args.index:
+		try:
+			idx = KeyIndex(args.add)
+		except KeyIndexError as e:
+			parser.error('%s' % e)
+		if idx.key_cols != 1 or idx.delim != args.delim_add or idx.strip_whitespace:
+			parser.error('%s%s was built for %s key column/s with delimiter %r%s (rebuild with --build_index)' % (args.add, INDEX_SUFFIX, idx.key_cols, idx.delim, ' by add_value_to_table.py' if idx.strip_whitespace else ''))
+		with idx, args.input as input_file, args.output as output_file:
+			add_new_column(lambda keys: select_values_from_index(idx, keys), input_file, output_file, args.col, args.default, args.delim_input, args.keep_comments, args.batch_size)
+		return
+	
+	db_path = ':memory:'
+	if args.on_disk:
+		fd, db_path = tempfile.mkstemp(prefix='add_value_to_table.', suffix='.sqlite3', dir=args.tmp_dir)
+		os.close(fd)
+		logging.debug('On disk database: %s', db_path) ## DEBUG
+	try:
+		db = open_database(db_path, args.cache_mb)
+		with File(args.add, 'r') as add_file:
+			load_key_value_from_file(db, add_file, args.delim_add)
+		c = db.cursor()
+		with args.input as input_file, args.output as output_file:
+			add_new_column(lambda keys: select_values(c, keys), input_file, output_file, args.col, args.default, args.delim_input, args.keep_comments, args.batch_size)
+		db.close()
+	finally:
+		if args.on_disk:
+			os.remove(db_path)
 
 
 
-def add_new_column(db, input_file, output_file, col, default, delim_input, keep_comments):
-	c = db.cursor()
-	# For each line in input file
-	for line in input_file:
-		line = line.strip('\n')
-		if not line:
-			continue
-		
-		if line.startswith('#'):
-			if keep_comments:
-				output_file.write(line + '\n')
-			continue
+def open_database(db_path, cache_mb):
+	'''
+	Open SQLite3 database tuned for a single bulk load followed by read only lookups.
+	The database is temporary, so no journal/syncing is needed.
+	'''
+	db = sqlite3.connect(db_path)
+	db.execute('PRAGMA journal_mode=OFF')
+	db.execute('PRAGMA synchronous=OFF')
+	db.execute('PRAGMA locking_mode=EXCLUSIVE')
+	db.execute('PRAGMA temp_store=FILE')
+	db.execute('PRAGMA cache_size=%d' % (-1024 * cache_mb)) # Negative == size in KiB
+	return db
+
+
+
+def add_new_column(select, input_file, output_file, col, default, delim_input, keep_comments, batch_size=500):
+	'''
+	Add value to each line of input_file; select(keys) returns dict of key:[values] for a batch of keys.
+	'''
+	debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+	
+	lines = iter(input_file)
+	while True:
+		batch = list(islice(lines, batch_size))
+		if not batch:
+			break
 		
-		line_sep = line.split(delim_input)
-		try:
-			key = line_sep[col-1]
-		except IndexError:
-			logging.info("[ERROR]: %s", line)
-			logging.info("[ERROR]: -c/--col %s out of range for --infile", col)
-			sys.exit(1)
+		# Get keys for batch of lines (None for comment/blank lines)
+		keys = []
+		for line in batch:
+			line = line.strip('\n')
+			if not line or line.startswith('#'):
+				keys.append(None)
+				continue
+			
+			line_sep = line.split(delim_input)
+			try:
+				keys.append(line_sep[col-1])
+			except IndexError:
+				logging.info("[ERROR]: %s", line)
+				logging.info("[ERROR]: -c/--col %s out of range for --infile", col)
+				sys.exit(1)
 		
-		c.execute('SELECT value FROM values2add WHERE key=?', (key, ))
-		value = [x[0] for x in c.fetchall()]
-		logging.debug('Values selected for key %s : %s', key, value) ## DEBUG
+		values = select(set(keys) - set([None]))
 		
-		if len(value) > 1:
-			logging.warning('%s occurs multiple times - taking just one entry.', key) ## DEBUG
-			output_file.write(line + delim_input + value[0] + '\n')
-			logging.debug('Value added: %s:%s', key, value[0]) ## DEBUG
-		elif len(value) == 1:
-			output_file.write(line + delim_input + value[0] + '\n')
-			logging.debug('Value added: %s:%s', key, value[0]) ## DEBUG
-		else:
-			output_file.write(line + delim_input + default + '\n')
-			logging.debug('Default added: %s', default) ## DEBUG
+		# For each line in batch
+		for line, key in zip(batch, keys):
+			line = line.strip('\n')
+			if key is None:
+				if line and keep_comments:
+					output_file.write(line + '\n')
+				continue
+			
+			value = values.get(key, [])
+			if debug:
+				logging.debug('Values selected for key %s : %s', key, value) ## DEBUG
+			
+			if len(value) > 1:
+				logging.warning('%s occurs multiple times - taking just one entry.', key) ## DEBUG
+				output_file.write(line + delim_input + value[0] + '\n')
+				if debug:
+					logging.debug('Value added: %s:%s', key, value[0]) ## DEBUG
+			elif len(value) == 1:
+				output_file.write(line + delim_input + value[0] + '\n')
+				if debug:
+					logging.debug('Value added: %s:%s', key, value[0]) ## DEBUG
+			else:
+				output_file.write(line + delim_input + default + '\n')
+				if debug:
+					logging.debug('Default added: %s', default) ## DEBUG
+
+
+
+def select_values(c, keys):
+	'''
+	Returns dict of key:[values] for the keys found in the database (one query for all keys).
+	Values are in the order they were loaded (the key index is sorted by key then rowid).
+	'''
+	values = {}
+	if not keys:
+		return values
+	keys = list(keys)
+	c.execute('SELECT key, value FROM values2add INDEXED BY key_index WHERE key IN (%s)' % ','.join(['?'] * len(keys)), keys)
+	for key, value in c:
+		values.setdefault(key, []).append(value)
+	return values
+
+
+
+def select_values_from_index(idx, keys):
+	'''
+	Returns dict of key:[values] for the keys found in the index (values in file order).
+	'''
+	values = {}
+	for key in keys:
+		key_values = idx.get_all(key)
+		if key_values:
+			values[key] = key_values
+	return values
 
 
 
 def load_key_value_from_file(db, keyvalue_file, delim):
 	'''
 	Loads a table of key:value pairs using SQLite3.
+	Rows are streamed into the table (executemany) and the index is built once loading is finished.
 	'''
 	c = db.cursor()
 	c.execute('CREATE TABLE values2add (key, value)')
+	c.executemany('INSERT INTO values2add (key, value) VALUES (?, ?)', parse_key_value_lines(keyvalue_file, delim))
 	c.execute('CREATE INDEX key_index ON values2add (key)')
 	db.commit()
-	
-	c = db.cursor()
+
+
+
+def parse_key_value_lines(keyvalue_file, delim):
+	'''
+	Yields (key, value) for each line in file.
+	'''
 	for line in keyvalue_file:
 		line = line.strip('\n')
 		if not line or line.startswith('#'):
 			continue
 		
-		line_split = line.split(delim)
+		line_split = line.split(delim, 1)
 		key = line_split[0]
-		value = delim.join(line_split[1:])
-		c.execute('INSERT INTO values2add (key, value) VALUES (?, ?)', (key, value))
-	db.commit()
+		value = line_split[1] if len(line_split) > 1 else ''
+		yield key, value
 
 
 if __name__ == '__main__':
@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+'''
+Benchmark the add_value_to_table.py hash-join with synthetic data.
+
+Thin wrapper around Table/benchmark/benchmark_tables.py -t add_value_to_table
+(see that script for the synthetic data and the JSON result records).
+
+Usage:
+	./benchmark_join.py [num_rows] [duplicate_rate] [tmp_dir]
+
+NOTE:
+	- Default is 10M rows; 10M rows needs ~2.5GB of free disk (in tmp_dir) and ~2-3GB of RAM for the dict.
+	- Run with a smaller num_rows (e.g. 1000000) for a quick check.
+'''
+import os
+import sys
+import subprocess
+
+BENCHMARK = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'benchmark', 'benchmark_tables.py')
+
+
+def main():
+	num_rows = sys.argv[1] if len(sys.argv) > 1 else '10000000'
+	duplicate_rate = sys.argv[2] if len(sys.argv) > 2 else '0.001'
+	cmd = [sys.executable, BENCHMARK, '-t', 'add_value_to_table', '-r', num_rows, '--dup_rate', duplicate_rate]
+	if len(sys.argv) > 3:
+		cmd += ['--tmp_dir', sys.argv[3]]
+	sys.exit(subprocess.call(cmd))
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+DESCRIPTION = '''
+benchmark_tables - Benchmark the Table/ scripts on synthetic tables.
+
+Generates synthetic tables for each -r/--rows size and runs each of the Table/ scripts on them,
+recording the wall time, throughput and peak RSS of each run (one JSON object per line).
+A scaling record is written for each tool at the end (exponent of time ~ rows^k, fitted by
+least squares on log(time) vs log(rows); ~1 == linear).
+
+Synthetic data (per --rows size):
+	table.tsv  - key (--keys distinct values), score (float), then --cols-2 random columns
+	add.tsv    - key:value pairs for every other key (--dup_rate of keys repeated)
+	ids.txt    - every other key (for grepf_column.py)
+	names.txt  - half of the column names, in reverse order (for order_columns.py)
+
+e.g. benchmark_tables.py -r 10000 100000 1000000 -c 20 -o results.jsonl
+     (compare results.jsonl from two commits to catch performance regressions)
+
+NOTE:
+	- Scripts are run with the python running this script.
+	- Peak RSS is the max resident set size of the script process (os.wait4).
+'''
+import os
+import sys
+import random
+import shutil
+import argparse
+import logging
+import tempfile
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'Python'))
+from src.benchmark import run_command, benchmark_result, write_result, scaling_exponent
+
+TABLE_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..')
+
+## tool: (script, arguments); {table}, {add}, {ids}, {names}, {output} are replaced with file paths.
+TOOLS = {
+	'add_value_to_table': ('add_value_to_table/add_value_to_table.py', ['-i', '{table}', '-a', '{add}', '-c', '1', '-d', 'NA', '-o', '{output}']),
+	'add_value_to_table_SQLite3': ('add_value_to_table/add_value_to_table_SQLite3.py', ['-i', '{table}', '-a', '{add}', '-c', '1', '-d', 'NA', '-o', '{output}']),
+	'add_value_to_table_SQLite3_on_disk': ('add_value_to_table/add_value_to_table_SQLite3.py', ['-i', '{table}', '-a', '{add}', '-c', '1', '-d', 'NA', '--on_disk', '--tmp_dir', '{tmp_dir}', '-o', '{output}']),
+	'grepf_column': ('grepf_column/grepf_column.py', ['-i', '{table}', '-f', '{ids}', '-c', '1', '-o', '{output}']),
+	'groupby': ('groupby/groupby.py', ['-i', '{table}', '-a', 'count', '-o', '{output}']),
+	'groupby_external': ('groupby/groupby.py', ['-i', '{table}', '-a', 'count', '--external', '--tmp_dir', '{tmp_dir}', '-o', '{output}']),
+	'head_groupby': ('head_groupby/head_groupby.py', ['-i', '{table}', '-n', '5', '--keep_header', '-o', '{output}']),
+	'head_groupby_ranked': ('head_groupby/head_groupby.py', ['-i', '{table}', '-n', '5', '-s', '2', '--keep_header', '-o', '{output}']),
+	'order_columns': ('order_columns/order_columns.py', ['-i', '{table}', '-f', '{names}', '-o', '{output}']),
+}
+
+
+## Pass arguments.
+def main():
+	# Pass command line arguments.
+	parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter, description=DESCRIPTION)
+	parser.add_argument('-o', '--output', metavar='results.jsonl', default=sys.stdout, type=argparse.FileType('w'), required=False, help='Output file of results (JSON lines) (default: stdout)')
+	parser.add_argument('-r', '--rows', default=[10000, 100000, 1000000], nargs='+', type=int, required=False, help='Number of rows of each table size (default: %(default)s)')
+	parser.add_argument('-c', '--cols', default=10, type=int, required=False, help='Number of columns (default: %(default)s)')
+	parser.add_argument('-k', '--keys', default=0.1, type=float, required=False, help='Key cardinality; number of distinct keys (>= 1) or fraction of rows (< 1) (default: %(default)s)')
+	parser.add_argument('--dup_rate', default=0.01, type=float, required=False, help='Fraction of keys that are duplicated in add.tsv (default: %(default)s)')
+	parser.add_argument('-t', '--tools', default=sorted(TOOLS.keys()), nargs='+', choices=sorted(TOOLS.keys()), required=False, help='Tools to benchmark (default: all)')
+	parser.add_argument('--repeats', default=1, type=int, required=False, help='Number of times to run each tool (fastest run is kept) (default: %(default)s)')
+	parser.add_argument('--seed', default=42, type=int, required=False, help='Random seed (default: %(default)s)')
+	parser.add_argument('--tmp_dir', default=None, type=str, required=False, help='Directory for synthetic tables (default: system temp dir)')
+	parser.add_argument('--debug', action='store_true', required=False, help='Print DEBUG info (default: %(default)s)')
+	args = parser.parse_args()
+	
+	# Set up basic debugger
+	logFormat = "[%(levelname)s]: %(message)s"
+	logging.basicConfig(format=logFormat, stream=sys.stderr, level=logging.INFO)
+	if args.debug:
+		logging.getLogger().setLevel(logging.DEBUG)
+	
+	logging.debug('%s', args) ## DEBUG
+	
+	if args.cols < 3:
+		parser.error('-c/--cols must be >= 3')
+	if min(args.rows) < 1 or args.keys <= 0 or args.repeats < 1:
+		parser.error('-r/--rows, -k/--keys and --repeats must be > 0')
+	if not 0 <= args.dup_rate <= 1:
+		parser.error('--dup_rate must be between 0 and 1')
+	
+	results = []
+	for num_rows in sorted(args.rows):
+		num_keys = max(1, int(args.keys if args.keys >= 1 else num_rows * args.keys))
+		data_dir = tempfile.mkdtemp(prefix='benchmark_tables.', dir=args.tmp_dir)
+		try:
+			files = write_test_data(data_dir, num_rows, args.cols, num_keys, args.dup_rate, args.seed)
+			table_mb = os.path.getsize(files['table']) / 1024.0 / 1024.0
+			logging.info('Generated %s rows x %s cols (%.1f MB; %s keys)', num_rows, args.cols, table_mb, num_keys) ## INFO
+			for tool in args.tools:
+				runs = [run_tool(tool, files) for _ in range(args.repeats)]
+				result = benchmark_result(tool, num_rows, table_mb, runs, cols=args.cols, keys=num_keys, dup_rate=args.dup_rate)
+				results.append(result)
+				write_result(args.output, result)
+				logging.info('%-36s %8.2f s  %10.0f rows/sec  %8.1f MB peak RSS', tool, result['seconds'], result['rows_per_sec'], result['peak_rss_mb']) ## INFO
+		finally:
+			shutil.rmtree(data_dir)
+	
+	# Scaling curves
+	for tool in args.tools:
+		points = [(x['rows'], x['seconds']) for x in results if x['tool'] == tool and x['returncode'] == 0]
+		exponent = scaling_exponent(points)
+		write_result(args.output, {'tool': tool, 'scaling_exponent': exponent, 'curve': points})
+		if exponent is not None:
+			logging.info('%-36s time ~ rows^%.2f', tool, exponent) ## INFO
+
+
+
+def write_test_data(data_dir, num_rows, num_cols, num_keys, dup_rate, seed=42):
+	'''
+	Write synthetic tables to data_dir. Returns dict of file type: path.
+	'''
+	random.seed(seed)
+	files = {x: os.path.join(data_dir, x + ext) for x, ext in [('table', '.tsv'), ('add', '.tsv'), ('ids', '.txt'), ('names', '.txt')]}
+	col_names = ['key', 'score'] + ['col%s' % i for i in range(3, num_cols+1)]
+	with open(files['table'], 'w') as out:
+		out.write('\t'.join(col_names) + '\n')
+		other_cols = num_cols - 2
+		for i in range(num_rows):
+			out.write('key%s\t%.2f\t%s\n' % (random.randrange(num_keys), random.random() * 1000, '\t'.join([str(random.randrange(100000)) for _ in range(other_cols)])))
+	with open(files['add'], 'w') as add_out, open(files['ids'], 'w') as ids_out:
+		for i in range(0, num_keys, 2):
+			add_out.write('key%s\tvalue%s\n' % (i, i))
+			if random.random() < dup_rate:
+				add_out.write('key%s\tvalue%s_dup\n' % (i, i))
+			ids_out.write('key%s\n' % i)
+	with open(files['names'], 'w') as out:
+		out.write('\n'.join(col_names[::-2]) + '\n')
+	files['output'] = os.path.join(data_dir, 'output.tsv')
+	files['tmp_dir'] = data_dir
+	return files
+
+
+
+def run_tool(tool, files):
+	'''
+	Run tool on files. Returns (wall time in seconds, peak RSS in MB, return code).
+	'''
+	script, arguments = TOOLS[tool]
+	cmd = [sys.executable, os.path.join(TABLE_DIR, script)] + [x.format(**files) for x in arguments]
+	return run_command(cmd)
+
+
+
+if __name__ == '__main__':
+	main()
@@ -1,4 +1,4 @@
-#!/usr/bin/env python2
+#!/usr/bin/env python3
 DESCRIPTION = '''
 grepf_column - Mimics the functionality of 'grep -f' but with exact string mathcing and 
                the ability to specifiy the column of interest.
@@ -6,10 +6,23 @@ grepf_column - Mimics the functionality of 'grep -f' but with exact string mathc
 NOTE:
 	- Ignore comment ('#') and blank lines	
 	- Uses exact string matching. Can not do regex or partial matching
+	   (unless --filter prefix/regex/range is used; see below)
+
+Multiple column filters can be applied in one pass with --filter TYPE COL ARG (can be given multiple times):
+	exact  COL ids.txt       - Column value is in ids.txt (same as -f/-c)
+	prefix COL prefixes.txt  - Column value starts with one of the prefixes in prefixes.txt
+	regex  COL regexes.txt   - Column value matches (re.search) one of the regexes in regexes.txt
+	range  COL MIN:MAX       - Column value is a number between MIN and MAX (inclusive; either can be empty)
+Lines are kept if they pass all filters (or any filter with --any); -v/--invert_match returns the other lines.
+e.g. grepf_column.py -f ids.txt -c 1 --filter range 11 :1e-5 --filter prefix 2 prefixes.txt
 '''
+import re
+import os
 import sys
 import argparse
 import logging
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'Python'))
+from src.files import File
 
 VERSION=0.1
 
@@ -17,11 +30,13 @@ VERSION=0.1
 def main():
 	# Pass command line arguments. 
 	parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter, description=DESCRIPTION)
-	parser.add_argument('-i', '--input', metavar='data_to_filter.txt', default=sys.stdin, type=argparse.FileType('r'), required=False, help='Input file to filter (default: stdin)')
-	parser.add_argument('-o', '--output', metavar='data_filtered.txt', default=sys.stdout, type=argparse.FileType('w'), required=False, help='Output file of filtered values (default: stdout)')
-	parser.add_argument('-f', '--file', metavar='ids_to_grepf.txt', type=argparse.FileType('r'), required=True, help='IDs to use for seach/filter (required)')
+	parser.add_argument('-i', '--input', metavar='data_to_filter.txt', default='-', type=lambda x: File(x, 'r'), required=False, help='Input [gzip/bgzip/zstd] file to filter (default: stdin)')
+	parser.add_argument('-o', '--output', metavar='data_filtered.txt', default='-', type=lambda x: File(x, 'w'), required=False, help='Output [gzip/bgzip/zstd] file of filtered values (default: stdout)')
+	parser.add_argument('-f', '--file', metavar='ids_to_grepf.txt', type=lambda x: File(x, 'r'), required=False, help='[gzip/bgzip/zstd] IDs to use for seach/filter (required unless --filter is given)')
 	parser.add_argument('-v', '--invert_match', action='store_true', required=False, help='Return lines not in --file (default: %(default)s)')
 	parser.add_argument('-c', '--col', default=1, type=int, required=False, help='Column in --input of interest (default: %(default)s)')
+	parser.add_argument('--filter', metavar=('TYPE', 'COL', 'ARG'), nargs=3, action='append', default=[], required=False, help='Extra column filter; TYPE is exact, prefix, regex or range (see above)')
+	parser.add_argument('--any', action='store_true', required=False, help='Keep lines that pass any filter (default: must pass all filters)')
 	parser.add_argument('--delim', default='\t', type=str, required=False, help='Delimiter for --input (default: \\t)')
 	parser.add_argument('--keep_header', action='store_true', required=False, help='Keep first line as header (default: %(default)s)')
 	parser.add_argument('--debug', action='store_true', required=False, help='Print DEBUG info (default: %(default)s)')
@@ -35,33 +50,155 @@ def main():
 	
 	logging.debug('%s', args) ## DEBUG
 	
-	ids = load_id_list(args.file) # Load IDs
+	# Build filters; (column index, test function) pairs
+	filters = []
+	if args.file is not None:
+		if args.col < 1:
+			parser.error('-c/--col must be >= 1')
+		with args.file as id_fh:
+			filters.append((args.col-1, load_id_list(id_fh).__contains__)) # Load IDs
+	for filter_type, col, arg in args.filter:
+		try:
+			filters.append(build_filter(filter_type, int(col), arg))
+		except (ValueError, IOError, re.error, argparse.ArgumentTypeError) as e:
+			parser.error('--filter %s %s %s: %s' % (filter_type, col, arg, e))
+	if not filters:
+		parser.error('-f/--file and/or --filter is required')
+	
+	with args.input as input_fh, args.output as output_fh:
+		grepf(input_fh, output_fh, filters, args.delim, args.invert_match, args.any, args.keep_header)
+
+
+def grepf(input_fh, output_fh, filters, delim, invert_match=False, match_any=False, keep_header=False):
+	'''
+	Write lines from input_fh that pass filters (or that dont if invert_match).
+	Lines are only split up to the last column needed by the filters.
+	'''
+	max_col = max([col for col, test in filters]) + 1
+	match = combine_filters(filters, match_any)
+	debug = logging.getLogger().isEnabledFor(logging.DEBUG)
 	
 	# For each line in input file
-	for i, line in enumerate(args.input):
+	for i, line in enumerate(input_fh):
 		line = line.rstrip('\n')
 		if not line or line.startswith('#'):
 			continue
 		
-		if i == 0 and args.keep_header:
-			args.output.write(line + '\n')
+		if i == 0 and keep_header:
+			output_fh.write(line + '\n')
 			continue
 		
-		line_sep = line.split(args.delim)
+		line_sep = line.split(delim, max_col)
 		try:
-			if line_sep[args.col-1] in ids and not args.invert_match:
-				logging.debug('Split line: %s - MATCHING', line_sep) ## DEBUG
-				args.output.write(line + '\n')
-			
-			elif line_sep[args.col-1] not in ids and args.invert_match:
-				logging.debug('Split line: %s - NOT_MATCHING_INVERTED', line_sep) ## DEBUG
-				args.output.write(line + '\n')
-			else:
-				logging.debug('Split line: %s - SKIPPED', line_sep) ## DEBUG
+			keep = match(line_sep)
 		except IndexError:
 			logging.info("ERROR: %s", line)
-			logging.info("ERROR: -c/--col %s out of range for --infile", args.col)
+			logging.info("ERROR: -c/--col %s out of range for --infile", max_col)
 			sys.exit(1)
+		
+		if keep != invert_match:
+			output_fh.write(line + '\n')
+		if debug:
+			logging.debug('Split line: %s - %s', line_sep, 'MATCHING' if keep else 'NOT_MATCHING') ## DEBUG
+
+
+def combine_filters(filters, match_any=False):
+	'''
+	Returns function(split line) -> True if line passes all filters (or any filter if match_any).
+	'''
+	if len(filters) == 1:
+		col, test = filters[0]
+		return lambda line_sep: bool(test(line_sep[col]))
+	## Check all columns exist first (so IndexError is always raised) then short circuit
+	max_col = max([col for col, test in filters])
+	if match_any:
+		def match_some(line_sep):
+			line_sep[max_col]
+			for col, test in filters:
+				if test(line_sep[col]):
+					return True
+			return False
+		return match_some
+	def match_all(line_sep):
+		line_sep[max_col]
+		for col, test in filters:
+			if not test(line_sep[col]):
+				return False
+		return True
+	return match_all
+
+
+def build_filter(filter_type, col, arg):
+	'''
+	Returns (column index, test function) for a --filter.
+	'''
+	if col < 1:
+		raise ValueError('COL must be >= 1')
+	if filter_type == 'exact':
+		with File(arg, 'r') as fh:
+			return col-1, load_id_list(fh).__contains__
+	if filter_type == 'prefix':
+		with File(arg, 'r') as fh:
+			return col-1, prefix_filter(load_id_list(fh))
+	if filter_type == 'regex':
+		with File(arg, 'r') as fh:
+			return col-1, regex_filter(load_id_list(fh))
+	if filter_type == 'range':
+		return col-1, range_filter(arg)
+	raise ValueError('TYPE must be exact, prefix, regex or range')
+
+
+def prefix_filter(prefixes):
+	'''
+	Returns function(value) -> True if value starts with one of the prefixes.
+	Prefixes are bucketed by length, so each value needs one set lookup per distinct prefix length.
+	'''
+	by_length = {}
+	for prefix in prefixes:
+		by_length.setdefault(len(prefix), set()).add(prefix)
+	buckets = sorted(by_length.items())
+	if len(buckets) == 1:
+		length, bucket = buckets[0]
+		return lambda value: value[:length] in bucket
+	def test(value):
+		for length, bucket in buckets:
+			if value[:length] in bucket:
+				return True
+		return False
+	return test
+
+
+def regex_filter(regexes):
+	'''
+	Returns function(value) -> match if value matches any of the regexes (combined into a single compiled regex).
+	Regexes with groups (e.g. backreferences or named groups) can not be combined, so they are searched one at a time.
+	'''
+	compiled = [re.compile(x) for x in sorted(regexes)]
+	if all([x.groups == 0 for x in compiled]):
+		return re.compile('|'.join(['(?:%s)' % x.pattern for x in compiled])).search
+	def test(value):
+		for regex in compiled:
+			if regex.search(value):
+				return True
+		return False
+	return test
+
+
+def range_filter(min_max):
+	'''
+	Returns function(value) -> True if value is a number within 'MIN:MAX' (inclusive; MIN or MAX can be empty).
+	'''
+	if ':' not in min_max:
+		raise ValueError('ARG must be MIN:MAX')
+	min_value, max_value = min_max.rsplit(':', 1)
+	min_value = float(min_value) if min_value else float('-inf')
+	max_value = float(max_value) if max_value else float('inf')
+	def test(value):
+		try:
+			return min_value <= float(value) <= max_value
+		except ValueError:
+			return False
+	return test
 
 
 def load_id_list(id_file):
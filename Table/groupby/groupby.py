@@ -1,4 +1,4 @@
-#!/usr/bin/env python2
+#!/usr/bin/env python3
 DESCRIPTION = '''
 groupby - Will group and combine lines with the same value in the first column.  
 
@@ -7,21 +7,58 @@ NOTE:
 	- Uses exact string matching. Can not do regex or partial matching
 	- Will join lines in the order they appear in the file. Will also preserve the oorder of the groups as they appear in the input.
 	- Will remove column of interest from lines that are appended.
+
+Aggregations (-a/--agg) applied to the value of each line in a group
+(the line without the first column, or just --agg_col if given):
+	join   - Join values with --delim_groups (default)
+	count  - Number of lines in group
+	sum    - Sum of values (must be numeric)
+	min    - Min of values (must be numeric)
+	max    - Max of values (must be numeric)
+	first  - First value
+	unique - Join unique values (in the order they first appear) with --delim_groups
+
+Modes:
+	default         - Groups are held in memory (only the aggregated state for
+	                   count/sum/min/max/first; all values for join/unique).
+	--assume_sorted - Input is grouped by the first column (e.g. sort -k1,1); each group
+	                   is written as soon as the key changes (memory == largest group).
+	                   Lines with the same key that are not next to each other are written
+	                   as separate groups.
+	--external      - Unsorted input is split into sorted runs of --buffer_lines lines on disk
+	                   (in --tmp_dir) which are merged; the order of the groups is preserved
+	                   (memory == --buffer_lines + largest group).
 '''
+import os
 import sys
+import heapq
+import pickle
 import argparse
 import logging
+import tempfile
+from itertools import groupby, islice
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'Python'))
+from src.files import File
 
 VERSION=0.1
 
+## Number of records pickled together in the run files of --external.
+RUN_BLOCK_SIZE = 10000
+
 ## Pass arguments.
 def main():
 	# Pass command line arguments. 
 	parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter, description=DESCRIPTION)
-	parser.add_argument('-i', '--input', metavar='data_file.txt', default=sys.stdin, type=argparse.FileType('r'), required=False, help='Input file (default: stdin)')
-	parser.add_argument('-o', '--output', metavar='data_file_with_extra_column.txt', default=sys.stdout, type=argparse.FileType('w'), required=False, help='Output file (default: stdout)')
+	parser.add_argument('-i', '--input', metavar='data_file.txt', default='-', type=lambda x: File(x, 'r'), required=False, help='Input [gzip/bgzip/zstd] file (default: stdin)')
+	parser.add_argument('-o', '--output', metavar='data_file_with_extra_column.txt', default='-', type=lambda x: File(x, 'w'), required=False, help='Output [gzip/bgzip/zstd] file (default: stdout)')
 	parser.add_argument('--delim_input', default='\t', type=str, required=False, help='Delimiter for --input (default: \\t)')
 	parser.add_argument('--delim_groups', default='\t', type=str, required=False, help='Delimiter for groups in --output (default: \\t)')
+	parser.add_argument('-a', '--agg', default='join', choices=sorted(AGGREGATIONS.keys()), required=False, help='Aggregation applied to each group (default: %(default)s)')
+	parser.add_argument('--agg_col', default=None, type=int, required=False, help='Column in --input to aggregate (default: all columns after the first)')
+	parser.add_argument('--assume_sorted', action='store_true', required=False, help='Input is grouped by the first column; stream groups (default: %(default)s)')
+	parser.add_argument('--external', action='store_true', required=False, help='Spill sorted runs to --tmp_dir for large unsorted input (default: %(default)s)')
+	parser.add_argument('--buffer_lines', default=1000000, type=int, required=False, help='Lines per sorted run for --external (default: %(default)s)')
+	parser.add_argument('--tmp_dir', default=None, type=str, required=False, help='Directory for --external run files (default: system temp dir)')
 	parser.add_argument('--debug', action='store_true', required=False, help='Print DEBUG info (default: %(default)s)')
 	args = parser.parse_args()
 	
@@ -33,13 +70,137 @@ def main():
 	
 	logging.debug('%s', args) ## DEBUG
 	
-	groupby_column(args.input, args.output, args.delim_input, args.delim_groups)
+	if args.assume_sorted and args.external:
+		parser.error('--assume_sorted and --external can not be used together')
+	if args.agg_col is not None and args.agg_col < 2:
+		parser.error('--agg_col must be >= 2 (column 1 is the group key)')
+	if args.buffer_lines < 1:
+		parser.error('--buffer_lines must be >= 1')
+	if args.tmp_dir is not None and not os.path.isdir(args.tmp_dir):
+		parser.error('--tmp_dir %s does not exist' % args.tmp_dir)
 	
-def groupby_column(input_fh, output_fh, delim_input, delim_groups, col=1):
+	with args.input as input_fh, args.output as output_fh:
+		if args.assume_sorted:
+			groupby_sorted(input_fh, output_fh, args.delim_input, args.delim_groups, agg=args.agg, agg_col=args.agg_col)
+		elif args.external:
+			groupby_external(input_fh, output_fh, args.delim_input, args.delim_groups, agg=args.agg, agg_col=args.agg_col, buffer_lines=args.buffer_lines, tmp_dir=args.tmp_dir)
+		else:
+			groupby_column(input_fh, output_fh, args.delim_input, args.delim_groups, agg=args.agg, agg_col=args.agg_col)
+
+def groupby_column(input_fh, output_fh, delim_input, delim_groups, col=1, agg='join', agg_col=None):
+	'''
+	Group lines in memory; groups are written in the order they first appear.
+	'''
+	new_state, update_state, format_state = AGGREGATIONS[agg]
 	groups = {}
 	groups_order = []
 	
 	# For each line in input file
+	for key, value in parse_lines(input_fh, delim_input, col, agg_col):
+		if key in groups:
+			groups[key] = update_state(groups[key], value)
+		else:
+			groups_order.append(key)
+			groups[key] = new_state(value)
+	
+	# Print each group
+	for key in groups_order:
+		output_fh.write(key+'\t'+format_state(groups[key], delim_groups)+'\n')
+
+
+
+def groupby_sorted(input_fh, output_fh, delim_input, delim_groups, col=1, agg='join', agg_col=None):
+	'''
+	Group lines from input that is already grouped by key; write each group once the key changes.
+	'''
+	new_state, update_state, format_state = AGGREGATIONS[agg]
+	key = None
+	state = None
+	for line_key, value in parse_lines(input_fh, delim_input, col, agg_col):
+		if line_key == key:
+			state = update_state(state, value)
+		else:
+			if key is not None:
+				output_fh.write(key+'\t'+format_state(state, delim_groups)+'\n')
+			key = line_key
+			state = new_state(value)
+	if key is not None:
+		output_fh.write(key+'\t'+format_state(state, delim_groups)+'\n')
+
+
+
+def groupby_external(input_fh, output_fh, delim_input, delim_groups, col=1, agg='join', agg_col=None, buffer_lines=1000000, tmp_dir=None):
+	'''
+	Group unsorted input using sorted runs on disk; groups are written in the order they first appear.
+	
+	1. Split input into runs of buffer_lines (key, line number, value) records, sorted by key (then line number).
+	2. Merge runs; aggregate each group; write (first line number, output line) runs sorted by line number.
+	3. Merge output runs by line number.
+	'''
+	new_state, update_state, format_state = AGGREGATIONS[agg]
+	with tempfile.TemporaryDirectory(prefix='groupby.', dir=tmp_dir) as run_dir:
+		# Sorted runs of input lines
+		records = ((key, line_number, value) for line_number, (key, value) in enumerate(parse_lines(input_fh, delim_input, col, agg_col)))
+		line_runs = write_sorted_runs(records, run_dir, 'lines', buffer_lines)
+		logging.debug('Input split into %s sorted runs', len(line_runs)) ## DEBUG
+		
+		# Merge runs and aggregate groups
+		def aggregated_groups():
+			merged = heapq.merge(*[read_run(x) for x in line_runs])
+			for key, group in groupby(merged, key=lambda x: x[0]):
+				key, first_line_number, value = next(group)
+				state = new_state(value)
+				for record in group:
+					state = update_state(state, record[2])
+				yield first_line_number, key+'\t'+format_state(state, delim_groups)+'\n'
+		group_runs = write_sorted_runs(aggregated_groups(), run_dir, 'groups', buffer_lines)
+		logging.debug('Groups split into %s sorted runs', len(group_runs)) ## DEBUG
+		
+		# Merge groups back into input order
+		for first_line_number, out_line in heapq.merge(*[read_run(x) for x in group_runs]):
+			output_fh.write(out_line)
+
+
+
+def write_sorted_runs(records, run_dir, prefix, buffer_lines):
+	'''
+	Sort blocks of buffer_lines records and write each to a run file. Returns list of run files.
+	'''
+	runs = []
+	records = iter(records)
+	while True:
+		buffer = list(islice(records, buffer_lines))
+		if not buffer:
+			break
+		buffer.sort()
+		run_file = os.path.join(run_dir, '%s.%s.pkl' % (prefix, len(runs)))
+		with open(run_file, 'wb') as out:
+			for i in range(0, len(buffer), RUN_BLOCK_SIZE):
+				pickle.dump(buffer[i:i+RUN_BLOCK_SIZE], out, pickle.HIGHEST_PROTOCOL)
+		runs.append(run_file)
+	return runs
+
+
+
+def read_run(run_file):
+	'''
+	Yield records from a run file (written by write_sorted_runs()).
+	'''
+	with open(run_file, 'rb') as fh:
+		while True:
+			try:
+				block = pickle.load(fh)
+			except EOFError:
+				break
+			for record in block:
+				yield record
+
+
+
+def parse_lines(input_fh, delim_input, col=1, agg_col=None):
+	'''
+	Yields (key, value) for each line in input. Value is the line without the key column (or just agg_col).
+	'''
 	for line in input_fh:
 		line = line.strip()
 		if not line or line.startswith('#'):
@@ -49,19 +210,60 @@ def groupby_column(input_fh, output_fh, delim_input, delim_groups, col=1):
 		
 		try:
 			key = line_sep[col-1]
-			if key in groups_order:
-				groups[key].append(delim_input.join(line_sep[col:]))
-				
+			if agg_col is None:
+				value = delim_input.join(line_sep[col:])
 			else:
-				groups_order.append(key)
-				groups[key] = [delim_input.join(line_sep[col:])]
+				value = line_sep[agg_col-1]
 		except IndexError:
-			logging.error("[ERROR]: Problem splitting --infile into >=2 columns: %s", line)
+			logging.error("[ERROR]: Problem splitting --infile into >=%s columns: %s", 2 if agg_col is None else agg_col, line)
 			sys.exit(1)
-		
-	# Print each group
-	for key in groups_order:
-		output_fh.write(key+'\t'+delim_groups.join(groups[key])+'\n')
+		yield key, value
+
+
+
+def to_number(value):
+	try:
+		return int(value)
+	except ValueError:
+		try:
+			return float(value)
+		except ValueError:
+			logging.error("[ERROR]: Value is not a number: %s", value)
+			sys.exit(1)
+
+
+
+## Aggregations: name: (new state from first value, update state with value, format state)
+def _join_new(value):
+	return [value]
+
+def _join_update(state, value):
+	state.append(value)
+	return state
+
+def _join_format(state, delim_groups):
+	return delim_groups.join(state)
+
+def _unique_new(value):
+	return {value: None}
+
+def _unique_update(state, value):
+	state[value] = None
+	return state
+
+def _unique_format(state, delim_groups):
+	## dict keeps insertion order (python >= 3.7)
+	return delim_groups.join(state)
+
+AGGREGATIONS = {
+	'join': (_join_new, _join_update, _join_format),
+	'count': (lambda value: 1, lambda state, value: state + 1, lambda state, delim_groups: str(state)),
+	'sum': (to_number, lambda state, value: state + to_number(value), lambda state, delim_groups: str(state)),
+	'min': (to_number, lambda state, value: min(state, to_number(value)), lambda state, delim_groups: str(state)),
+	'max': (to_number, lambda state, value: max(state, to_number(value)), lambda state, delim_groups: str(state)),
+	'first': (lambda value: value, lambda state, value: state, lambda state, delim_groups: state),
+	'unique': (_unique_new, _unique_update, _unique_format),
+}
 
 
 
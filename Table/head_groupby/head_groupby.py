@@ -1,14 +1,25 @@
-#!/usr/bin/env python2
+#!/usr/bin/env python3
 DESCRIPTION = '''
 Returns the top X rows for each entry ID in column Y.
 
 NOTE:
 	- IDs in column Y do not have to be grouped/sorted together however the top X rows have to be ordered
 		i.e. most important/significant at the top to lest important/significant at the bottom. 
+	- OR use -s/--score_col to rank rows by a numeric column (e.g. bitscore; use --ascending
+	   for e.g. evalue); input does not need to be ordered. The top X rows of each ID are kept
+	   in a bounded heap (O(rows * log X) time; O(IDs * X) memory) and written once the input
+	   has been read (IDs in the order they first appear; rows in rank order; ties keep input order).
+	- Use -u/--unique to only return (and count) rows with a unique value in column -u for each ID
+	   (with -s/--score_col the best ranked row of each unique value is kept).
 '''
+import os
 import sys
+import heapq
+from operator import itemgetter
 import argparse
 import logging
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'Python'))
+from src.files import File
 
 VERSION=0.1
 
@@ -16,10 +27,13 @@ VERSION=0.1
 def main():
 	# Pass command line arguments. 
 	parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter, description=DESCRIPTION)
-	parser.add_argument('-i', '--input', metavar='data_to_filter.txt', default=sys.stdin, type=argparse.FileType('r'), required=False, help='Input file to filter (default: stdin)')
-	parser.add_argument('-o', '--output', metavar='data_filtered.txt', default=sys.stdout, type=argparse.FileType('w'), required=False, help='Output file of top -n rows (default: stdout)')
+	parser.add_argument('-i', '--input', metavar='data_to_filter.txt', default='-', type=lambda x: File(x, 'r'), required=False, help='Input [gzip/bgzip/zstd] file to filter (default: stdin)')
+	parser.add_argument('-o', '--output', metavar='data_filtered.txt', default='-', type=lambda x: File(x, 'w'), required=False, help='Output [gzip/bgzip/zstd] file of top -n rows (default: stdout)')
 	parser.add_argument('-n', '--num_rows', default=10, type=int, required=False, help='Num rows to return for each extry in --col (default: %(default)s)')
 	parser.add_argument('-c', '--col', default=1, type=int, required=False, help='Column in --input of interest (default: %(default)s)')
+	parser.add_argument('-s', '--score_col', default=None, type=int, required=False, help='Numeric column in --input to rank rows by (default: use input order)')
+	parser.add_argument('--ascending', action='store_true', required=False, help='Lower -s/--score_col values are better (e.g. evalue) (default: %(default)s)')
+	parser.add_argument('-u', '--unique', default=None, type=int, required=False, help='Column in --input with entires to check for uniqueness (default: %(default)s)')
 	parser.add_argument('--delim', default='\t', type=str, required=False, help='Delimiter for --input (default: \\t)')
 	parser.add_argument('--keep_header', action='store_true', required=False, help='Keep first line as header (default: %(default)s)')
 	parser.add_argument('--debug', action='store_true', required=False, help='Print DEBUG info (default: %(default)s)')
@@ -33,34 +47,155 @@ def main():
 	
 	logging.debug('%s', args) ## DEBUG
 	
-	# For each line in input file
-	nrows_seen = {}
-	for i, line in enumerate(args.input):
+	if args.num_rows < 1:
+		parser.error('-n/--num_rows must be >= 1')
+	
+	with args.input as input_fh, args.output as output_fh:
+		if args.score_col is None:
+			head_groupby(input_fh, output_fh, args.num_rows, args.col, args.unique, args.delim, args.keep_header)
+		else:
+			head_groupby_ranked(input_fh, output_fh, args.num_rows, args.col, args.score_col, args.ascending, args.unique, args.delim, args.keep_header)
+
+
+
+def parse_lines(input_fh, output_fh, cols, delim, keep_header):
+	'''
+	Yields (line, (values of cols)) for each line in input_fh (header is written to output_fh if keep_header).
+	Columns that are None give None.
+	'''
+	max_col = max([x for x in cols if x is not None])
+	## Missing (None) columns are taken from an extra None appended to the split line
+	get_values = itemgetter(*[-1 if x is None else x-1 for x in cols])
+	debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+	for i, line in enumerate(input_fh):
 		line = line.strip()
 		if not line or line.startswith('#'):
 			continue
 		
-		if i == 0 and args.keep_header:
-			args.output.write(line + '\n')
+		if i == 0 and keep_header:
+			output_fh.write(line + '\n')
 			continue
 		
-		line_sep = line.split(args.delim)
+		line_sep = line.split(delim, max_col)
 		try:
-			col_id = line_sep[args.col-1] 
-			logging.debug('col_id %s; line_sep %s', col_id, line_sep) ## DEBUG
-			
-			# Check if we have seen this id before (can catch cases where ids are out of order)
-			if col_id not in nrows_seen.keys():
-				nrows_seen[col_id] = 0
-			nrows_seen[col_id] += 1
-			
-			if nrows_seen[col_id] <= args.num_rows:
-				args.output.write(line + '\n')
-			
+			line_sep[max_col-1]
+			line_sep.append(None)
+			values = get_values(line_sep)
 		except IndexError:
 			logging.info("ERROR: %s", line)
-			logging.info("ERROR: -c/--col %s out of range for --infile", args.col)
+			logging.info("ERROR: -c/--col %s out of range for --infile", max_col)
+			sys.exit(1)
+		if debug:
+			logging.debug('col_id %s; line_sep %s', values[0], line_sep) ## DEBUG
+		yield line, values
+
+
+
+def head_groupby(input_fh, output_fh, num_rows, col, unique_col, delim, keep_header):
+	'''
+	Write the first num_rows rows (or rows with unique values in unique_col) of each ID in col.
+	'''
+	nrows_seen = {}
+	# Unique values seen for each ID; only kept until the ID has num_rows rows
+	unique_seen = {}
+	for line, (col_id, to_check_id) in parse_lines(input_fh, output_fh, [col, unique_col], delim, keep_header):
+		nrows = nrows_seen.get(col_id, 0)
+		if nrows >= num_rows:
+			continue
+		
+		if unique_col is not None:
+			seen = unique_seen.setdefault(col_id, set())
+			if to_check_id in seen:
+				continue
+			seen.add(to_check_id)
+			if nrows + 1 == num_rows:
+				del unique_seen[col_id]
+		
+		nrows_seen[col_id] = nrows + 1
+		output_fh.write(line + '\n')
+
+
+
+def head_groupby_ranked(input_fh, output_fh, num_rows, col, score_col, ascending, unique_col, delim, keep_header):
+	'''
+	Write the top num_rows rows (ranked by score_col) of each ID in col.
+	'''
+	groups = {} # col_id: TopRows
+	for line_number, (line, (col_id, score, to_check_id)) in enumerate(parse_lines(input_fh, output_fh, [col, score_col, unique_col], delim, keep_header)):
+		try:
+			score = float(score)
+		except ValueError:
+			logging.info("ERROR: %s", line)
+			logging.info("ERROR: -s/--score_col %s is not a number", score_col)
 			sys.exit(1)
+		
+		## Min-heap on rank; earlier lines rank higher on ties
+		rank = (-score if ascending else score, -line_number)
+		
+		top_rows = groups.get(col_id)
+		if top_rows is None:
+			top_rows = groups[col_id] = TopRows(num_rows)
+		elif to_check_id is None and len(top_rows.heap) == num_rows and rank <= top_rows.heap[0][0]:
+			continue # Not in top rows
+		top_rows.add(rank, line, to_check_id)
+	
+	for top_rows in groups.values():
+		for line in top_rows.lines():
+			output_fh.write(line + '\n')
+
+
+
+class TopRows(object):
+	'''
+	Keep the top num_rows (rank, line) pairs in a bounded min-heap.
+	If unique ids are given, only the best ranked line for each id is kept (lazy deletion
+	of replaced entries; the heap is rebuilt if it gets more than twice num_rows long).
+	'''
+	__slots__ = ('num_rows', 'heap', 'members')
+	
+	def __init__(self, num_rows):
+		self.num_rows = num_rows
+		self.heap = []
+		self.members = None
+	
+	def add(self, rank, line, unique_id=None):
+		heap = self.heap
+		if unique_id is None:
+			if len(heap) < self.num_rows:
+				heapq.heappush(heap, (rank, line))
+			elif rank > heap[0][0]:
+				heapq.heapreplace(heap, (rank, line))
+			return
+		
+		## Entries are [rank, line, unique_id]; unique_id is set to None when an entry is replaced
+		if self.members is None:
+			self.members = {}
+		members = self.members
+		current = members.get(unique_id)
+		if current is not None:
+			if rank <= current[0]:
+				return
+			current[2] = None
+		else:
+			if len(members) >= self.num_rows:
+				while heap[0][2] is None:
+					heapq.heappop(heap)
+				if rank <= heap[0][0]:
+					return
+				del members[heapq.heappop(heap)[2]]
+		entry = [rank, line, unique_id]
+		members[unique_id] = entry
+		heapq.heappush(heap, entry)
+		if len(heap) > 2 * self.num_rows:
+			self.heap = list(members.values())
+			heapq.heapify(self.heap)
+	
+	def lines(self):
+		'''
+		Lines in rank order (best first).
+		'''
+		entries = self.heap if self.members is None else [x for x in self.heap if x[2] is not None]
+		return [x[1] for x in sorted(entries, reverse=True)]
 
 
 
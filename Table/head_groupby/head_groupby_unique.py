@@ -1,4 +1,4 @@
-#!/usr/bin/env python2
+#!/usr/bin/env python3
 DESCRIPTION = '''
 Returns the top X *unique* rows for each entry ID in column Y.
 
@@ -6,10 +6,15 @@ NOTE:
 	- IDs in column Y do not have to be grouped/sorted together however the top X rows have to be ordered
 		i.e. most important/significant at the top to lest important/significant at the bottom. 
 	- Will NOT return a Y row if it has already been seen (i.e. will only return and count the top X unique Y rows)
+	- Unique rows are only tracked for IDs with < X rows returned (memory == IDs * X).
+	- Use head_groupby.py -s/--score_col -u/--unique to rank rows by a numeric column (input does not need to be ordered).
 '''
+import os
 import sys
 import argparse
 import logging
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'Python'))
+from src.files import File
 
 VERSION=0.1
 
@@ -17,8 +22,8 @@ VERSION=0.1
 def main():
 	# Pass command line arguments. 
 	parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter, description=DESCRIPTION)
-	parser.add_argument('-i', '--input', metavar='data_to_filter.txt', default=sys.stdin, type=argparse.FileType('r'), required=False, help='Input file to filter (default: stdin)')
-	parser.add_argument('-o', '--output', metavar='data_filtered.txt', default=sys.stdout, type=argparse.FileType('w'), required=False, help='Output file of top -n rows (default: stdout)')
+	parser.add_argument('-i', '--input', metavar='data_to_filter.txt', default='-', type=lambda x: File(x, 'r'), required=False, help='Input [gzip/bgzip/zstd] file to filter (default: stdin)')
+	parser.add_argument('-o', '--output', metavar='data_filtered.txt', default='-', type=lambda x: File(x, 'w'), required=False, help='Output [gzip/bgzip/zstd] file of top -n rows (default: stdout)')
 	parser.add_argument('-n', '--num_rows', default=10, type=int, required=False, help='Num rows to return for each extry in --col (default: %(default)s)')
 	parser.add_argument('-c', '--col', default=1, type=int, required=False, help='Column in --input of interest (default: %(default)s)')
 	parser.add_argument('-u', '--unique', default=2, type=int, required=False, help='Column in --input with entires to check for uniqueness (default: %(default)s)')
@@ -34,39 +39,53 @@ def main():
 		logging.getLogger().setLevel(logging.DEBUG)
 	
 	logging.debug('%s', args) ## DEBUG
+	debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+	
+	if args.num_rows < 1:
+		parser.error('-n/--num_rows must be >= 1')
 	
 	# For each line in input file
-	nrows_seen = {}
-	for i, line in enumerate(args.input):
-		line = line.strip()
-		if not line or line.startswith('#'):
-			continue
-		
-		if i == 0 and args.keep_header:
-			args.output.write(line + '\n')
-			continue
-		
-		line_sep = line.split(args.delim)
-		try:
-			col_id = line_sep[args.col-1] 
-			to_check_id = line_sep[args.unique-1]
-			logging.debug('col_id %s; line_sep %s', col_id, line_sep) ## DEBUG
+	nrows_seen = {} # col_id: set of unique ids seen (until num_rows have been written)
+	nrows_done = set() # col_ids with num_rows written
+	with args.input as input_fh, args.output as output_fh:
+		for i, line in enumerate(input_fh):
+			line = line.strip()
+			if not line or line.startswith('#'):
+				continue
 			
-			# Check if we have seen this id before (can catch cases where ids are out of order)
-			if col_id not in nrows_seen.keys():
-				nrows_seen[col_id] = []
+			if i == 0 and args.keep_header:
+				output_fh.write(line + '\n')
+				continue
 			
-			# Check if we have seen this row before. If we havent we can see if we are below threshold and can write this row if we are. 
-			if to_check_id not in nrows_seen[col_id]:
-				nrows_seen[col_id].append(to_check_id)
+			line_sep = line.split(args.delim)
+			try:
+				col_id = line_sep[args.col-1] 
+				to_check_id = line_sep[args.unique-1]
+				if debug:
+					logging.debug('col_id %s; line_sep %s', col_id, line_sep) ## DEBUG
 				
-				if len(nrows_seen[col_id]) <= args.num_rows:
-					args.output.write(line + '\n')
-			
-		except IndexError:
-			logging.info("ERROR: %s", line)
-			logging.info("ERROR: -c/--col %s out of range for --infile", args.col)
-			sys.exit(1)
+				# Skip ids which already have num_rows (unique ids are no longer tracked for these)
+				if col_id in nrows_done:
+					continue
+				
+				# Check if we have seen this id before (can catch cases where ids are out of order)
+				seen = nrows_seen.get(col_id)
+				if seen is None:
+					seen = nrows_seen[col_id] = set()
+				
+				# Check if we have seen this row before. If we havent we can write it (we are below threshold).
+				if to_check_id not in seen:
+					seen.add(to_check_id)
+					output_fh.write(line + '\n')
+					
+					if len(seen) >= args.num_rows:
+						nrows_done.add(col_id)
+						del nrows_seen[col_id]
+				
+			except IndexError:
+				logging.info("ERROR: %s", line)
+				logging.info("ERROR: -c/--col %s out of range for --infile", args.col)
+				sys.exit(1)
 
 
 
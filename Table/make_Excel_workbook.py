@@ -1,18 +1,49 @@
-#!/usr/bin/env python
+#!/usr/bin/env python3
 DESCRIPTION = '''
 Takes a set of text files and combines them into a single Excel workbook with each input file as a seperate sheet.
 
 NOTE:
 	- if title is more than 31 characters. Some applications may not be able to read the file being loaded.
+	- Tables with more rows than an Excel sheet can hold (--max_rows, including the header) are split
+	   across multiple sheets (<name>, <name>_2, <name>_3, etc.; header is repeated on each sheet).
+	- Use --streaming to write the workbook row by row (xlsxwriter constant_memory mode) instead of
+	   loading each file into a pandas DataFrame. Memory use is then fixed (not limited by table size).
+	   Input files are parsed in -t/--threads worker threads while one writer writes the sheets (in
+	   the order the files are given). All cells are written as text (types are not inferred
+	   per column like pandas does, so e.g. IDs like '001' are kept as is).
+	   Needs the xlsxwriter package (but not pandas).
 
 '''
 import sys
 import os
+import csv
+import queue
 import argparse
 import logging
 import gzip
-from pandas import ExcelWriter
-import pandas as pd
+import threading
+from concurrent.futures import ThreadPoolExecutor
+try:
+	from pandas import ExcelWriter
+	import pandas as pd
+except ImportError:
+	pd = None
+try:
+	import xlsxwriter
+except ImportError:
+	xlsxwriter = None
+
+## Max number of rows in an Excel sheet (including the header).
+EXCEL_MAX_ROWS = 1048576
+
+## Max length of an Excel sheet name.
+EXCEL_MAX_SHEET_NAME = 31
+
+## Number of rows passed from a parser thread to the writer at a time (--streaming).
+CHUNK_ROWS = 10000
+
+## Max number of chunks waiting to be written for each input file (--streaming).
+QUEUE_SIZE = 8
 
 ## Pass arguments.
 def main():
@@ -30,6 +61,18 @@ def main():
 		required=False, default='\t', type=str, 
 		help='String (default: \\t)'
 	)
+	parser.add_argument('--max_rows', 
+		required=False, default=EXCEL_MAX_ROWS, type=int, 
+		help='Max rows per sheet (including header); larger tables are split across sheets (default: %(default)s)'
+	)
+	parser.add_argument('--streaming', 
+		required=False, action='store_true', 
+		help='Write rows as they are parsed (constant memory; needs xlsxwriter) (default: %(default)s)'
+	)
+	parser.add_argument('-t', '--threads', 
+		required=False, default=4, type=int, 
+		help='Number of threads used to parse input files in --streaming mode (default: %(default)s)'
+	)
 	parser.add_argument('--debug', 
 		required=False, action='store_true', 
 		help='Print DEBUG info (default: %(default)s)'
@@ -44,21 +87,159 @@ def main():
 	
 	logging.debug('%s', args) ## DEBUG
 	
-	make_Excel_workbook(args.out, args.input, args.delim)
+	for filename in args.input:
+		if not os.path.exists(filename):
+			parser.error('The file %s does not exist!' % filename)
+	if args.max_rows < 2:
+		parser.error('--max_rows must be >= 2')
+	if args.threads < 1:
+		parser.error('-t/--threads must be >= 1')
+	
+	if args.streaming:
+		if xlsxwriter is None:
+			parser.error('--streaming needs the xlsxwriter package (pip install xlsxwriter)')
+		make_Excel_workbook_streaming(args.out, args.input, args.delim, args.max_rows, args.threads)
+	else:
+		if pd is None:
+			parser.error('needs the pandas package (pip install pandas) or use --streaming')
+		make_Excel_workbook(args.out, args.input, args.delim, args.max_rows)
 	
 
 
 
-def make_Excel_workbook(outfile, infiles, delim='\t'):
+def make_Excel_workbook(outfile, infiles, delim='\t', max_rows=EXCEL_MAX_ROWS):
 	# Examples: https://xlsxwriter.readthedocs.io/working_with_pandas.html
 	writer = ExcelWriter(outfile)
 	for filename in infiles:
 		logging.info('Loading file %s', filename) ## INFO
-		(_, f_name) = os.path.split(filename)
-		(f_short_name, _) = os.path.splitext(f_name)
+		f_short_name = get_sheet_name(filename)
 		df = pd.read_csv(filename, sep=delim)
-		df.to_excel(writer, sheet_name=f_short_name, index=False)
-	writer.save()
+		
+		# Split table across sheets if it has too many rows
+		rows_per_sheet = max_rows - 1
+		if len(df) <= rows_per_sheet:
+			df.to_excel(writer, sheet_name=f_short_name, index=False)
+			continue
+		for sheet_number, start in enumerate(range(0, len(df), rows_per_sheet), 1):
+			sheet_name = split_sheet_name(f_short_name, sheet_number) if sheet_number > 1 else f_short_name
+			logging.info('Writing rows %s-%s to sheet %s', start+1, min(start+rows_per_sheet, len(df)), sheet_name) ## INFO
+			df.iloc[start:start+rows_per_sheet].to_excel(writer, sheet_name=sheet_name, index=False)
+	writer.close()
+
+
+
+def make_Excel_workbook_streaming(outfile, infiles, delim='\t', max_rows=EXCEL_MAX_ROWS, threads=4):
+	'''
+	Write workbook row by row (xlsxwriter constant_memory mode).
+	Files are parsed in worker threads (chunks of rows are passed to the writer through a
+	bounded queue per file) and written, in order, by this (the only writer) thread.
+	'''
+	workbook = xlsxwriter.Workbook(outfile, {'constant_memory': True})
+	queues = [queue.Queue(QUEUE_SIZE) for _ in infiles]
+	stop = threading.Event()
+	try:
+		with ThreadPoolExecutor(max_workers=threads) as executor:
+			try:
+				for filename, chunk_queue in zip(infiles, queues):
+					executor.submit(parse_file, filename, delim, chunk_queue, stop)
+				for filename, chunk_queue in zip(infiles, queues):
+					logging.info('Loading file %s', filename) ## INFO
+					write_sheets(workbook, get_sheet_name(filename), chunk_queue, max_rows)
+			except BaseException:
+				## Unblock parser threads waiting on full queues
+				stop.set()
+				raise
+	finally:
+		workbook.close()
+
+
+
+def parse_file(filename, delim, chunk_queue, stop):
+	'''
+	Parse delimited file into chunks of CHUNK_ROWS rows; put each chunk (then None) on chunk_queue.
+	Any exception is put on the queue (and raised by the writer).
+	'''
+	def put(item):
+		while not stop.is_set():
+			try:
+				chunk_queue.put(item, timeout=0.1)
+				return True
+			except queue.Full:
+				pass
+		return False
+	
+	try:
+		if filename.endswith('.gz'):
+			fh = gzip.open(filename, 'rt', newline='')
+		else:
+			fh = open(filename, newline='')
+		with fh:
+			reader = csv.reader(fh, delimiter=delim)
+			chunk = []
+			for row in reader:
+				chunk.append(row)
+				if len(chunk) == CHUNK_ROWS:
+					if not put(chunk):
+						return
+					chunk = []
+			if chunk and not put(chunk):
+				return
+		put(None)
+	except Exception as e:
+		put(e)
+
+
+
+def write_sheets(workbook, f_short_name, chunk_queue, max_rows=EXCEL_MAX_ROWS):
+	'''
+	Write rows from chunk_queue (first row is the header) to one or more sheets (max_rows per sheet).
+	'''
+	header = None
+	worksheet = None
+	sheet_number = 0
+	row_number = 0
+	while True:
+		chunk = chunk_queue.get()
+		if chunk is None:
+			break
+		if isinstance(chunk, Exception):
+			raise chunk
+		for row in chunk:
+			if header is None:
+				header = row
+				continue
+			if worksheet is None or row_number == max_rows:
+				sheet_number += 1
+				worksheet = workbook.add_worksheet(split_sheet_name(f_short_name, sheet_number) if sheet_number > 1 else f_short_name)
+				worksheet.write_row(0, 0, header)
+				row_number = 1
+			worksheet.write_row(row_number, 0, row)
+			row_number += 1
+	
+	# Header only table
+	if worksheet is None:
+		worksheet = workbook.add_worksheet(f_short_name)
+		if header is not None:
+			worksheet.write_row(0, 0, header)
+	
+	if sheet_number > 1:
+		logging.info('Table split across %s sheets: %s', sheet_number, f_short_name) ## INFO
+
+
+
+def get_sheet_name(filename):
+	(_, f_name) = os.path.split(filename)
+	(f_short_name, _) = os.path.splitext(f_name)
+	return f_short_name
+
+
+
+def split_sheet_name(f_short_name, sheet_number):
+	'''
+	Name of sheet_number'th sheet of a split table (<name>_<sheet_number>; name is shortened if needed).
+	'''
+	suffix = '_%s' % sheet_number
+	return f_short_name[:EXCEL_MAX_SHEET_NAME-len(suffix)] + suffix
 
 
 
@@ -1,4 +1,4 @@
-#!/usr/bin/env python
+#!/usr/bin/env python3
 DESCRIPTION = '''
 order_columns - Takes an ORDERED list of column names (one per line) to return from input file. 
                 Columns not in input list will not be in output.
@@ -7,10 +7,19 @@ NOTE:
 	- Ignore comment ('#') and blank lines	
         - Assume first non-comment line has column headers.
 	- Uses exact string matching. Can not do regex or partial matching.
+	- OR use --by_index to give the columns to return as 1-based indexes/ranges (like 'cut -f' but the
+	   order is kept), e.g. '--by_index 3,1,5-10,20-' (20- == column 20 to the last column;
+	   10-5 == columns 10,9,8,7,6,5). All lines (including the first) are reordered.
+	- Use --split_max to only split lines as far as the last column needed (faster for wide files;
+	   can not be used with open ended ranges).
 '''
+import os
 import sys
 import argparse
 import logging
+from operator import itemgetter
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'Python'))
+from src.files import File
 
 VERSION=0.1
 
@@ -18,9 +27,11 @@ VERSION=0.1
 def main():
 	# Pass command line arguments. 
 	parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter, description=DESCRIPTION)
-	parser.add_argument('-i', '--input', metavar='data_to_filter.txt', default=sys.stdin, type=argparse.FileType('r'), required=False, help='Input file to filter (default: stdin)')
-	parser.add_argument('-o', '--output', metavar='data_filtered.txt', default=sys.stdout, type=argparse.FileType('w'), required=False, help='Output file of ordered columns (default: stdout)')
-	parser.add_argument('-f', '--file', metavar='ordered_col_names.txt', type=argparse.FileType('r'), required=True, help='Ordered column names to keep/reorder (required)')
+	parser.add_argument('-i', '--input', metavar='data_to_filter.txt', default='-', type=lambda x: File(x, 'r'), required=False, help='Input [gzip/bgzip/zstd] file to filter (default: stdin)')
+	parser.add_argument('-o', '--output', metavar='data_filtered.txt', default='-', type=lambda x: File(x, 'w'), required=False, help='Output [gzip/bgzip/zstd] file of ordered columns (default: stdout)')
+	parser.add_argument('-f', '--file', metavar='ordered_col_names.txt', type=lambda x: File(x, 'r'), required=False, help='Ordered column names to keep/reorder (required unless --by_index)')
+	parser.add_argument('--by_index', metavar='3,1,5-10', type=str, required=False, help='Ordered column indexes/ranges to keep/reorder (default: %(default)s)')
+	parser.add_argument('--split_max', action='store_true', required=False, help='Only split lines up to the last column needed (default: %(default)s)')
 	parser.add_argument('--delim', default='\t', type=str, required=False, help='Delimiter for --input (default: \\t)')
 	parser.add_argument('--debug', action='store_true', required=False, help='Print DEBUG info (default: %(default)s)')
 	args = parser.parse_args()
@@ -33,18 +44,41 @@ def main():
 	
 	logging.debug('%s', args) ## DEBUG
 	
-	ordered_col_names = load_id_list(args.file) # Load column names/ids
+	if (args.file is None) == (args.by_index is None):
+		parser.error('one of -f/--file or --by_index is required')
 	
-	# For each line in input file
+	if args.by_index is not None:
+		try:
+			index_ranges = parse_index_ranges(args.by_index)
+		except ValueError as e:
+			parser.error('--by_index %s: %s' % (args.by_index, e))
+		if args.split_max and None in [end for start, end in index_ranges]:
+			parser.error('--split_max can not be used with open ended --by_index ranges')
+		with args.input as input_fh, args.output as output_fh:
+			order_columns_by_index(input_fh, output_fh, index_ranges, args.delim, args.split_max)
+		return
+	
+	with args.file as names_fh:
+		ordered_col_names = load_id_list(names_fh) # Load column names/ids
+	
+	with args.input as input_fh, args.output as output_fh:
+		order_columns(input_fh, output_fh, ordered_col_names, args.delim, args.split_max)
+
+
+
+def order_columns(input_fh, output_fh, ordered_col_names, delim, split_max=False):
+	'''
+	Reorder all lines using the column names in the first line (header).
+	'''
 	is_first_line = True
-	for line in args.input:
+	for line in input_fh:
 		line = line.rstrip('\n')
 		if not line or line.startswith('#'):
 			continue
 		
 		if is_first_line:
 			is_first_line = False
-			col_names = line.split(args.delim)
+			col_names = line.split(delim)
 			
 			# For each ordered ID figure out its index/position in the avaliable columns
 			col_output_order = []
@@ -57,22 +91,99 @@ def main():
 			logging.debug('col_output_order: %s', col_output_order) ## DEBUG
 			
 			# Now output the column names we want in the order we want.
-			tmp_write = []
-			for i in col_output_order:
-				tmp_write.append(col_names[i])
-			args.output.write(args.delim.join(tmp_write) + '\n')
+			output_fh.write(delim.join([col_names[i] for i in col_output_order]) + '\n')
+			
+			# If line is not header line write columns in the order we established
+			project_lines(input_fh, output_fh, col_output_order, delim, split_max)
+
+
+
+def order_columns_by_index(input_fh, output_fh, index_ranges, delim, split_max=False):
+	'''
+	Reorder all lines using index ranges (from parse_index_ranges()); open ended ranges are
+	resolved using the number of columns in the first line.
+	'''
+	for line in input_fh:
+		line = line.rstrip('\n')
+		if not line or line.startswith('#'):
+			continue
+		
+		col_output_order = resolve_index_ranges(index_ranges, len(line.split(delim)))
+		logging.debug('col_output_order: %s', col_output_order) ## DEBUG
+		
+		project_lines([line], output_fh, col_output_order, delim, split_max)
+		project_lines(input_fh, output_fh, col_output_order, delim, split_max)
+
+
+
+def project_lines(input_fh, output_fh, col_output_order, delim, split_max=False):
+	'''
+	Write the columns (0-based indexes in col_output_order) of each line in the order given.
+	Each row is checked for width once (not per field) and projected with a single itemgetter.
+	'''
+	if not col_output_order:
+		logging.error("No columns selected!")
+		sys.exit(1)
+	max_index = max(col_output_order)
+	maxsplit = max_index + 1 if split_max else -1
+	get_columns = itemgetter(*col_output_order)
+	if len(col_output_order) == 1:
+		## itemgetter with 1 index returns the value (not a tuple)
+		project = get_columns
+	else:
+		project = lambda line_split: delim.join(get_columns(line_split))
+	
+	write = output_fh.write
+	for line in input_fh:
+		line = line.rstrip('\n')
+		if not line or line.startswith('#'):
 			continue
 		
-		# If line is not header line write columns in the order we established
-		line_split = line.split(args.delim)
-		tmp_write = []
-		for i in col_output_order:
-			try:
-				tmp_write.append(line_split[i])
-			except IndexError:
-				logging.error("Column index '%s' does not exist for split line: '%s'", i, line_split)
-				sys.exit(1)
-		args.output.write(args.delim.join(tmp_write) + '\n')
+		line_split = line.split(delim, maxsplit)
+		if len(line_split) <= max_index:
+			logging.error("Column index '%s' does not exist for split line: '%s'", max_index, line_split)
+			sys.exit(1)
+		write(project(line_split) + '\n')
+
+
+
+def parse_index_ranges(spec):
+	'''
+	Parse comma separated 1-based indexes/ranges (e.g. '3,1,5-10,20-') into a list of
+	0-based (start, end) pairs (end inclusive; None == last column).
+	'''
+	index_ranges = []
+	for item in spec.split(','):
+		item = item.strip()
+		if '-' in item:
+			start, end = item.split('-', 1)
+			start = int(start) if start else 1
+			end = int(end) if end else None
+		else:
+			start = end = int(item)
+		if start < 1 or (end is not None and end < 1):
+			raise ValueError('indexes must be >= 1')
+		index_ranges.append((start-1, None if end is None else end-1))
+	return index_ranges
+
+
+
+def resolve_index_ranges(index_ranges, num_cols):
+	'''
+	List of 0-based column indexes from (start, end) pairs; open ended ranges end at num_cols.
+	'''
+	col_output_order = []
+	for start, end in index_ranges:
+		if end is None:
+			## Open ended range past the last column (like 'cut -f 8-' on 6 columns) == no columns
+			if start >= num_cols:
+				continue
+			end = num_cols - 1
+		if end >= start:
+			col_output_order.extend(range(start, end+1))
+		else:
+			col_output_order.extend(range(start, end-1, -1))
+	return col_output_order
 
 
 
@@ -1,7 +1,14 @@
 
-
 ./order_columns.py -i test_data/test.txt -f test_data/test.names.txt
 
 # Should produce an error
 ./order_columns.py -i test_data/test.txt -f test_data/test.names2.txt
 
+# Same as test.names.txt
+./order_columns.py -i test_data/test.txt --by_index 4,1,2 --split_max
+
+# Columns 6 to 1, then 3 to last
+./order_columns.py -i test_data/test.txt --by_index 6-1,3-
+
+# Open ended range past the last column adds no columns (same as: cut -f 1,8-)
+./order_columns.py -i test_data/test.txt --by_index 1,8-
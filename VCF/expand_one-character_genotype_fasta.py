@@ -1,4 +1,4 @@
-#!/usr/bin/env python
+#!/usr/bin/env python3
 DESCRIPTION = '''
 Takes a fasta formated alignment with ambiguous characters (which represent the different bi-allelic SNPs)
 and converst them back into the possible non-ambiguous characters.
@@ -36,7 +36,8 @@ import os
 import argparse
 import logging
 import gzip
-from itertools import groupby
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'Python'))
+from src.fastx import fasta_iter
 
 ## Pass arguments.
 def main():
@@ -119,7 +120,7 @@ class File(object):
 		try:
 			if self.file_name.endswith(".gz"):
 				#print "Opening gzip compressed file (mode: %s): %s" % (self.mode, self.file_name) ## DEBUG
-				self.file_obj = gzip.open(self.file_name, self.mode+'b')
+				self.file_obj = gzip.open(self.file_name, self.mode+'t')
 			else:
 				#print "Opening normal file (mode: %s): %s" % (self.mode, self.file_name) ## DEBUG
 				self.file_obj = open(self.file_name, self.mode)
@@ -143,26 +144,5 @@ class File(object):
 #		self.file_obj.close()
 
 
-
-def fasta_iter(fh):
-	"""
-	Given a fasta file. yield tuples of header, sequence
-	Clears description from seq name.
-	
-	From: https://www.biostars.org/p/710/
-	Updated: 11/09/2018
-	Version: 0.2
-	"""
-	# ditch the boolean (x[0]) and just keep the header or sequence since
-	# we know they alternate.
-	faiter = (x[1] for x in groupby(fh, lambda line: line[0] == ">"))
-	for header in faiter:
-		# drop the ">" and description
-		header = header.next()[1:].strip().split(' ')[0]
-		# join all sequence lines to one.
-		seq = "".join(s.strip() for s in faiter.next())
-		yield header, seq
-
-
 if __name__ == '__main__':
 	main()